@@ -12,6 +12,9 @@ const __dirname = path.dirname(__filename);
 const MODEL_PATH = path.join(__dirname, '../../model/panic_lstm_model.h5');
 const EXTRACT_FEATURES_SCRIPT = path.join(__dirname, '../../model/extract_features.py');
 const RUN_INFERENCE_SCRIPT = path.join(__dirname, '../../model/run_inference.py');
+// Optional persistent LSTM server (model/serve_inference.py), e.g. http://127.0.0.1:8500
+const INFERENCE_SERVER_URL = process.env.INFERENCE_SERVER_URL;
+const WINDOW_SIZE = 30;
 
 // Buffer to store temporal data for LSTM (30 time steps, 2 features)
 const temporalBuffers = new Map();
@@ -44,7 +47,7 @@ export const lstmPanicDetect = async (req, res) => {
     buffer.fluxOfCount.push(features.fluxOfCount);
 
     // Keep only last 30 time steps
-    if (buffer.motionEnergy.length > 30) {
+    if (buffer.motionEnergy.length > WINDOW_SIZE) {
       buffer.motionEnergy.shift();
       buffer.fluxOfCount.shift();
     }
@@ -52,12 +55,24 @@ export const lstmPanicDetect = async (req, res) => {
     let panicDetected = false;
     let confidence = 0;
 
-    // Run LSTM inference if we have enough temporal data
-    if (buffer.motionEnergy.length >= 30) {
-      const inference = await runLSTMInference(
+    // With the inference server, only this frame's sample is sent; the server
+    // keeps the 30-step window per camera. The local buffer is the fallback.
+    let served = null;
+    let inference = null;
+    if (INFERENCE_SERVER_URL) {
+      served = await pushSampleToServer(camera_id, features);
+      if (served && served.samples >= WINDOW_SIZE) {
+        inference = served;
+      }
+    }
+    if (!served && buffer.motionEnergy.length >= WINDOW_SIZE) {
+      inference = await runLSTMInferenceProcess(
         buffer.motionEnergy,
         buffer.fluxOfCount
       );
+    }
+
+    if (inference) {
       panicDetected = inference.panic_detected;
       confidence = inference.confidence;
     } else {
@@ -215,8 +230,41 @@ const extractFeaturesFromFrame = async (frameBuffer) => {
   });
 }
 
-// Run LSTM model inference
-const runLSTMInference = async (motionEnergy, fluxOfCount) => {
+// POST to the inference server; null if it is unreachable or rejects the request
+const postToServer = async (body) => {
+  try {
+    const response = await fetch(`${INFERENCE_SERVER_URL}/predict`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(body),
+    });
+
+    if (response.ok) {
+      const data = await response.json();
+      // A micro-batched server reports a bad request in the body, not the status
+      if (!data.error) {
+        return data;
+      }
+      console.error(`Inference server rejected the request (${data.error}), falling back to run_inference.py`);
+    } else {
+      console.error(`Inference server returned ${response.status}, falling back to run_inference.py`);
+    }
+  } catch (e) {
+    console.error('Inference server unreachable, falling back to run_inference.py:', e.message);
+  }
+  return null;
+};
+
+// Push one (motion energy, flux of count) sample into the server's buffer for
+// this camera. The confidence is only meaningful once `samples` reaches 30.
+const pushSampleToServer = (cameraId, features) => postToServer({
+  camera_id: String(cameraId),
+  motion_energy: features.motionEnergy,
+  flux_of_count: features.fluxOfCount,
+});
+
+// Run LSTM model inference in a one-shot Python process
+const runLSTMInferenceProcess = (motionEnergy, fluxOfCount) => {
   return new Promise((resolve, reject) => {
     const pythonProcess = spawn('python', [
       RUN_INFERENCE_SCRIPT,
@@ -327,6 +375,9 @@ export const clearBuffer = async (req, res) => {
   try {
     const { camera_id } = req.params;
     temporalBuffers.delete(camera_id);
+    if (INFERENCE_SERVER_URL) {
+      await postToServer({ camera_id: String(camera_id), reset: true });
+    }
     res.json({ message: `Buffer cleared for camera ${camera_id}` });
   } catch (error) {
     res.status(500).json({ message: 'Error clearing buffer', error: error.message });
@@ -0,0 +1,166 @@
+import sys
+import json
+import time
+import argparse
+from collections import defaultdict
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from panic_lstm import MODEL_PATH, WINDOW_SIZE, THRESHOLD, load_panic_model
+
+# Retrospective panic scoring: replay hours of recorded (motion_energy,
+# flux_of_count) samples through the panic LSTM in one process, instead of
+# one run_inference.py process (and one model load) per 30-step window.
+#
+# Every window of the series is a strided view over the same array
+# (sliding_window_view, no copy). --stride picks every k-th window. Windows
+# are normalized per window and per feature, exactly like
+# panic_lstm.build_window, one batch at a time, so memory stays at
+# BATCH_SIZE windows however long the recording is. The result is a
+# confidence timeline stamped with each window's last sample.
+#
+# The inputs must be the LSTM's own features (features.py motion_energy and
+# flux_of_count), not the pipeline's optical-flow motion energy and
+# track-count flux that share their names. In a detection store they are the
+# lstm_* columns; in JSONL results the "features" object. Samples without
+# them split the series, and windows never span the gap; an input with none
+# at all is rejected.
+#
+#   python backfill.py --store detections_store --camera cam0 --output cam0_panic.jsonl
+#   python backfill.py --input results.jsonl --stride 5
+
+# --- CONFIGURATION ---
+STRIDE = 1          # Score every window (k = every k-th window)
+BATCH_SIZE = 4096   # Windows per predict call
+
+def feature_windows(series, stride=STRIDE):
+    """(T, F) samples -> (W, WINDOW_SIZE, F) read-only view of every stride-th window"""
+    series = np.asarray(series, dtype=np.float32)
+    if len(series) < WINDOW_SIZE:
+        return np.empty((0, WINDOW_SIZE, series.shape[1]), dtype=np.float32)
+    # sliding_window_view puts the window axis last: (W, F, WINDOW_SIZE)
+    return sliding_window_view(series, WINDOW_SIZE, axis=0)[::stride].transpose(0, 2, 1)
+
+def normalize_windows(windows):
+    """Per-window, per-feature zero mean / unit variance (panic_lstm.normalize, batched)"""
+    mean = windows.mean(axis=1, keepdims=True)
+    std = windows.std(axis=1, keepdims=True)
+    return (windows - mean) / (std + 1e-7)
+
+def score_series(model, series, stride=STRIDE, batch_size=BATCH_SIZE):
+    """Panic confidence of every stride-th window of a (T, F) series, in batches"""
+    windows = feature_windows(series, stride)
+    confidences = np.empty(len(windows), dtype=np.float32)
+    for start in range(0, len(windows), batch_size):
+        batch = normalize_windows(windows[start:start + batch_size])
+        confidences[start:start + len(batch)] = np.asarray(model.predict_on_batch(batch))[:, 0]
+    return confidences
+
+def window_end_times(ts, stride=STRIDE):
+    """Timestamp of the last sample of each scored window"""
+    return np.asarray(ts)[WINDOW_SIZE - 1::stride]
+
+def valid_runs(features):
+    """(start, stop) of the maximal runs of samples with every feature present (not NaN)"""
+    valid = np.concatenate(([False], np.all(np.isfinite(features), axis=1), [False]))
+    edges = np.flatnonzero(np.diff(valid.astype(np.int8)))
+    return list(zip(edges[::2], edges[1::2]))
+
+# --- INPUTS ---
+def load_store(root, camera, start=None, end=None):
+    """{camera: (ts, (T, 2) features)} of the LSTM feature columns of a detection_store.py store"""
+    from detection_store import DetectionStore
+    data = DetectionStore(root).query(camera, start, end, ("ts", "lstm_motion_energy", "lstm_flux_of_count"))
+    return {camera: (data["ts"], np.stack([data["lstm_motion_energy"], data["lstm_flux_of_count"]], axis=1))}
+
+def load_jsonl(path, camera=None):
+    """{camera: (ts, (T, 2) features)} from JSONL lines with a "features" object.
+
+    Works on the results of process_frame.py --stream, unified_analyzer.py
+    --results and multi_camera.py --results (without --no-features). Lines
+    without features become NaN samples. Lines without a camera_id count as
+    one camera; without ts, the sample index stands in for time.
+    """
+    rows = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            cam = str(record.get("camera_id", "default"))
+            if camera is not None and cam != camera:
+                continue
+            features = record.get("features") or {}
+            rows[cam].append((record.get("ts", record.get("time", len(rows[cam]))),
+                              features.get("motion_energy", np.nan), features.get("flux_of_count", np.nan)))
+    series = {}
+    for cam, values in rows.items():
+        values = np.asarray(values, dtype=np.float64)
+        series[cam] = (values[:, 0], values[:, 1:].astype(np.float32))
+    return series
+
+def check_features(series):
+    """Raise unless every camera has LSTM feature samples (the pipeline's flow / count proxies don't qualify)"""
+    for camera, (ts, features) in series.items():
+        if not np.isfinite(features).all(axis=1).any():
+            raise ValueError(f"{camera}: no LSTM features (features.py motion_energy / flux_of_count) in the input; "
+                             "record them with unified_analyzer.py / multi_camera.py (without --no-features) "
+                             "or process_frame.py --stream")
+    if not series:
+        raise ValueError("No samples in the input")
+
+def main():
+    parser = argparse.ArgumentParser(description="Score recorded feature histories with the panic LSTM")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--store", help="detection_store.py root to read motion_energy / flux from")
+    source.add_argument("--input", help="JSONL file with motion_energy and flux_of_count per line")
+    parser.add_argument("--camera", help="Camera id (required with --store)")
+    parser.add_argument("--start", type=float, help="Epoch seconds (inclusive, --store only)")
+    parser.add_argument("--end", type=float, help="Epoch seconds (exclusive, --store only)")
+    parser.add_argument("--stride", type=int, default=STRIDE, help="Score every k-th window")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--runtime", choices=("auto", "numpy", "keras"), default="auto")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--output", help="JSONL timeline (default: stdout)")
+    args = parser.parse_args()
+    if args.store and not args.camera:
+        parser.error("--camera is required with --store")
+
+    series = load_store(args.store, args.camera, args.start, args.end) if args.store else load_jsonl(args.input, args.camera)
+    try:
+        check_features(series)
+    except ValueError as e:
+        parser.error(str(e))
+    start = time.perf_counter()
+    model = load_panic_model(args.model, args.runtime)
+    load_s = time.perf_counter() - start
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    total_windows, score_s = 0, 0.0
+    try:
+        for camera, (ts, features) in series.items():
+            runs = valid_runs(features)
+            camera_confidences = []
+            for lo, hi in runs:
+                start = time.perf_counter()
+                confidences = score_series(model, features[lo:hi], args.stride, args.batch_size)
+                score_s += time.perf_counter() - start
+                camera_confidences.append(confidences)
+                for t, confidence in zip(window_end_times(ts[lo:hi], args.stride), confidences):
+                    out.write(json.dumps({"camera_id": camera, "ts": float(t), "confidence": float(confidence),
+                                          "panic_detected": bool(confidence > args.threshold)}) + "\n")
+            confidences = np.concatenate(camera_confidences) if camera_confidences else np.empty(0)
+            total_windows += len(confidences)
+            peak = float(confidences.max()) if len(confidences) else 0.0
+            used = sum(hi - lo for lo, hi in runs)
+            print(f"{camera}: {used}/{len(features)} samples with features in {len(runs)} run(s), "
+                  f"{len(confidences)} windows, {int(np.sum(confidences > args.threshold))} above threshold, "
+                  f"peak {peak:.3f}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    rate = total_windows / score_s if score_s > 0 else 0.0
+    print(f"Model load {load_s:.2f} s | {total_windows} windows in {score_s:.2f} s ({rate:.0f} windows/s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
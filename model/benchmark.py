@@ -0,0 +1,357 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import subprocess
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import cv2
+
+# Reproducible offline benchmark of the analysis pipelines.
+#
+# A deterministic synthetic crowd video (moving blobs over a textured
+# background, fixed seed) is generated once per parameter set, then every
+# stage runs headless in its own fresh process so that startup time (imports
+# + model load) and peak RSS are measured in isolation. Results go to a JSON
+# file; --compare checks them against a saved baseline.
+#
+#   python benchmark.py --preset 720p --output bench.json
+#   python benchmark.py --preset 720p --compare bench.json   # after a change
+
+# --- CONFIGURATION ---
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+VIDEO_DIR = os.path.join(MODEL_DIR, "bench_videos")
+RESULTS_PATH = os.path.join(MODEL_DIR, "bench_results.json")
+YOLO_WEIGHTS = os.path.join(MODEL_DIR, "yolov10m.pt")
+CSRNET_WEIGHTS = ""     # Untrained CSRNet has the same cost; set to time the real checkpoint
+RESOLUTIONS = {"360p": (640, 360), "576p": (1024, 576), "720p": (1280, 720), "1080p": (1920, 1080)}
+PRESET = "720p"
+PEOPLE = 60             # Blobs in the scene
+SPEED = 3.0             # Mean blob speed in pixels per frame at 720p (scaled with resolution)
+FRAMES = 150
+FPS = 25
+SEED = 0
+WARMUP = 5              # Frames run before timing starts
+RUN_INFERENCE_CALLS = 5 # run_inference.py spawns a process per call, so only a few are timed
+TOLERANCE = 0.10        # Relative slowdown flagged as a regression by --compare
+# Absolute changes below these are treated as noise, whatever the relative change
+NOISE_FLOOR = {"fps": 0.0, "p95_ms": 0.5, "startup_s": 0.1, "peak_rss_mb": 10.0}
+
+STAGES = OrderedDict()  # name -> setup(options) -> fn(frame)
+
+def register_stage(name):
+    """Decorator adding a benchmark stage; setup returns the per-frame callable"""
+    def wrap(setup):
+        STAGES[name] = setup
+        return setup
+    return wrap
+
+# --- 1. SYNTHETIC VIDEO ---
+def synthetic_video_path(size, people, speed, frames, fps, seed, video_dir=VIDEO_DIR):
+    name = f"crowd_{size[0]}x{size[1]}_p{people}_s{speed:g}_f{frames}_r{fps}_seed{seed}.avi"
+    return os.path.join(video_dir, name)
+
+def make_synthetic_video(path, size, people=PEOPLE, speed=SPEED, frames=FRAMES, fps=FPS, seed=SEED):
+    """Write a deterministic crowd-like video: the same arguments always give the same frames"""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    scale = h / 720.0
+
+    # Smooth texture so flow and edge features have something to lock onto
+    coarse = rng.integers(70, 150, size=(max(h // 16, 2), max(w // 16, 2), 3), dtype=np.uint8)
+    background = cv2.GaussianBlur(cv2.resize(coarse, (w, h), interpolation=cv2.INTER_CUBIC), (0, 0), 3)
+
+    pos = rng.uniform((0, 0), (w, h), size=(people, 2))
+    angle = rng.uniform(0, 2 * np.pi, size=people)
+    vel = np.stack([np.cos(angle), np.sin(angle)], axis=1) * rng.uniform(0.5, 1.5, size=(people, 1)) * speed * scale
+    radius = (rng.uniform(8, 14, size=people) * scale).clip(2)
+    colors = rng.integers(0, 255, size=(people, 3))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (w, h))
+    for _ in range(frames):
+        frame = background.copy()
+        for (x, y), r, c in zip(pos.astype(int), radius.astype(int), colors.tolist()):
+            cv2.ellipse(frame, (x, y), (r, int(r * 1.8)), 0, 0, 360, c, -1)   # body
+            cv2.circle(frame, (x, y - int(r * 2.4)), max(r // 2, 1), c, -1)    # head
+        out.write(frame)
+
+        pos += vel + rng.normal(0, 0.3 * scale, size=pos.shape)
+        # Bounce off the borders so the density stays constant
+        for axis, limit in ((0, w), (1, h)):
+            outside = (pos[:, axis] < 0) | (pos[:, axis] >= limit)
+            vel[outside, axis] *= -1
+            pos[:, axis] = pos[:, axis].clip(0, limit - 1)
+    out.release()
+    return path
+
+def ensure_video(size, people, speed, frames, fps, seed, video_dir=VIDEO_DIR):
+    path = synthetic_video_path(size, people, speed, frames, fps, seed, video_dir)
+    if not os.path.exists(path):
+        print(f"Generating {os.path.basename(path)}...")
+        make_synthetic_video(path, size, people, speed, frames, fps, seed)
+    return path
+
+# --- 2. STAGES ---
+@register_stage("decode")
+def setup_decode(options):
+    return None  # Only cap.read() is timed
+
+@register_stage("features")
+def setup_features(options):
+    from features import FeatureExtractor
+    return FeatureExtractor().extract
+
+@register_stage("keyframe")
+def setup_keyframe(options):
+    from keyframe import KeyframeScheduler
+    return KeyframeScheduler().should_run
+
+@register_stage("flow")
+def setup_flow(options):
+    # Resize + gray + shared Farneback flow, no models
+    from unified_analyzer import UnifiedAnalyzer
+    return UnifiedAnalyzer().analyze
+
+@register_stage("tracker")
+def setup_tracker(options):
+    from run_sahi import CrowdTracker
+    return CrowdTracker(model_path=options["yolo_weights"], frame_rate=options["fps"]).process_frame
+
+@register_stage("tracker_sliced")
+def setup_tracker_sliced(options):
+    from run_sahi import CrowdTracker
+    return CrowdTracker(sliced=True, model_path=options["yolo_weights"], frame_rate=options["fps"]).process_frame
+
+@register_stage("density")
+def setup_density(options):
+    from heatmap import CrowdAnalyzer
+    from unified_analyzer import PROCESS_SIZE
+    analyzer = CrowdAnalyzer(options["csrnet_weights"], backend=options["backend"])
+    return lambda frame: analyzer.analyze_frame(cv2.resize(frame, PROCESS_SIZE))
+
+@register_stage("unified")
+def setup_unified(options):
+    from run_sahi import CrowdTracker
+    from heatmap import CrowdAnalyzer
+    from features import FeatureExtractor
+    from unified_analyzer import UnifiedAnalyzer
+    tracker = CrowdTracker(model_path=options["yolo_weights"], frame_rate=options["fps"])
+    analyzer = CrowdAnalyzer(options["csrnet_weights"], backend=options["backend"])
+    return UnifiedAnalyzer(tracker, analyzer, FeatureExtractor()).analyze
+
+def setup_lstm_runtime(runtime):
+    # Scoring one 30-step window in a loaded model (serve_inference / process_frame path)
+    from panic_lstm import WINDOW_SIZE, NUM_FEATURES, load_panic_model
+    model = load_panic_model(runtime=runtime)
+    window = np.random.default_rng(SEED).random((1, WINDOW_SIZE, NUM_FEATURES), dtype=np.float32)
+    return lambda frame: model.predict_on_batch(window)
+
+@register_stage("lstm")
+def setup_lstm(options):
+    return setup_lstm_runtime("keras")
+
+@register_stage("lstm_numpy")
+def setup_lstm_numpy(options):
+    # Needs `python lstm_runtime.py export` first
+    return setup_lstm_runtime("numpy")
+
+@register_stage("run_inference")
+def setup_run_inference(options):
+    # One process per call, as the backend's spawn fallback does
+    from panic_lstm import WINDOW_SIZE
+    rng = np.random.default_rng(SEED)
+    payload = json.dumps({"motion_energy": rng.random(WINDOW_SIZE).tolist(),
+                          "flux_of_count": rng.random(WINDOW_SIZE).tolist()})
+    script = os.path.join(MODEL_DIR, "run_inference.py")
+    def run(frame):
+        subprocess.run([sys.executable, script], input=payload, text=True, capture_output=True, check=True)
+    run.max_frames = RUN_INFERENCE_CALLS
+    return run
+
+# --- 3. RUNNER ---
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children (ru_maxrss is KiB on Linux)"""
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024  # macOS reports bytes
+    return max(self_kb, child_kb) / divisor
+
+def summarize(latencies_s):
+    ms = np.asarray(latencies_s) * 1000.0
+    return {
+        "frames": int(len(ms)),
+        "fps": float(1000.0 / ms.mean()) if len(ms) else 0.0,
+        "mean_ms": float(ms.mean()) if len(ms) else 0.0,
+        "p50_ms": float(np.percentile(ms, 50)) if len(ms) else 0.0,
+        "p95_ms": float(np.percentile(ms, 95)) if len(ms) else 0.0,
+        "p99_ms": float(np.percentile(ms, 99)) if len(ms) else 0.0,
+    }
+
+def run_stage(task):
+    """Child process: set up one stage, run it over the video, return its metrics"""
+    name, video, options = task["stage"], task["video"], task["options"]
+    cv2.setRNGSeed(SEED)
+    np.random.seed(SEED)
+
+    start = time.perf_counter()
+    try:
+        fn = STAGES[name](options)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    startup_s = time.perf_counter() - start
+
+    max_frames = getattr(fn, "max_frames", None)
+    cap = cv2.VideoCapture(video)
+    latencies = []
+    index = 0
+    try:
+        while max_frames is None or len(latencies) < max_frames:
+            t0 = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if fn is not None:
+                t0 = time.perf_counter()
+                fn(frame)
+            elapsed = time.perf_counter() - t0
+            if index >= options["warmup"] or max_frames is not None:
+                latencies.append(elapsed)
+            index += 1
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}", "startup_s": startup_s}
+    finally:
+        cap.release()
+
+    metrics = summarize(latencies)
+    metrics["startup_s"] = startup_s
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+def environment():
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    try:
+        info["git_commit"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=MODEL_DIR,
+                                            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+def run_benchmark(stages, video, options):
+    """Run each stage in its own fresh process (spawn), one at a time"""
+    ctx = mp.get_context("spawn")
+    results = OrderedDict()
+    for name in stages:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            metrics = pool.submit(run_stage, {"stage": name, "video": video, "options": options}).result()
+        results[name] = metrics
+        print(format_row(name, metrics))
+    return results
+
+def format_row(name, m):
+    if "error" in m:
+        return f"{name:15s} error: {m['error']}"
+    return (f"{name:15s} {m['fps']:8.1f} fps | p50 {m['p50_ms']:7.2f} | p95 {m['p95_ms']:7.2f} | "
+            f"p99 {m['p99_ms']:7.2f} ms | startup {m['startup_s']:6.2f} s | peak RSS {m['peak_rss_mb']:7.1f} MB")
+
+# --- 4. BASELINE COMPARISON ---
+def compare(baseline, current, tolerance=TOLERANCE):
+    """Per-stage relative changes; a stage regresses if fps drops or p95 / startup / RSS grow beyond tolerance"""
+    if baseline.get("video") != current.get("video"):
+        print("⚠️ WARNING: baseline was recorded with different video parameters")
+    report = OrderedDict()
+    for name, cur in current["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None or "error" in base or "error" in cur:
+            continue
+        delta = {k: abs(cur[k] - base[k]) for k in NOISE_FLOOR}
+        change = {
+            "fps": cur["fps"] / base["fps"] - 1 if base["fps"] else 0.0,
+            "p95_ms": cur["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0,
+            "startup_s": cur["startup_s"] / base["startup_s"] - 1 if base["startup_s"] else 0.0,
+            "peak_rss_mb": cur["peak_rss_mb"] / base["peak_rss_mb"] - 1 if base["peak_rss_mb"] else 0.0,
+        }
+        regressed = [k for k, v in change.items()
+                     if (-v if k == "fps" else v) > tolerance and delta[k] > NOISE_FLOOR[k]]
+        report[name] = {"change": change, "regressed": regressed}
+    return report
+
+def print_comparison(report):
+    for name, row in report.items():
+        c = row["change"]
+        flag = "REGRESSION " + ",".join(row["regressed"]) if row["regressed"] else "ok"
+        print(f"{name:15s} fps {c['fps']:+7.1%} | p95 {c['p95_ms']:+7.1%} | startup {c['startup_s']:+7.1%} | "
+              f"RSS {c['peak_rss_mb']:+7.1%} | {flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline CPU benchmark of the analysis pipelines on synthetic crowd video")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--preset", default=PRESET, choices=list(RESOLUTIONS))
+    parser.add_argument("--people", type=int, default=PEOPLE)
+    parser.add_argument("--speed", type=float, default=SPEED)
+    parser.add_argument("--frames", type=int, default=FRAMES)
+    parser.add_argument("--fps", type=int, default=FPS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--warmup", type=int, default=WARMUP)
+    parser.add_argument("--video-dir", default=VIDEO_DIR)
+    parser.add_argument("--yolo-weights", default=YOLO_WEIGHTS)
+    parser.add_argument("--csrnet-weights", default=CSRNET_WEIGHTS)
+    parser.add_argument("--backend", default="eager", help="CSRNet backend (see csrnet_backend.BACKENDS)")
+    parser.add_argument("--output", default=RESULTS_PATH, help="Where to write the results JSON")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--load", help="Compare this saved results file instead of running the stages")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--allow-gpu", action="store_true", help="Do not hide CUDA devices from the stages")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        # Read first: --output may point at the baseline file
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    if args.load:
+        with open(args.load) as f:
+            results = json.load(f)
+    else:
+        if not args.allow_gpu:
+            os.environ["CUDA_VISIBLE_DEVICES"] = ""  # Inherited by the spawned stage processes
+
+        size = RESOLUTIONS[args.preset]
+        video = ensure_video(size, args.people, args.speed, args.frames, args.fps, args.seed, args.video_dir)
+        options = {"warmup": args.warmup, "fps": args.fps, "yolo_weights": args.yolo_weights,
+                   "csrnet_weights": args.csrnet_weights, "backend": args.backend}
+        print(f"Benchmarking {len(args.stages)} stages on {os.path.basename(video)}")
+
+        results = {
+            "environment": environment(),
+            "video": {"preset": args.preset, "size": list(size), "people": args.people, "speed": args.speed,
+                      "frames": args.frames, "fps": args.fps, "seed": args.seed, "warmup": args.warmup},
+            "options": {k: v for k, v in options.items() if k != "warmup"},
+            "stages": run_benchmark(args.stages, video, options),
+        }
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    if baseline is not None:
+        report = compare(baseline, results, args.tolerance)
+        print_comparison(report)
+        if any(row["regressed"] for row in report.values()):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
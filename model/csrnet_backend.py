@@ -0,0 +1,204 @@
+import os
+import copy
+import time
+import argparse
+import tempfile
+import numpy as np
+import cv2
+import torch
+import torch.nn as nn
+
+# Batched CSRNet inference with optimized CPU execution paths.
+#
+#   eager          plain PyTorch (reference)
+#   channels_last  NHWC memory layout, faster oneDNN convolutions on most CPUs
+#   traced         TorchScript trace + freeze (constant folding, fused conv+relu)
+#   bf16           bfloat16 autocast (fast on CPUs with AVX512-BF16 / AMX)
+#   onnx           exported ONNX graph run by onnxruntime's CPU provider
+#   onnx_int8      same graph with dynamically quantized int8 weights
+#
+# Every backend takes raw uint8 BGR frames: BGR->RGB, /255 and ImageNet
+# normalization are folded into the graph, so the host only stacks frames.
+
+# --- CONFIGURATION ---
+DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+BACKENDS = ("eager", "channels_last", "traced", "bf16", "onnx", "onnx_int8")
+ONNX_OPSET = 17
+COUNT_TOLERANCE = 0.02  # Max relative count error vs eager accepted by verify_backends
+
+class NormalizedCSRNet(nn.Module):
+    """Wraps CSRNet so it accepts (N, H, W, 3) uint8 BGR batches"""
+    def __init__(self, model, channels_last=False):
+        super().__init__()
+        self.model = model
+        self.channels_last = channels_last
+        # (x / 255 - mean) / std == (x - 255 * mean) / (255 * std)
+        self.register_buffer("mean", torch.tensor(MEAN).view(1, 3, 1, 1) * 255.0)
+        self.register_buffer("std", torch.tensor(STD).view(1, 3, 1, 1) * 255.0)
+
+    def forward(self, frames):
+        x = frames.permute(0, 3, 1, 2).flip(1).float()  # NHWC BGR -> NCHW RGB
+        x = (x - self.mean) / self.std
+        x = x.contiguous(memory_format=torch.channels_last if self.channels_last else torch.contiguous_format)
+        return self.model(x)
+
+def legacy_preprocess(frame):
+    """Float64 NumPy normalization used by the original CrowdAnalyzer.analyze_frame"""
+    img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    img = img.astype(np.float32) / 255.0
+    img = (img - [0.485, 0.456, 0.406]) / [0.229, 0.224, 0.225]
+    return torch.from_numpy(img).permute(2, 0, 1).unsqueeze(0).float()
+
+def _tmp_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}.tmp{ext}"
+
+class CSRNetBackend:
+    """predict(frames) -> (N, h, w) float32 density maps for a batch of BGR frames.
+
+    Traced and ONNX graphs are built lazily from the first batch.
+    """
+    def __init__(self, model, kind="eager", device=DEVICE, onnx_path=None):
+        if kind not in BACKENDS:
+            raise ValueError(f"Unknown CSRNet backend '{kind}', expected one of {BACKENDS}")
+        if kind.startswith("onnx") or kind in ("traced", "bf16"):
+            device = 'cpu'
+        self.kind = kind
+        self.device = device
+        self.onnx_path = onnx_path
+        if kind != "eager":
+            # Layout / device changes must not leak into the caller's model
+            model = copy.deepcopy(model)
+        self.module = NormalizedCSRNet(model, channels_last=(kind == "channels_last")).to(device).eval()
+        if kind == "channels_last":
+            self.module = self.module.to(memory_format=torch.channels_last)
+        self.runner = None
+
+    def _build(self, batch):
+        if self.kind in ("eager", "channels_last"):
+            return self.module
+        if self.kind == "bf16":
+            def run(x):
+                with torch.autocast("cpu", dtype=torch.bfloat16):
+                    return self.module(x).float()
+            return run
+        if self.kind == "traced":
+            with torch.no_grad():
+                traced = torch.jit.trace(self.module, batch)
+            return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        return self._build_onnx(batch)
+
+    def _build_onnx(self, batch):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnx backends need `pip install onnx onnxruntime`") from e
+
+        if self.onnx_path:
+            return self._onnx_session(ort, batch, self.onnx_path)
+        # Without an explicit path, export fresh so a stale graph from other weights is never reused.
+        # The session holds the graph in memory, so the files are removed once it is built.
+        with tempfile.TemporaryDirectory(prefix="csrnet_") as tmp:
+            return self._onnx_session(ort, batch, os.path.join(tmp, "csrnet.onnx"))
+
+    def _onnx_session(self, ort, batch, path):
+        # Written under a per-process name and renamed into place, so segment
+        # workers sharing one --onnx-path never load a half-written graph
+        if not os.path.exists(path):
+            tmp = _tmp_path(path)
+            torch.onnx.export(
+                self.module, (batch,), tmp,
+                input_names=["frames"], output_names=["density"],
+                dynamic_axes={"frames": {0: "batch", 1: "height", 2: "width"},
+                              "density": {0: "batch", 2: "height", 3: "width"}},
+                opset_version=ONNX_OPSET,
+                dynamo=False,
+            )
+            os.replace(tmp, path)
+        if self.kind == "onnx_int8":
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantized = os.path.splitext(path)[0] + ".int8.onnx"
+            if not os.path.exists(quantized):
+                tmp = _tmp_path(quantized)
+                quantize_dynamic(path, tmp, weight_type=QuantType.QInt8)
+                os.replace(tmp, quantized)
+            path = quantized
+
+        session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        return lambda x: torch.from_numpy(session.run(None, {"frames": x.numpy()})[0])
+
+    def predict(self, frames):
+        batch = torch.from_numpy(np.ascontiguousarray(np.stack(frames) if isinstance(frames, list) else frames))
+        batch = batch.to(self.device)
+        if self.runner is None:
+            self.runner = self._build(batch)
+        with torch.no_grad():
+            density = self.runner(batch)
+        return density[:, 0].cpu().numpy().astype(np.float32, copy=False)
+
+def verify_backends(model, frames, kinds=BACKENDS, tolerance=COUNT_TOLERANCE):
+    """Compare every backend against the original eager path on the same frames.
+
+    Returns {kind: {max_abs_diff, max_count_rel_err, ms_per_frame, ok}}; counts
+    feed the panic score, so a backend is only ok within `tolerance` of eager.
+    """
+    # A CPU copy: the caller's model keeps its device and train/eval mode
+    model = copy.deepcopy(model).to('cpu').eval()
+    with torch.no_grad():
+        reference = np.stack([model(legacy_preprocess(f))[0, 0].numpy() for f in frames])
+    ref_counts = reference.sum(axis=(1, 2))
+
+    report = {}
+    for kind in kinds:
+        backend = CSRNetBackend(model, kind, device='cpu')
+        try:
+            backend.predict(frames[:1])  # build / warm up outside the timing
+        except ImportError as e:
+            report[kind] = {"skipped": str(e)}
+            continue
+        start = time.perf_counter()
+        density = backend.predict(frames)
+        elapsed = time.perf_counter() - start
+
+        counts = density.sum(axis=(1, 2))
+        rel_err = np.abs(counts - ref_counts) / np.maximum(np.abs(ref_counts), 1.0)
+        report[kind] = {
+            "max_abs_diff": float(np.abs(density - reference).max()),
+            "max_count_rel_err": float(rel_err.max()),
+            "ms_per_frame": 1000.0 * elapsed / len(frames),
+            "ok": bool(rel_err.max() <= tolerance),
+        }
+    return report
+
+def main():
+    from heatmap import CrowdAnalyzer
+
+    parser = argparse.ArgumentParser(description="Check CSRNet backends against eager output")
+    parser.add_argument("video")
+    parser.add_argument("--weights", required=True)
+    parser.add_argument("--frames", type=int, default=8)
+    parser.add_argument("--size", type=int, nargs=2, default=(1024, 576), metavar=("W", "H"))
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret: break
+        frames.append(cv2.resize(frame, tuple(args.size)))
+    cap.release()
+
+    analyzer = CrowdAnalyzer(args.weights)
+    for kind, row in verify_backends(analyzer.model, frames, args.backends).items():
+        if "skipped" in row:
+            print(f"{kind:14s} skipped: {row['skipped']}")
+            continue
+        flag = "OK " if row["ok"] else "BAD"
+        print(f"{kind:14s} {flag} {row['ms_per_frame']:8.1f} ms/frame | "
+              f"count err {row['max_count_rel_err']:.4%} | max |diff| {row['max_abs_diff']:.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import cv2
+
+# Rolling cumulative crowd-density heatmaps per camera, so "where has the crowd
+# been densest" is a lookup instead of a re-run of CSRNet over recorded video.
+#
+# Each window (last minute, last 10 minutes, whole event) keeps a ring of
+# time buckets with summed density maps plus their running total. A frame
+# adds its map to the current bucket and to the total, which costs O(map
+# size). When a bucket expires it is zeroed and the total is re-summed from
+# the ring, so float drift cannot build up. Longer windows are kept
+# sum-pooled (downsampled) and, with a root directory, live in .npy memmaps.
+# The dashboard, or any other process, can read them via read_heatmap()
+# without touching the analyzer.
+#
+#   <root>/<camera>/<window>.total.npy    summed density (memmap)
+#   <root>/<camera>/<window>.buckets.npy  per-bucket sums (memmap)
+#   <root>/<camera>/<window>.json         frames, bucket counts, current bucket, factor
+
+# --- CONFIGURATION ---
+WINDOWS = (          # name, seconds (None = whole event), downsample factor
+    ("1m", 60.0, 1),
+    ("10m", 600.0, 2),
+    ("event", None, 4),
+)
+BUCKETS = 12         # Buckets per window: the window slides in steps of seconds / BUCKETS
+FLUSH_SECONDS = 5.0  # How often memmaps and metadata are synced to disk
+HOTSPOTS = 5
+
+def downsample_sum(density, factor):
+    """Sum-pool by factor (padding the edges) so the total count is preserved"""
+    if factor == 1:
+        return density
+    h, w = density.shape
+    padded = np.pad(density, ((0, -h % factor), (0, -w % factor)))
+    return padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor).sum(axis=(1, 3))
+
+def _array(path, shape):
+    """Zeroed float32 array, memory-mapped at path if given (reused if the shape matches)"""
+    if path is None:
+        return np.zeros(shape, dtype=np.float32)
+    if os.path.exists(path):
+        existing = np.lib.format.open_memmap(path, mode="r+")
+        if existing.shape == shape and existing.dtype == np.float32:
+            return existing
+        del existing
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+
+class WindowAccumulator:
+    """Bucketed sum of density maps over the last `seconds` (or since start if None)"""
+    def __init__(self, name, shape, seconds=None, factor=1, buckets=BUCKETS, directory=None):
+        self.name = name
+        self.seconds = seconds
+        self.factor = factor
+        self.shape = downsample_sum(np.zeros(shape, dtype=np.float32), factor).shape
+        self.buckets = buckets if seconds is not None else 1
+        self.bucket_seconds = seconds / self.buckets if seconds is not None else None
+        self.meta_path = os.path.join(directory, f"{name}.json") if directory else None
+
+        total_path = os.path.join(directory, f"{name}.total.npy") if directory else None
+        buckets_path = os.path.join(directory, f"{name}.buckets.npy") if directory and seconds is not None else None
+        self.total = _array(total_path, self.shape)
+        self.bucket_sums = _array(buckets_path, (self.buckets,) + self.shape) if seconds is not None else None
+        self.bucket_frames = np.zeros(self.buckets, dtype=np.int64)
+        self.current = None
+        self._resume()
+
+    def _resume(self):
+        """Pick up counts from a previous run; arrays that do not match the metadata are cleared"""
+        meta = None
+        if self.meta_path and os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        if meta and meta.get("shape") == list(self.shape) and len(meta.get("bucket_frames", [])) == self.buckets:
+            self.bucket_frames[:] = meta["bucket_frames"]
+            self.current = meta.get("current")
+        else:
+            self.total[:] = 0
+            if self.bucket_sums is not None:
+                self.bucket_sums[:] = 0
+
+    @property
+    def frames(self):
+        return int(self.bucket_frames.sum())
+
+    def _advance(self, bucket):
+        if self.current is None:
+            self.current = bucket
+            return
+        if bucket <= self.current:
+            return
+        expired = min(bucket - self.current, self.buckets)
+        for k in range(1, expired + 1):
+            slot = (self.current + k) % self.buckets
+            self.bucket_sums[slot] = 0
+            self.bucket_frames[slot] = 0
+        self.current = bucket
+        # Exact re-sum on rotation (rare) instead of subtracting: no drift
+        np.sum(self.bucket_sums, axis=0, out=self.total)
+
+    def update(self, density, ts):
+        density = downsample_sum(density, self.factor)
+        if self.seconds is None:
+            self.total += density
+            self.bucket_frames[0] += 1
+            return
+        bucket = int(ts // self.bucket_seconds)
+        self._advance(bucket)
+        if self.current - bucket >= self.buckets:
+            return  # Older than the window
+        slot = bucket % self.buckets
+        self.bucket_sums[slot] += density
+        self.bucket_frames[slot] += 1
+        self.total += density
+
+    def mean(self):
+        """Average density per frame over the window (downsampled grid)"""
+        return self.total / max(self.frames, 1)
+
+    def flush(self):
+        for array in (self.total, self.bucket_sums):
+            if isinstance(array, np.memmap):
+                array.flush()
+        if self.meta_path:
+            meta = {"window": self.name, "seconds": self.seconds, "factor": self.factor, "shape": list(self.shape),
+                    "bucket_frames": self.bucket_frames.tolist(), "current": self.current, "updated": time.time()}
+            tmp = self.meta_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp, self.meta_path)
+
+class DensityAccumulator:
+    """All windows of one camera; update() once per analyzed frame"""
+    def __init__(self, shape, directory=None, windows=WINDOWS, buckets=BUCKETS):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.shape = tuple(shape)
+        self.windows = {name: WindowAccumulator(name, self.shape, seconds, factor, buckets, directory)
+                        for name, seconds, factor in windows}
+        self.last_flush = time.monotonic()
+
+    def update(self, density_map, ts=None):
+        ts = time.time() if ts is None else ts
+        density_map = np.asarray(density_map, dtype=np.float32)
+        if density_map.shape != self.shape:
+            # Processing resolution changed (latency controller): resample, keeping the count
+            count = density_map.sum()
+            density_map = cv2.resize(density_map, (self.shape[1], self.shape[0]), interpolation=cv2.INTER_AREA)
+            total = density_map.sum()
+            if total > 0:
+                density_map *= count / total
+        for window in self.windows.values():
+            window.update(density_map, ts)
+        if time.monotonic() - self.last_flush >= FLUSH_SECONDS:
+            self.flush()
+
+    def heatmap(self, window):
+        """(mean density map, frames) for a window, upsampled back to the density-map grid"""
+        acc = self.windows[window]
+        return upsample(acc.mean(), acc.factor, self.shape), acc.frames
+
+    def hotspots(self, window, k=HOTSPOTS):
+        return hotspots(self.windows[window].mean(), self.windows[window].factor, k)
+
+    def flush(self):
+        for window in self.windows.values():
+            window.flush()
+        self.last_flush = time.monotonic()
+
+class HeatmapStore:
+    """Per-camera accumulators under one root; each is created from the camera's first map"""
+    def __init__(self, root=None, windows=WINDOWS, buckets=BUCKETS):
+        self.root = root
+        self.windows = windows
+        self.buckets = buckets
+        self.cameras = {}
+
+    def update(self, camera, density_map, ts=None):
+        acc = self.cameras.get(camera)
+        if acc is None:
+            directory = os.path.join(self.root, camera) if self.root else None
+            acc = self.cameras[camera] = DensityAccumulator(density_map.shape, directory, self.windows, self.buckets)
+        acc.update(density_map, ts)
+        return acc
+
+    def flush(self):
+        for acc in self.cameras.values():
+            acc.flush()
+
+def upsample(grid, factor, shape):
+    """Spread sum-pooled cells back over the original grid (per-cell mean density)"""
+    if factor == 1:
+        return grid
+    full = np.repeat(np.repeat(grid, factor, axis=0), factor, axis=1) / (factor * factor)
+    return full[:shape[0], :shape[1]]
+
+def hotspots(grid, factor=1, k=HOTSPOTS):
+    """Top-k cells as [{x, y, density}] in density-map coordinates (cell centres)"""
+    flat = np.argsort(grid, axis=None)[::-1][:k]
+    ys, xs = np.unravel_index(flat, grid.shape)
+    return [{"x": float((x + 0.5) * factor), "y": float((y + 0.5) * factor), "density": float(grid[y, x])}
+            for y, x in zip(ys, xs)]
+
+def read_heatmap(root, camera, window):
+    """(mean density grid, metadata) straight from disk, without an accumulator"""
+    directory = os.path.join(root, camera)
+    with open(os.path.join(directory, f"{window}.json")) as f:
+        meta = json.load(f)
+    total = np.load(os.path.join(directory, f"{window}.total.npy"), mmap_mode="r")
+    frames = max(sum(meta["bucket_frames"]), 1)
+    return np.asarray(total) / frames, meta
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a cumulative density heatmap")
+    parser.add_argument("root")
+    parser.add_argument("camera")
+    parser.add_argument("--window", default="event", choices=[w[0] for w in WINDOWS])
+    parser.add_argument("--png", help="Write a colour-mapped heatmap image here")
+    parser.add_argument("--size", type=int, nargs=2, default=(1024, 576), metavar=("W", "H"))
+    parser.add_argument("--top", type=int, default=HOTSPOTS)
+    args = parser.parse_args()
+
+    grid, meta = read_heatmap(args.root, args.camera, args.window)
+    if args.png:
+        norm = cv2.normalize(grid, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+        cv2.imwrite(args.png, cv2.resize(cv2.applyColorMap(norm, cv2.COLORMAP_JET), tuple(args.size)))
+    print(json.dumps({
+        "camera": args.camera,
+        "window": args.window,
+        "frames": sum(meta["bucket_frames"]),
+        "updated": meta["updated"],
+        "mean_count": float(grid.sum()),
+        "hotspots": hotspots(grid, meta["factor"], args.top),
+    }))
+
+if __name__ == "__main__":
+    main()
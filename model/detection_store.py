@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+
+# Append-only columnar log of per-frame results, one directory per camera:
+#
+#   <root>/<camera>/index.jsonl            one line per chunk: name, t0, t1, rows, tracks
+#   <root>/<camera>/chunk_000000/<col>.npy one .npy file per column
+#
+# Frame columns: ts (float64 epoch seconds), count, unique_count, motion_energy,
+# flux, risk (float32), status (fixed-width str) and track_end (int64: the
+# end offset of the frame's tracks). Track columns: track_id (int64) and
+# box (float32 [x1, y1, x2, y2]).
+#
+# motion_energy / flux are the pipeline's optical-flow speed and track-count
+# flux. The panic LSTM's own inputs (features.py motion_energy and
+# flux_of_count) go in lstm_motion_energy / lstm_flux_of_count, NaN when the
+# producer doesn't extract them; chunks written before these columns existed
+# read as all NaN.
+#
+# The writer keeps at most CHUNK_ROWS frames in memory. It flushes a chunk
+# when the buffer is full, when FLUSH_SECONDS have passed with at least
+# MIN_FLUSH_ROWS buffered, or after MAX_FLUSH_SECONDS regardless, so
+# low-rate cameras don't write a tiny chunk every few seconds. Chunks are
+# written to a temp directory and renamed into place, then listed in the
+# index, so readers never see half-written chunks. A chunk renamed into
+# place by a writer that died before its index line is adopted into the
+# index when the camera is next opened for writing. Reads np.load(mmap_mode="r") only
+# the columns they need and use the index and the sorted ts column to touch
+# only the rows in range.
+
+# --- CONFIGURATION ---
+CHUNK_ROWS = 4096
+FLUSH_SECONDS = 30.0       # Flush this often once MIN_FLUSH_ROWS frames are buffered
+MIN_FLUSH_ROWS = 256
+MAX_FLUSH_SECONDS = 300.0  # ... and at least this often (bounds what a crash loses)
+STATUS_WIDTH = 40
+FRAME_COLUMNS = {
+    "ts": np.float64,
+    "count": np.float32,
+    "unique_count": np.float32,
+    "motion_energy": np.float32,
+    "flux": np.float32,
+    "risk": np.float32,
+    "lstm_motion_energy": np.float32,
+    "lstm_flux_of_count": np.float32,
+    "status": f"<U{STATUS_WIDTH}",
+    "track_end": np.int64,
+}
+NUMERIC_COLUMNS = ("count", "unique_count", "motion_energy", "flux", "risk")
+LSTM_COLUMNS = ("lstm_motion_energy", "lstm_flux_of_count")
+INDEX_NAME = "index.jsonl"
+CHUNK_PREFIX = "chunk_"
+
+def _camera_dir(root, camera):
+    if not camera or os.sep in camera or camera.startswith("."):
+        raise ValueError(f"Invalid camera id '{camera}'")
+    return os.path.join(root, camera)
+
+class DetectionLog:
+    """Incremental writer for one camera; call append() per frame and close() at the end"""
+    def __init__(self, root, camera, chunk_rows=CHUNK_ROWS, flush_seconds=FLUSH_SECONDS,
+                 min_flush_rows=MIN_FLUSH_ROWS, max_flush_seconds=MAX_FLUSH_SECONDS):
+        self.dir = _camera_dir(root, camera)
+        os.makedirs(self.dir, exist_ok=True)
+        self.camera = camera
+        self.chunk_rows = chunk_rows
+        self.flush_seconds = flush_seconds
+        self.min_flush_rows = min_flush_rows
+        self.max_flush_seconds = max_flush_seconds
+        self.next_chunk = self._recover()
+        self._reset()
+
+    def _recover(self):
+        """Index chunks left unlisted by a crashed writer; returns the next free chunk number"""
+        indexed = {entry["chunk"] for entry in _read_index(self.dir)}
+        numbers = [-1]
+        for name in sorted(os.listdir(self.dir)):
+            path = os.path.join(self.dir, name)
+            if name.startswith(f".{CHUNK_PREFIX}") and name.endswith(".tmp"):
+                shutil.rmtree(path, ignore_errors=True)  # Died before the rename: never visible
+                continue
+            if not name.startswith(CHUNK_PREFIX) or not os.path.isdir(path):
+                continue
+            numbers.append(int(name[len(CHUNK_PREFIX):]))
+            if name not in indexed:
+                ts = np.load(os.path.join(path, "ts.npy"), mmap_mode="r")
+                track_ids = np.load(os.path.join(path, "track_id.npy"), mmap_mode="r")
+                if len(ts):
+                    self._index_chunk(name, ts, len(track_ids))
+                print(f"Recovered unindexed {self.camera}/{name} ({len(ts)} rows)")
+        return max(numbers) + 1
+
+    def _index_chunk(self, name, ts, tracks):
+        entry = {"chunk": name, "t0": float(ts[0]), "t1": float(ts[-1]), "rows": int(len(ts)), "tracks": int(tracks)}
+        with open(os.path.join(self.dir, INDEX_NAME), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _reset(self):
+        self.rows = {name: [] for name in FRAME_COLUMNS}
+        self.track_ids = []
+        self.boxes = []
+        self.last_flush = time.monotonic()
+
+    def __len__(self):
+        return len(self.rows["ts"])
+
+    def append(self, ts, count=0, unique_count=0, motion_energy=0.0, flux=0.0, risk=0.0, status="",
+               track_ids=(), boxes=(), features=None):
+        """features: the LSTM inputs {"motion_energy", "flux_of_count"} (features.py), if extracted"""
+        rows = self.rows
+        rows["ts"].append(ts)
+        rows["count"].append(count)
+        rows["unique_count"].append(unique_count)
+        rows["motion_energy"].append(motion_energy)
+        rows["flux"].append(flux)
+        rows["risk"].append(risk)
+        rows["lstm_motion_energy"].append(features["motion_energy"] if features else np.nan)
+        rows["lstm_flux_of_count"].append(features["flux_of_count"] if features else np.nan)
+        rows["status"].append(status[:STATUS_WIDTH])
+        self.track_ids.extend(int(i) for i in track_ids)
+        self.boxes.extend(np.asarray(boxes, dtype=np.float32).reshape(-1, 4))
+        rows["track_end"].append(len(self.track_ids))
+
+        age = time.monotonic() - self.last_flush
+        if (len(self) >= self.chunk_rows or age >= self.max_flush_seconds
+                or (age >= self.flush_seconds and len(self) >= self.min_flush_rows)):
+            self.flush()
+
+    def flush(self):
+        if len(self) == 0:
+            return
+        frame_cols = {name: np.asarray(values, dtype=FRAME_COLUMNS[name]) for name, values in self.rows.items()}
+        track_ids = np.asarray(self.track_ids, dtype=np.int64)
+        boxes = np.asarray(self.boxes, dtype=np.float32).reshape(-1, 4)
+
+        # Keep ts sorted inside the chunk so range lookups can binary-search it
+        order = np.argsort(frame_cols["ts"], kind="stable")
+        if np.any(order != np.arange(len(order))):
+            starts = np.concatenate(([0], frame_cols["track_end"][:-1]))
+            spans = [np.arange(starts[i], frame_cols["track_end"][i]) for i in order]
+            track_order = np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+            track_ids, boxes = track_ids[track_order], boxes[track_order]
+            lengths = (frame_cols["track_end"] - starts)[order]
+            frame_cols = {name: col[order] for name, col in frame_cols.items()}
+            frame_cols["track_end"] = np.cumsum(lengths)
+
+        name = f"{CHUNK_PREFIX}{self.next_chunk:06d}"
+        tmp = os.path.join(self.dir, f".{name}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for col, values in frame_cols.items():
+            np.save(os.path.join(tmp, f"{col}.npy"), values)
+        np.save(os.path.join(tmp, "track_id.npy"), track_ids)
+        np.save(os.path.join(tmp, "box.npy"), boxes)
+        os.replace(tmp, os.path.join(self.dir, name))
+        self._index_chunk(name, frame_cols["ts"], len(track_ids))
+        self.next_chunk += 1
+        self._reset()
+
+    def close(self):
+        self.flush()
+
+def add_arguments(parser, camera_id="cam0"):
+    """--store / --camera-id flags shared by the pipeline scripts"""
+    group = parser.add_argument_group("detection store")
+    group.add_argument("--store", help="Append per-frame records to this detection store directory")
+    group.add_argument("--camera-id", default=camera_id, help="Camera id used in the store")
+
+def open_log(args):
+    return DetectionLog(args.store, args.camera_id) if args.store else None
+
+def _read_index(camera_dir):
+    path = os.path.join(camera_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class DetectionStore:
+    """Read side: time-range queries and aggregates over memory-mapped chunks"""
+    def __init__(self, root):
+        self.root = root
+        self._index = {}  # camera -> (index mtime, entries)
+        self._maps = {}   # (camera, chunk, column) -> memmap
+
+    def cameras(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.exists(os.path.join(self.root, d, INDEX_NAME)))
+
+    def index(self, camera):
+        camera_dir = _camera_dir(self.root, camera)
+        path = os.path.join(camera_dir, INDEX_NAME)
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        cached = self._index.get(camera)
+        if cached is None or cached[0] != mtime:
+            cached = self._index[camera] = (mtime, _read_index(camera_dir))
+        return cached[1]
+
+    def column(self, camera, chunk, name):
+        key = (camera, chunk, name)
+        if key not in self._maps:
+            path = os.path.join(self.root, camera, chunk, f"{name}.npy")
+            if name in LSTM_COLUMNS and not os.path.exists(path):
+                # Chunk written before the column existed
+                self._maps[key] = np.full(len(self.column(camera, chunk, "ts")), np.nan, dtype=np.float32)
+            else:
+                self._maps[key] = np.load(path, mmap_mode="r")
+        return self._maps[key]
+
+    def _ranges(self, camera, start, end):
+        """(chunk, row_lo, row_hi) for every chunk with rows in [start, end)"""
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        for entry in self.index(camera):
+            if entry["t1"] < start or entry["t0"] >= end:
+                continue
+            ts = self.column(camera, entry["chunk"], "ts")
+            lo, hi = np.searchsorted(ts, start, "left"), np.searchsorted(ts, end, "left")
+            if hi > lo:
+                yield entry["chunk"], lo, hi
+
+    def query(self, camera, start=None, end=None, columns=("ts",) + NUMERIC_COLUMNS):
+        """{column: array} of frame rows with start <= ts < end (seconds)"""
+        parts = {name: [] for name in columns}
+        for chunk, lo, hi in self._ranges(camera, start, end):
+            for name in columns:
+                parts[name].append(self.column(camera, chunk, name)[lo:hi])
+        result = {name: np.concatenate(p) if p else np.empty(0, dtype=FRAME_COLUMNS[name])
+                  for name, p in parts.items()}
+        # Chunks are sorted internally but may overlap (late frames)
+        if "ts" in result and len(parts["ts"]) > 1 and np.any(np.diff(result["ts"]) < 0):
+            order = np.argsort(result["ts"], kind="stable")
+            result = {name: values[order] for name, values in result.items()}
+        return result
+
+    def tracks(self, camera, start=None, end=None):
+        """(ts, track_id, box) arrays, one row per tracked box, for frames in [start, end)"""
+        ts_parts, id_parts, box_parts = [], [], []
+        for chunk, lo, hi in self._ranges(camera, start, end):
+            ends = self.column(camera, chunk, "track_end")
+            first = ends[lo - 1] if lo > 0 else 0
+            last = ends[hi - 1]
+            per_frame = np.diff(np.concatenate(([first], ends[lo:hi])))
+            ts_parts.append(np.repeat(self.column(camera, chunk, "ts")[lo:hi], per_frame))
+            id_parts.append(self.column(camera, chunk, "track_id")[first:last])
+            box_parts.append(self.column(camera, chunk, "box")[first:last])
+        if not ts_parts:
+            return np.empty(0), np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float32)
+        return np.concatenate(ts_parts), np.concatenate(id_parts), np.concatenate(box_parts)
+
+    def aggregate(self, camera, start, end, bucket_seconds, column="count"):
+        """Per time bucket: {t, frames, mean, max} of a numeric column over [start, end)"""
+        data = self.query(camera, start, end, ("ts", column))
+        ts, values = data["ts"], data[column].astype(np.float64)
+        if len(ts) == 0:
+            return {"t": [], "frames": [], "mean": [], "max": []}
+        origin = start if start is not None else ts[0]
+        bucket = ((ts - origin) // bucket_seconds).astype(np.int64)
+        n = int(bucket.max()) + 1
+        frames = np.bincount(bucket, minlength=n)
+        sums = np.bincount(bucket, weights=values, minlength=n)
+        maxima = np.full(n, -np.inf)
+        np.maximum.at(maxima, bucket, values)
+        present = frames > 0
+        return {
+            "t": (origin + np.nonzero(present)[0] * bucket_seconds).tolist(),
+            "frames": frames[present].tolist(),
+            "mean": (sums[present] / frames[present]).tolist(),
+            "max": maxima[present].tolist(),
+        }
+
+    def latest(self, camera):
+        """Last flushed frame row as a dict, or None"""
+        entries = self.index(camera)
+        if not entries:
+            return None
+        chunk = entries[-1]["chunk"]
+        row = {name: self.column(camera, chunk, name)[-1] for name in FRAME_COLUMNS if name != "track_end"}
+        return {k: (str(v) if k == "status" else float(v)) for k, v in row.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the per-frame detection store")
+    parser.add_argument("root")
+    parser.add_argument("--camera", help="Camera id (omit to list cameras)")
+    parser.add_argument("--start", type=float, help="Epoch seconds (inclusive)")
+    parser.add_argument("--end", type=float, help="Epoch seconds (exclusive)")
+    parser.add_argument("--bucket", type=float, help="Aggregate into buckets of this many seconds")
+    parser.add_argument("--column", default="count", choices=NUMERIC_COLUMNS)
+    parser.add_argument("--latest", action="store_true", help="Only the last stored frame")
+    args = parser.parse_args()
+
+    store = DetectionStore(args.root)
+    if not args.camera:
+        output = {"cameras": store.cameras()}
+    elif args.latest:
+        output = store.latest(args.camera)
+    elif args.bucket:
+        output = store.aggregate(args.camera, args.start, args.end, args.bucket, args.column)
+    else:
+        data = store.query(args.camera, args.start, args.end, ("ts",) + NUMERIC_COLUMNS + ("status",))
+        output = {k: v.tolist() for k, v in data.items()}
+    print(json.dumps(output))
+
+if __name__ == "__main__":
+    main()
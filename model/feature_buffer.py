@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+import numpy as np
+from panic_lstm import WINDOW_SIZE, NUM_FEATURES
+
+# --- CONFIGURATION ---
+IDLE_TIMEOUT = 300.0  # Seconds without a sample before a camera's buffer is dropped
+MAX_CAMERAS = 1024
+RESYNC_EVERY = 10000  # Recompute running sums from scratch to cancel float drift
+
+class RollingFeatureBuffer:
+    """Fixed-size ring buffer of (motion_energy, flux_of_count) samples for one camera.
+
+    Running sums are updated on every push, so mean/std of the window cost
+    O(1) per sample instead of a full pass over the window.
+    """
+    def __init__(self, size=WINDOW_SIZE, num_features=NUM_FEATURES):
+        self.size = size
+        self.data = np.zeros((size, num_features), dtype=np.float64)
+        self.sum = np.zeros(num_features, dtype=np.float64)
+        self.sum_sq = np.zeros(num_features, dtype=np.float64)
+        self.head = 0   # Next slot to write (= oldest sample once full)
+        self.count = 0
+        self.pushes = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def is_full(self):
+        return self.count == self.size
+
+    def push(self, sample):
+        sample = np.asarray(sample, dtype=np.float64)
+        if self.is_full:
+            old = self.data[self.head]
+            self.sum -= old
+            self.sum_sq -= old * old
+        else:
+            self.count += 1
+
+        self.data[self.head] = sample
+        self.sum += sample
+        self.sum_sq += sample * sample
+        self.head = (self.head + 1) % self.size
+
+        self.pushes += 1
+        if self.pushes % RESYNC_EVERY == 0:
+            self._resync()
+
+    def _resync(self):
+        valid = self.data if self.is_full else self.data[:self.count]
+        self.sum = valid.sum(axis=0)
+        self.sum_sq = (valid * valid).sum(axis=0)
+
+    def mean(self):
+        return self.sum / max(self.count, 1)
+
+    def std(self):
+        mean = self.mean()
+        var = self.sum_sq / max(self.count, 1) - mean * mean
+        return np.sqrt(np.maximum(var, 0.0))
+
+    def window(self):
+        """Samples in chronological order, oldest first"""
+        if not self.is_full:
+            return self.data[:self.count].copy()
+        return np.concatenate((self.data[self.head:], self.data[:self.head]))
+
+    def normalized_window(self):
+        """Same per-feature normalization as run_inference.py, as a float32 (size, features) array"""
+        return ((self.window() - self.mean()) / (self.std() + 1e-7)).astype(np.float32)
+
+    def reset(self):
+        self.data.fill(0.0)
+        self.sum.fill(0.0)
+        self.sum_sq.fill(0.0)
+        self.head = 0
+        self.count = 0
+
+class FeatureBufferPool:
+    """Per-camera RollingFeatureBuffers with idle eviction and an LRU cap"""
+    def __init__(self, size=WINDOW_SIZE, idle_timeout=IDLE_TIMEOUT, max_cameras=MAX_CAMERAS):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_cameras = max_cameras
+        self.buffers = OrderedDict()  # camera_id -> (buffer, last_seen), least recent first
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def __contains__(self, camera_id):
+        return camera_id in self.buffers
+
+    def get(self, camera_id, now=None):
+        now = time.monotonic() if now is None else now
+        if camera_id in self.buffers:
+            buffer, _ = self.buffers.pop(camera_id)
+        else:
+            buffer = RollingFeatureBuffer(self.size)
+        self.buffers[camera_id] = (buffer, now)
+        self.evict(now)
+        return buffer
+
+    def push(self, camera_id, motion_energy, flux_of_count, now=None):
+        buffer = self.get(camera_id, now)
+        buffer.push((motion_energy, flux_of_count))
+        return buffer
+
+    def reset(self, camera_id):
+        """Forget a camera's history (e.g. after a scene cut or camera restart)"""
+        self.buffers.pop(camera_id, None)
+
+    def evict(self, now=None):
+        """Drop idle cameras and enforce max_cameras; returns the evicted ids"""
+        now = time.monotonic() if now is None else now
+        evicted = []
+        while self.buffers:
+            camera_id, (_, last_seen) = next(iter(self.buffers.items()))
+            if len(self.buffers) <= self.max_cameras and now - last_seen <= self.idle_timeout:
+                break
+            del self.buffers[camera_id]
+            evicted.append(camera_id)
+        return evicted
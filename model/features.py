@@ -0,0 +1,105 @@
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+# Shared per-frame feature extraction for extract_features.py / process_frame.py.
+# Each frame is converted to gray once; every registered feature reads the
+# shared intermediates from a FrameContext, and the scratch images are
+# preallocated per frame size and reused across frames.
+
+FEATURES = OrderedDict()  # name -> fn(ctx) -> float
+
+def register_feature(name):
+    """Decorator adding a feature to the default extraction set"""
+    def wrap(fn):
+        FEATURES[name] = fn
+        return fn
+    return wrap
+
+def decode_frame(frame_bytes):
+    """Decode JPEG/PNG bytes into a BGR frame"""
+    frame = cv2.imdecode(np.frombuffer(frame_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Could not decode frame")
+    return frame
+
+class FrameContext:
+    """Intermediates shared by all features of one frame, computed on first use"""
+    def __init__(self, gray, scratch):
+        self.gray = gray
+        self.scratch = scratch
+        self.area = gray.shape[0] * gray.shape[1]
+        self._laplacian = None
+        self._blurred = None
+
+    @property
+    def laplacian(self):
+        if self._laplacian is None:
+            # int16 holds the 3x3 Laplacian of uint8 exactly (|L| <= 1020)
+            self._laplacian = cv2.Laplacian(self.gray, cv2.CV_16S, dst=self.scratch["laplacian"])
+        return self._laplacian
+
+    @property
+    def blurred(self):
+        if self._blurred is None:
+            self._blurred = cv2.GaussianBlur(self.gray, (5, 5), 0, dst=self.scratch["blurred"])
+        return self._blurred
+
+@register_feature("motion_energy")
+def motion_energy(ctx):
+    """Mean absolute Laplacian response (edge energy, proxy for motion)"""
+    # NORM_L1 sums |L| in one pass without materializing np.abs
+    return cv2.norm(ctx.laplacian, cv2.NORM_L1) / ctx.area
+
+@register_feature("flux_of_count")
+def flux_of_count(ctx):
+    """Count connected bright blobs as an approximation of people"""
+    _, thresh = cv2.threshold(ctx.blurred, 127, 255, cv2.THRESH_BINARY, dst=ctx.scratch["thresh"])
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return float(len(contours))
+
+class FeatureExtractor:
+    def __init__(self, features=None):
+        self.names = list(features or FEATURES)
+        self.fns = [FEATURES[name] for name in self.names]
+        self.shape = None
+        self.scratch = None
+
+    def _scratch(self, shape):
+        if shape != self.shape:
+            self.shape = shape
+            self.scratch = {
+                "gray": np.empty(shape, dtype=np.uint8),
+                "laplacian": np.empty(shape, dtype=np.int16),
+                "blurred": np.empty(shape, dtype=np.uint8),
+                "thresh": np.empty(shape, dtype=np.uint8),
+            }
+        return self.scratch
+
+    def _context(self, frame):
+        scratch = self._scratch(frame.shape[:2])
+        if frame.ndim == 3:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=scratch["gray"])
+        else:
+            gray = frame
+        return FrameContext(gray, scratch)
+
+    def extract_vector(self, frame, out=None):
+        """Feature values of one frame as a float64 vector (order = self.names)"""
+        ctx = self._context(frame)
+        out = np.empty(len(self.fns), dtype=np.float64) if out is None else out
+        for i, fn in enumerate(self.fns):
+            out[i] = fn(ctx)
+        return out
+
+    def extract(self, frame):
+        """Feature values of one frame as {name: float}"""
+        ctx = self._context(frame)
+        return {name: float(fn(ctx)) for name, fn in zip(self.names, self.fns)}
+
+    def extract_batch(self, frames):
+        """(N, features) float64 matrix (same values as extract) for a list or stacked (N, H, W[, 3]) array of frames"""
+        matrix = np.empty((len(frames), len(self.fns)), dtype=np.float64)
+        for i, frame in enumerate(frames):
+            self.extract_vector(frame, out=matrix[i])
+        return matrix
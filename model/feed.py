@@ -1,68 +1,164 @@
 import cv2
-from ultralytics import YOLO
 import json
+import time
 from collections import defaultdict
+from keyframe import KeyframeScheduler
+from frame_ring import RingCapture
+import metrics
+from detection_store import DetectionLog
+from unique_counter import UniqueCounter
+from yolo_cache import WarmDetector
+from run_sahi import FRAME_RATE, GAP_ALPHA, model_trackers, rescale_track_buffer
 
-model = YOLO("yolov10m.pt")
+# Detector: these weights (or their cached export, see yolo_cache.py), loaded
+# and warmed up in the background; frames read before it is warm are skipped
+WEIGHTS = "yolov10m.pt"
+YOLO_FORMAT = "pt"       # "pt" | "onnx" | "openvino" (exports need their runtime installed)
+YOLO_PRECISION = "fp32"  # "fp32" | "fp16" | "int8"
+
+# YOLO only runs when the scene changes, at least every N frames (1 = every frame)
+MAX_KEYFRAME_INTERVAL = 5
+
+# Read raw frames from a shared-memory ring published by `frame_ring.py --name ...`
+# (so other workers can share the camera) instead of opening it directly
+FRAME_RING = None  # e.g. "indra_netra_cam0"
+FRAME_RING_READER_ID = 0
+
+# Per-frame records are appended to this store as they happen (None = off);
+# query it with `python detection_store.py detections_store --camera webcam`
+STORE_DIR = "detections_store"
+CAMERA_ID = "webcam"
+
+# Unique person count sketch, mergeable with other cameras / nodes via
+# `python unique_counter.py unique_webcam.npz other.npz` (None = don't save)
+UNIQUE_SKETCH = "unique_webcam.npz"
+
+# Serve per-stage timings on http://127.0.0.1:<port>/metrics (None = off)
+METRICS_PORT = None
 
 def process_webcam():
-    cap = cv2.VideoCapture(0)
+    if METRICS_PORT is not None:
+        metrics.enable()
+        metrics.serve(port=METRICS_PORT)
+
+    detector = WarmDetector(WEIGHTS, fmt=YOLO_FORMAT, precision=YOLO_PRECISION)
+
+    if FRAME_RING:
+        cap = RingCapture(FRAME_RING, FRAME_RING_READER_ID)
+    else:
+        cap = cv2.VideoCapture(0)
     
     if not cap.isOpened():
         print("Error: Could not open webcam")
         return
     
-    # Track unique objects by class
-    tracked_ids = defaultdict(set)
+    # Track unique objects by class (fixed-size sketches, lost IDs expire)
+    tracked_ids = defaultdict(lambda: UniqueCounter(CAMERA_ID))
     output_file = "detections.json"
     frame_count = 0
+    scheduler = KeyframeScheduler(max_interval=MAX_KEYFRAME_INTERVAL)
+    results = None
+    warming = 0
+    log = DetectionLog(STORE_DIR, CAMERA_ID) if STORE_DIR else None
+    prev_count = 0
+
+    # ByteTrack's lost-track buffer counts updates, which only happen on
+    # keyframes: keep it at the same number of seconds as the gap grows
+    frame_rate = (0 if FRAME_RING else cap.get(cv2.CAP_PROP_FPS)) or FRAME_RATE
+    gap = 1.0
+    since_track = 0
     
-    while True:
-        ret, frame = cap.read()
+    # A failed detector load re-raises from is_ready(); release the camera, window and store either way
+    try:
+        while True:
+            with metrics.stage("decode"):
+                ret, frame = cap.read()
         
-        if not ret:
-            print("Error reading frame")
-            break
+            if not ret:
+                print("Error reading frame")
+                break
+
+            # Keep the camera drained, but only accept frames once the detector is warm
+            if not detector.is_ready():
+                warming += 1
+                cv2.imshow("YOLOv10 Live Detection", frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+                continue
+            model = detector.model
         
-        # Run YOLOv10 inference with tracking
-        results = model.track(frame, conf=0.5, persist=True)
+            # Run YOLOv10 inference with tracking on keyframes,
+            # otherwise carry forward the last detections
+            is_keyframe = scheduler.should_run(frame)
+            since_track += 1
+            if is_keyframe or results is None:
+                gap += GAP_ALPHA * (since_track - gap)
+                since_track = 0
+                with metrics.stage("yolo"):
+                    results = model.track(frame, conf=0.5, persist=True)
+                # Trackers exist after the first call; the new buffer applies from the next update
+                rescale_track_buffer(model_trackers(model), frame_rate / max(gap, 1.0))
         
-        # Annotate frame with bounding boxes and scores
-        annotated_frame = results[0].plot()
+            # Annotate frame with bounding boxes and scores
+            with metrics.stage("hud"):
+                annotated_frame = results[0].plot(img=frame)
         
-        # Track unique IDs per class
-        if len(results[0].boxes) > 0:
-            for box in results[0].boxes:
-                class_id = int(box.cls)
-                class_name = model.names[class_id]
-                track_id = int(box.id) if box.id is not None else None
+            # Track unique IDs per class
+            if is_keyframe and len(results[0].boxes) > 0:
+                frame_ids = defaultdict(list)
+                for box in results[0].boxes:
+                    class_id = int(box.cls)
+                    class_name = model.names[class_id]
+                    track_id = int(box.id) if box.id is not None else None
                 
-                if track_id is not None:
-                    tracked_ids[class_name].add(track_id)
+                    if track_id is not None:
+                        frame_ids[class_name].append(track_id)
+                for class_name, ids in frame_ids.items():
+                    tracked_ids[class_name].update(ids)
         
-        # Display frame with detections
-        cv2.imshow("YOLOv10 Live Detection", annotated_frame)
+            if log is not None:
+                boxes = results[0].boxes
+                person = boxes.cls == 0
+                count = int(person.sum())
+                ids, xyxy = [], []
+                if boxes.id is not None:
+                    ids = boxes.id[person].int().tolist()
+                    xyxy = boxes.xyxy[person].cpu().numpy()
+                unique = tracked_ids["person"].estimate() if "person" in tracked_ids else 0
+                log.append(time.time(), count, unique, flux=abs(count - prev_count),
+                           track_ids=ids, boxes=xyxy)
+                prev_count = count
+
+            # Display frame with detections
+            cv2.imshow("YOLOv10 Live Detection", annotated_frame)
         
-        frame_count += 1
-        print(f"Frame {frame_count} processed", end='\r')
+            frame_count += 1
+            metrics.frame()
+            print(f"Frame {frame_count} processed", end='\r')
         
-        # Press 'q' to quit
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-    
-    cap.release()
-    cv2.destroyAllWindows()
+            # Press 'q' to quit
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    finally:
+        cap.release()
+        cv2.destroyAllWindows()
+        if log is not None:
+            log.close()
     
     # Save unique counts to JSON
     output_data = {
         "total_frames": frame_count,
-        "unique_instances": {class_name: len(ids) for class_name, ids in tracked_ids.items()}
+        "unique_instances": {class_name: ids.estimate() for class_name, ids in tracked_ids.items()}
     }
+    if UNIQUE_SKETCH and "person" in tracked_ids:
+        tracked_ids["person"].save(UNIQUE_SKETCH)
     
     with open(output_file, 'w') as f:
         json.dump(output_data, f, indent=2)
     
-    print(f"\nDetections saved to {output_file}")
+    print(f"\n{scheduler.summary()}")
+    print(f"Frames skipped while the detector warmed up: {warming}")
+    print(f"Detections saved to {output_file}")
     print(json.dumps(output_data, indent=2))
 
 if __name__ == "__main__":
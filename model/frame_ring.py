@@ -0,0 +1,257 @@
+import time
+import argparse
+from multiprocessing import shared_memory
+import numpy as np
+import cv2
+import metrics
+
+# Zero-copy frame transport for local cameras: one capture process writes raw
+# BGR frames into a shared-memory ring, and any number of analysis workers
+# (features, YOLO, CSRNet) read the same frame in place. No JPEG round trip,
+# no pipe copy.
+#
+# Shared block layout (all int64 except the frames):
+#   header[HEADER_LEN]   slots, height, width, channels, max_readers, policy, write_seq, closed
+#   slot_seq[slots]      seq of the frame stored in each slot (WRITING while being written)
+#   cursors[max_readers] last seq each registered reader is done with (INACTIVE if unused)
+#   frames[slots, H, W, C] uint8
+#
+# Frame n (n >= 1) lives in slot (n - 1) % slots. Slow consumers:
+#   drop_oldest  the writer never waits; a reader that falls more than `slots`
+#                frames behind skips ahead and the skipped frames are counted
+#                as dropped. Zero-copy views may be overwritten while in use,
+#                so check reader.valid(seq) after processing.
+#   block        the writer waits until every active reader has released the
+#                slot it is about to overwrite (reader.next() releases the
+#                previous frame). Views stay valid until the next call.
+#
+# Publication relies on the slot_seq store becoming visible after the frame
+# bytes, which holds on x86 (TSO). Readers re-check slot_seq after use anyway.
+
+# --- CONFIGURATION ---
+SLOTS = 8
+MAX_READERS = 8
+POLICIES = ("drop_oldest", "block")
+POLL_INTERVAL = 0.0005
+
+HEADER_LEN = 8
+H_SLOTS, H_HEIGHT, H_WIDTH, H_CHANNELS, H_READERS, H_POLICY, H_WRITE_SEQ, H_CLOSED = range(HEADER_LEN)
+WRITING = -1
+INACTIVE = -1
+
+class FrameRing:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        slots, h, w, c, readers = (int(header[i]) for i in (H_SLOTS, H_HEIGHT, H_WIDTH, H_CHANNELS, H_READERS))
+        self._map(slots, (h, w, c), readers)
+        self.policy = POLICIES[int(self.header[H_POLICY])]
+
+    def _map(self, slots, shape, max_readers):
+        buf = self.shm.buf
+        offset = 0
+        self.header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=buf, offset=offset)
+        offset += self.header.nbytes
+        self.slot_seq = np.ndarray((slots,), dtype=np.int64, buffer=buf, offset=offset)
+        offset += self.slot_seq.nbytes
+        self.cursors = np.ndarray((max_readers,), dtype=np.int64, buffer=buf, offset=offset)
+        offset += self.cursors.nbytes
+        self.frames = np.ndarray((slots,) + tuple(shape), dtype=np.uint8, buffer=buf, offset=offset)
+        self.slots = slots
+        self.shape = tuple(shape)
+
+    @staticmethod
+    def nbytes(slots, shape, max_readers):
+        return 8 * (HEADER_LEN + slots + max_readers) + slots * int(np.prod(shape))
+
+    @classmethod
+    def create(cls, name, shape, slots=SLOTS, policy="drop_oldest", max_readers=MAX_READERS):
+        """Create the ring (capture side); shape is (H, W, C) of the raw frames"""
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy '{policy}', expected one of {POLICIES}")
+        if len(shape) == 2:
+            shape = tuple(shape) + (1,)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls.nbytes(slots, shape, max_readers))
+        header = np.ndarray((HEADER_LEN,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[[H_SLOTS, H_HEIGHT, H_WIDTH, H_CHANNELS, H_READERS]] = (slots,) + tuple(shape) + (max_readers,)
+        header[H_POLICY] = POLICIES.index(policy)
+        ring = cls(shm, owner=True)
+        ring.slot_seq[:] = 0
+        ring.cursors[:] = INACTIVE
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        """Open an existing ring (analysis side)"""
+        # track=False: a reader exiting must not unlink the writer's segment
+        return cls(shared_memory.SharedMemory(name=name, track=False), owner=False)
+
+    @property
+    def write_seq(self):
+        return int(self.header[H_WRITE_SEQ])
+
+    @property
+    def closed(self):
+        return bool(self.header[H_CLOSED])
+
+    def slot(self, seq):
+        return (seq - 1) % self.slots
+
+    def write(self, frame, timeout=None):
+        """Publish one frame; returns its seq. Under 'block' this may wait for slow readers."""
+        seq = self.write_seq + 1
+        if self.policy == "block":
+            self._wait_for_readers(seq - self.slots, timeout)
+
+        i = self.slot(seq)
+        self.slot_seq[i] = WRITING
+        self.frames[i].reshape(frame.shape)[...] = frame
+        self.slot_seq[i] = seq
+        self.header[H_WRITE_SEQ] = seq
+        return seq
+
+    def _wait_for_readers(self, released_seq, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            active = self.cursors[self.cursors != INACTIVE]
+            if len(active) == 0 or active.min() >= released_seq:
+                return
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("Frame ring readers are not keeping up")
+            time.sleep(POLL_INTERVAL)
+
+    def reader(self, reader_id):
+        return RingReader(self, reader_id)
+
+    def close(self):
+        """Writer: mark end of stream. Readers get None from next() once drained."""
+        self.header[H_CLOSED] = 1
+
+    def release(self):
+        """Drop our mapping (and unlink the segment if we created it)"""
+        self.header = self.slot_seq = self.cursors = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+class RingReader:
+    """One consumer's position in a FrameRing; reader_id must be unique per ring"""
+    def __init__(self, ring, reader_id):
+        if not 0 <= reader_id < len(ring.cursors):
+            raise ValueError(f"reader_id must be in [0, {len(ring.cursors)})")
+        self.ring = ring
+        self.reader_id = reader_id
+        self.seq = ring.write_seq  # Start from the newest frame
+        self.dropped = 0
+        ring.cursors[reader_id] = self.seq
+
+    def next(self, timeout=None, latest=False):
+        """Block until a newer frame is available; returns (seq, view) or None on close/timeout.
+
+        latest=True jumps straight to the newest frame (skipped ones count as dropped).
+        """
+        ring = self.ring
+        # Done with the previous frame: lets a blocking writer reuse its slot
+        ring.cursors[self.reader_id] = self.seq
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            newest = ring.write_seq
+            if newest > self.seq:
+                want = newest if latest else self.seq + 1
+                oldest = newest - ring.slots + 1
+                if want < oldest:
+                    want = oldest  # Overrun (drop_oldest): skip to the oldest frame still in the ring
+                i = ring.slot(want)
+                if ring.slot_seq[i] == want:
+                    self.dropped += want - self.seq - 1
+                    self.seq = want
+                    return want, ring.frames[i]
+                # Slot was overwritten between reads; retry with a fresh write_seq
+                continue
+            if ring.closed:
+                return None
+            if deadline is not None and time.monotonic() > deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+
+    def valid(self, seq):
+        """True while the frame returned for seq has not been overwritten"""
+        return self.ring.slot_seq[self.ring.slot(seq)] == seq
+
+    def close(self):
+        self.ring.cursors[self.reader_id] = INACTIVE
+
+class RingCapture:
+    """cv2.VideoCapture-style read() over a FrameRing, for existing capture loops"""
+    def __init__(self, name, reader_id, copy=True, latest=False):
+        self.ring = FrameRing.attach(name)
+        self.reader = self.ring.reader(reader_id)
+        self.copy = copy
+        self.latest = latest
+        self.open = True
+
+    def isOpened(self):
+        return self.open
+
+    def read(self):
+        while True:
+            dropped = self.reader.dropped
+            item = self.reader.next(latest=self.latest)
+            metrics.count("ring_dropped", self.reader.dropped - dropped)
+            if item is None:
+                self.open = False
+                return False, None
+            seq, frame = item
+            if not self.copy:
+                return True, frame
+            frame = frame.copy()
+            if self.reader.valid(seq):
+                return True, frame
+            # Overwritten mid-copy: this frame is lost too, take the next one
+            self.reader.dropped += 1
+            metrics.count("ring_dropped")
+
+    def release(self):
+        self.reader.close()
+        self.ring.release()
+        self.open = False
+
+def capture_to_ring(source, name, slots=SLOTS, policy="drop_oldest", max_readers=MAX_READERS):
+    """Capture process: grab frames from a cv2 source into a new ring until the source ends"""
+    cap = cv2.VideoCapture(source)
+    ret, frame = cap.read()
+    if not ret:
+        raise RuntimeError(f"Could not read from source {source}")
+
+    ring = FrameRing.create(name, frame.shape, slots=slots, policy=policy, max_readers=max_readers)
+    print(f"Publishing {frame.shape[1]}x{frame.shape[0]} frames to shared memory '{name}' ({slots} slots, {policy})")
+    try:
+        while ret:
+            ring.write(frame)
+            ret, frame = cap.read()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+        cap.release()
+        # Give readers a moment to see the close flag before the segment disappears
+        time.sleep(0.5)
+        ring.release()
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture a camera/video into a shared-memory frame ring")
+    parser.add_argument("--source", default="0", help="Camera index or video path")
+    parser.add_argument("--name", default="indra_netra_cam0")
+    parser.add_argument("--slots", type=int, default=SLOTS)
+    parser.add_argument("--policy", default="drop_oldest", choices=POLICIES)
+    parser.add_argument("--max-readers", type=int, default=MAX_READERS)
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    capture_to_ring(source, args.name, args.slots, args.policy, args.max_readers)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,29 @@
+import time
+import argparse
+import json
+import shutil
+import tempfile
 import torch
 import torch.nn as nn
 import numpy as np
 import cv2
 import os
 from torchvision import models
+from keyframe import KeyframeScheduler, MAX_INTERVAL
+from pipeline import VideoPipeline
+import metrics
+import detection_store
+from density_accumulator import HeatmapStore
+from csrnet_backend import BACKENDS, CSRNetBackend
+from segments import SEGMENT_EXT, SEGMENT_SECONDS, plan_segments, run_segments, segment_writer, stitch_videos, threads_per_worker
 
 # --- CONFIGURATION ---
 VIDEO_PATH = "/home/prasun/stempede/vid.mp4"
 MODEL_PATH = "/home/prasun/stempede/partBmodel_best.pth.tar" 
 OUTPUT_PATH = "/home/prasun/stempede/op.mp4"
+RESULTS_PATH = os.path.splitext(OUTPUT_PATH)[0] + ".json"
 DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
+BATCH_SIZE = 4  # Consecutive frames per CSRNet call in the offline (pipeline / segment) paths
 
 # --- 1. DEFINE THE CSRNet ARCHITECTURE ---
 class CSRNet(nn.Module):
@@ -40,11 +54,39 @@ def make_layers(cfg, in_channels=3, batch_norm=False, dilation=False):
     return nn.Sequential(*layers)
 
 # --- 2. ANALYSIS ENGINE ---
+def panic_risk(mag, density_map, count):
+    """Density-weighted motion: flow magnitude summed where people are, per person"""
+    h, w = density_map.shape
+    mag_resized = cv2.resize(mag, (w, h))
+    
+    # Filter noise: only consider motion where density is > 0
+    panic_energy = np.sum(mag_resized * density_map)
+    
+    if count < 1: count = 1
+    return (panic_energy / count) * 10
+
+def classify_risk(risk_score):
+    if risk_score > 5.0:
+        status = "!!! PANIC !!!"
+        color = (0, 0, 255)
+    elif risk_score > 2.5:
+        status = "High Activity"
+        color = (0, 165, 255)
+    else:
+        status = "Normal"
+        color = (0, 255, 0)
+    return status, color
+
 class CrowdAnalyzer:
-    def __init__(self, model_path):
+    def __init__(self, model_path, scheduler=None, backend="eager", onnx_path=None):
         print(f"Initializing CSRNet on {DEVICE}...")
         self.model = CSRNet().to(DEVICE)
         self.prev_gray = None
+
+        # Optional KeyframeScheduler: CSRNet only runs on keyframes, other
+        # frames reuse the last density map (optical flow still runs every frame)
+        self.scheduler = scheduler
+        self.last_density = None
         
         if os.path.exists(model_path):
             try:
@@ -65,20 +107,50 @@ class CrowdAnalyzer:
         
         self.model.eval()
 
+        # Batched inference backend; normalization is folded into the graph
+        self.backend = CSRNetBackend(self.model, backend, device=DEVICE, onnx_path=onnx_path)
+
+    def prime(self, frame):
+        """Seed temporal state from the frame preceding a video segment"""
+        self.prev_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def estimate_density(self, frame):
+        with metrics.stage("csrnet"):
+            return self.backend.predict(frame[np.newaxis])[0]
+
+    def estimate_density_batch(self, frames):
+        """(N, h, w) density maps for a list or stacked array of frames"""
+        with metrics.stage("csrnet"):
+            return self.backend.predict(frames)
+
+    def is_keyframe(self, frame):
+        return self.scheduler.should_run(frame) if self.scheduler is not None else True
+
     def analyze_frame(self, frame):
         # 1. DENSITY ESTIMATION (COUNTING)
-        img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        img = img.astype(np.float32) / 255.0
-        img = (img - [0.485, 0.456, 0.406]) / [0.229, 0.224, 0.225]
-        
-        # --- FIX 2: Added .float() ---
-        # Forces data to be 32-bit float to match the model weights
-        x = torch.from_numpy(img).permute(2, 0, 1).unsqueeze(0).to(DEVICE).float()
-        
-        with torch.no_grad():
-            density_map = self.model(x)
-        
-        density_map = density_map.squeeze().cpu().numpy()
+        # Skipped (non-key) frames carry forward the last density map
+        if self.is_keyframe(frame) or self.last_density is None:
+            self.last_density = self.estimate_density(frame)
+        return self.score(frame, self.last_density)
+
+    def analyze_batch(self, frames):
+        """analyze_frame over consecutive frames with one CSRNet call for all
+        keyframes among them (same keyframe decisions and flow as frame-by-frame)"""
+        keys = [self.is_keyframe(frame) for frame in frames]
+        if self.last_density is None:
+            keys[0] = True
+        key_frames = [frame for frame, key in zip(frames, keys) if key]
+        densities = iter(self.estimate_density_batch(key_frames) if key_frames else ())
+
+        results = []
+        for frame, key in zip(frames, keys):
+            if key:
+                self.last_density = next(densities)
+            results.append(self.score(frame, self.last_density))
+        return results
+
+    def score(self, frame, density_map):
+        """Count, panic score and status for one frame given its density map"""
         count = np.sum(density_map) 
         
         # 2. PANIC SCORE (MOTION * DENSITY)
@@ -87,35 +159,151 @@ class CrowdAnalyzer:
             self.prev_gray = gray
             return count, 0.0, "Initializing", (0,255,0), density_map
             
-        flow = cv2.calcOpticalFlowFarneback(self.prev_gray, gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        with metrics.stage("flow"):
+            flow = cv2.calcOpticalFlowFarneback(self.prev_gray, gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
         mag, _ = cv2.cartToPolar(flow[..., 0], flow[..., 1])
         
-        h, w = density_map.shape
-        mag_resized = cv2.resize(mag, (w, h))
-        
-        # Filter noise: only consider motion where density is > 0
-        panic_energy = np.sum(mag_resized * density_map)
-        
-        if count < 1: count = 1
-        risk_score = (panic_energy / count) * 10
+        risk_score = panic_risk(mag, density_map, count)
         
         self.prev_gray = gray
         
-        if risk_score > 5.0:
-            status = "!!! PANIC !!!"
-            color = (0, 0, 255)
-        elif risk_score > 2.5:
-            status = "High Activity"
-            color = (0, 165, 255)
-        else:
-            status = "Normal"
-            color = (0, 255, 0)
+        status, color = classify_risk(risk_score)
             
         return count, risk_score, status, color, density_map
 
-# --- 3. MAIN ---
+# --- 3. VISUALIZATION ---
+def render_overlay(frame, result):
+    """Blend the density heatmap into the frame and draw the HUD"""
+    count, risk, status, color, density_map = result
+    process_h, process_w = frame.shape[:2]
+
+    density_norm = cv2.normalize(density_map, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+    heatmap = cv2.applyColorMap(density_norm, cv2.COLORMAP_JET)
+    heatmap = cv2.resize(heatmap, (process_w, process_h))
+    
+    overlay = cv2.addWeighted(frame, 0.6, heatmap, 0.4, 0)
+    
+    # Small Text HUD
+    cv2.rectangle(overlay, (0, 0), (250, 100), (0, 0, 0), -1)
+    cv2.putText(overlay, f"Count: {int(count)}", (15, 30), 
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+    cv2.putText(overlay, f"Panic Score: {risk:.2f}", (15, 60), 
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+    cv2.putText(overlay, f"{status}", (15, 90), 
+                cv2.FONT_HERSHEY_TRIPLEX, 0.5, color, 1)
+    return overlay
+
+# --- 4. SEGMENT-PARALLEL MODE ---
+def process_segment(task):
+    """Worker: analyze frames [start, end) into a temporary segment video"""
+    torch.set_num_threads(task["threads"])
+    scheduler = KeyframeScheduler(max_interval=task["keyframe_interval"]) if task["keyframe_interval"] else None
+    analyzer = CrowdAnalyzer(task["model_path"], scheduler=scheduler, backend=task["backend"],
+                             onnx_path=task["onnx_path"])
+    size = task["size"]
+
+    cap = cv2.VideoCapture(task["video_path"])
+    cap.set(cv2.CAP_PROP_POS_FRAMES, task["warmup_start"])
+
+    # Overlap frames only prime prev_gray so the first flow of the segment is correct
+    for _ in range(task["start"] - task["warmup_start"]):
+        ret, frame = cap.read()
+        if not ret: break
+        analyzer.prime(cv2.resize(frame, size))
+
+    out = segment_writer(task["segment_path"], task["fps"], size)
+    results = []
+    frame_index = task["start"]
+    while frame_index < task["end"]:
+        frames = []
+        while len(frames) < task["batch_size"] and frame_index + len(frames) < task["end"]:
+            ret, frame = cap.read()
+            if not ret: break
+            frames.append(cv2.resize(frame, size))
+        if not frames: break
+
+        for frame, result in zip(frames, analyzer.analyze_batch(frames)):
+            out.write(render_overlay(frame, result))
+            count, risk, status, _, _ = result
+            results.append({"frame": frame_index, "count": float(count), "risk": float(risk), "status": status})
+            frame_index += 1
+
+    cap.release()
+    out.release()
+    return results
+
+def run_parallel(cap, size, fps, workers, segment_seconds, keyframe_interval, backend, batch_size=BATCH_SIZE,
+                 onnx_path=None, log=None):
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    plan = plan_segments(total_frames, segment_seconds * max(fps, 1))
+    print(f"Processing {total_frames} frames as {len(plan)} segments on {workers} workers...")
+    start_time = time.time()
+
+    tmp_dir = tempfile.mkdtemp(prefix="segments_", dir=os.path.dirname(OUTPUT_PATH) or ".")
+    tasks = [
+        {
+            "video_path": VIDEO_PATH,
+            "model_path": MODEL_PATH,
+            "segment_path": os.path.join(tmp_dir, f"segment_{index:05d}{SEGMENT_EXT}"),
+            "warmup_start": warmup_start,
+            "start": start,
+            "end": end,
+            "size": size,
+            "fps": fps,
+            "threads": threads_per_worker(workers),
+            "keyframe_interval": keyframe_interval,
+            "backend": backend,
+            "batch_size": batch_size,
+            "onnx_path": onnx_path,
+        }
+        for index, warmup_start, start, end in plan
+    ]
+
+    try:
+        segment_results = run_segments(process_segment, tasks, workers)
+        written = stitch_videos([t["segment_path"] for t in tasks], OUTPUT_PATH, fps, size)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    results = [r for segment in segment_results for r in segment]
+    for r in results:
+        if log is not None:
+            # Same timestamps as serial mode: wall clock at start + frame offset
+            log.append(start_time + r["frame"] / max(fps, 1), count=r["count"], risk=r["risk"], status=r["status"])
+        print(f"Count: {int(r['count'])} | Risk: {r['risk']:.2f} | {r['status']}")
+    if written != total_frames:
+        print(f"⚠️ WARNING: wrote {written} of {total_frames} frames (inaccurate seeking in this container?)")
+
+    with open(RESULTS_PATH, 'w') as f:
+        json.dump(results, f)
+    print(f"Per-frame results saved to {RESULTS_PATH}")
+
+# --- 5. MAIN ---
 def main():
-    analyzer = CrowdAnalyzer(MODEL_PATH)
+    parser = argparse.ArgumentParser(description="CSRNet density + optical-flow panic score")
+    parser.add_argument("--keyframes", action="store_true", help="Only run CSRNet when the scene changes")
+    parser.add_argument("--max-keyframe-interval", type=int, default=MAX_INTERVAL)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Split the video into time segments processed by N worker processes")
+    parser.add_argument("--segment-seconds", type=float, default=SEGMENT_SECONDS)
+    parser.add_argument("--backend", default="eager", choices=BACKENDS,
+                        help="CSRNet execution path (check accuracy with csrnet_backend.py first)")
+    parser.add_argument("--onnx-path", help="Reuse (or create) the exported graph here for the onnx backends")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Consecutive frames per CSRNet call")
+    metrics.add_arguments(parser)
+    detection_store.add_arguments(parser)
+    parser.add_argument("--heatmap-dir", help="Keep rolling cumulative density heatmaps in this directory")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Density maps and stage timings stay inside the worker processes
+        serial_only = [flag for flag, value in (("--heatmap-dir", args.heatmap_dir),
+                                                ("--metrics-port", args.metrics_port),
+                                                ("--metrics-log", args.metrics_log),
+                                                ("--profile", args.profile)) if value is not None]
+        if serial_only:
+            parser.error(f"{', '.join(serial_only)} cannot be combined with --workers > 1")
+
     cap = cv2.VideoCapture(VIDEO_PATH)
     
     # Setup Writer
@@ -125,40 +313,69 @@ def main():
     
     # Process at reduced resolution for speed, but output visualization
     process_w, process_h = 1024, 576 
+
+    if args.workers > 1:
+        keyframe_interval = args.max_keyframe_interval if args.keyframes else None
+        log = detection_store.open_log(args)
+        try:
+            run_parallel(cap, (process_w, process_h), fps, args.workers, args.segment_seconds, keyframe_interval,
+                         args.backend, batch_size=args.batch_size, onnx_path=args.onnx_path, log=log)
+        finally:
+            if log is not None:
+                log.close()
+        cap.release()
+        print(f"Saved to {OUTPUT_PATH}")
+        return
+
+    # Serial mode only: segment workers run in their own processes
+    stop_metrics = metrics.start_from_args(args)
+    log = detection_store.open_log(args)
+    heatmaps = HeatmapStore(args.heatmap_dir) if args.heatmap_dir else None
+    start_time = time.time()
+    frame_index = 0
+    scheduler = KeyframeScheduler(max_interval=args.max_keyframe_interval) if args.keyframes else None
+    analyzer = CrowdAnalyzer(MODEL_PATH, scheduler=scheduler, backend=args.backend, onnx_path=args.onnx_path)
     out = cv2.VideoWriter(OUTPUT_PATH, cv2.VideoWriter_fourcc(*'mp4v'), fps, (process_w, process_h))
 
     print("Starting Analysis...")
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret: break
-        
-        frame = cv2.resize(frame, (process_w, process_h))
-        
-        # Analyze
-        count, risk, status, color, density_map = analyzer.analyze_frame(frame)
-        
-        # Visualization
-        density_norm = cv2.normalize(density_map, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
-        heatmap = cv2.applyColorMap(density_norm, cv2.COLORMAP_JET)
-        heatmap = cv2.resize(heatmap, (process_w, process_h))
-        
-        overlay = cv2.addWeighted(frame, 0.6, heatmap, 0.4, 0)
-        
-        # Small Text HUD
-        cv2.rectangle(overlay, (0, 0), (250, 100), (0, 0, 0), -1)
-        cv2.putText(overlay, f"Count: {int(count)}", (15, 30), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-        cv2.putText(overlay, f"Panic Score: {risk:.2f}", (15, 60), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-        cv2.putText(overlay, f"{status}", (15, 90), 
-                    cv2.FONT_HERSHEY_TRIPLEX, 0.5, color, 1)
-
-        out.write(overlay)
+    def render(frame, result):
+        nonlocal frame_index
+        count, risk, status, _, density_map = result
+        ts = start_time + frame_index / max(fps, 1)
+        if log is not None:
+            log.append(ts, count=float(count), risk=float(risk), status=status)
+        if heatmaps is not None:
+            heatmaps.update(args.camera_id, density_map, ts)
+        frame_index += 1
+        with metrics.stage("hud"):
+            overlay = render_overlay(frame, result)
+        with metrics.stage("write"):
+            out.write(overlay)
         print(f"Count: {int(count)} | Risk: {risk:.2f} | {status}")
 
+    # Decode/resize, CSRNet and HUD/encode run as overlapping pipeline stages;
+    # CSRNet sees --batch-size consecutive frames per call
+    pipeline = VideoPipeline(
+        analyzer.analyze_frame,
+        render,
+        preprocess=lambda frame: cv2.resize(frame, (process_w, process_h)),
+        batch_size=args.batch_size,
+        analyze_batch=analyzer.analyze_batch,
+    )
+    try:
+        pipeline.run(cap)
+    finally:
+        stop_metrics()
+        if log is not None:
+            log.close()
+        if heatmaps is not None:
+            heatmaps.flush()
+
     cap.release()
     out.release()
+    if scheduler is not None:
+        print(scheduler.summary())
     print(f"Saved to {OUTPUT_PATH}")
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+import cv2
+import metrics
+
+# --- CONFIGURATION ---
+PROBE_SIZE = (64, 36)   # Low-res gray probe used for the motion signal
+MOTION_THRESH = 2.0     # Mean abs diff (0-255) vs the last keyframe that triggers a rerun
+SPIKE_THRESH = 6.0      # Mean abs diff vs the previous frame treated as a motion spike
+MAX_INTERVAL = 10       # A keyframe is forced at least every N frames (1 = every frame)
+
+class KeyframeScheduler:
+    """Decides when a frame is worth running the expensive model on.
+
+    A tiny gray probe of each frame is compared with the probe of the last
+    keyframe (accumulated change) and with the previous frame (sudden motion).
+    Callers carry forward the last detections / density map on skipped frames.
+    """
+    def __init__(self, max_interval=MAX_INTERVAL, motion_thresh=MOTION_THRESH,
+                 spike_thresh=SPIKE_THRESH, probe_size=PROBE_SIZE):
+        self.max_interval = max_interval
+        self.motion_thresh = motion_thresh
+        self.spike_thresh = spike_thresh
+        self.probe_size = probe_size
+        self.key_probe = None
+        self.prev_probe = None
+        self.since_key = 0
+        self.frames = 0
+        self.keyframes = 0
+        self.reasons = {"first": 0, "interval": 0, "motion": 0, "spike": 0}
+
+    def probe(self, frame):
+        small = cv2.resize(frame, self.probe_size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def should_run(self, frame):
+        probe = self.probe(frame)
+        self.frames += 1
+        self.since_key += 1
+
+        reason = None
+        if self.key_probe is None:
+            reason = "first"
+        elif cv2.norm(probe, self.prev_probe, cv2.NORM_L1) / probe.size > self.spike_thresh:
+            reason = "spike"
+        elif cv2.norm(probe, self.key_probe, cv2.NORM_L1) / probe.size > self.motion_thresh:
+            reason = "motion"
+        elif self.since_key >= self.max_interval:
+            reason = "interval"
+
+        self.prev_probe = probe
+        if reason is None:
+            metrics.count("keyframe_skipped")
+            return False
+
+        self.reasons[reason] += 1
+        self.keyframes += 1
+        self.key_probe = probe
+        self.since_key = 0
+        return True
+
+    @property
+    def skip_ratio(self):
+        return 1.0 - self.keyframes / self.frames if self.frames else 0.0
+
+    def summary(self):
+        reasons = ", ".join(f"{k}: {v}" for k, v in self.reasons.items())
+        return f"Keyframes: {self.keyframes}/{self.frames} | Skip ratio: {self.skip_ratio:.1%} | {reasons}"
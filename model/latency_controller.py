@@ -0,0 +1,158 @@
+import os
+import time
+import yolo_cache
+
+# Keeps a camera's per-frame analysis latency under a target by stepping
+# along a ladder of quality levels. Each level sets the processing
+# resolution, the optical-flow resolution and the detector variant.
+#
+# Latency is smoothed with an EWMA, and hysteresis stops the level from
+# flapping:
+#   - step down after DOWN_PATIENCE frames above target * HIGH_WATER
+#   - step up only after UP_PATIENCE frames below target * LOW_WATER
+#   - ignore COOLDOWN frames after every change while the new level settles
+#   - a level that overloaded needs BACKOFF times more patience before it is
+#     tried again, up to MAX_BACKOFF
+# Every change is returned as a record (old/new level, smoothed latency,
+# last stage times, reason) so it can be logged next to the results.
+
+# --- CONFIGURATION ---
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+TARGET_MS = 100.0       # Per-frame analysis latency to stay under (1000 / target FPS)
+HIGH_WATER = 1.1        # Over target * HIGH_WATER counts as overloaded
+LOW_WATER = 0.6         # Under target * LOW_WATER counts as headroom for the next level up
+EWMA_ALPHA = 0.2
+DOWN_PATIENCE = 5
+UP_PATIENCE = 50
+COOLDOWN = 20
+BACKOFF = 2
+MAX_BACKOFF = 8
+
+# Detector variants: name -> (weights, input size); missing weights are downloaded
+# into MODEL_DIR (yolo_cache.resolve_weights) before they are hashed and exported
+DETECTORS = {
+    "n320": (os.path.join(MODEL_DIR, "yolov10n.pt"), 320),
+    "s480": (os.path.join(MODEL_DIR, "yolov10s.pt"), 480),
+    "m640": (os.path.join(MODEL_DIR, "yolov10m.pt"), 640),
+}
+
+# Cheapest first; the default pipeline settings are the "full" level
+LEVELS = (
+    {"name": "min",  "process_size": (512, 288),  "flow_size": (160, 160), "detector": "n320"},
+    {"name": "low",  "process_size": (640, 360),  "flow_size": (192, 192), "detector": "n320"},
+    {"name": "mid",  "process_size": (768, 432),  "flow_size": (256, 256), "detector": "s480"},
+    {"name": "high", "process_size": (1024, 576), "flow_size": (256, 256), "detector": "m640"},
+    {"name": "full", "process_size": (1024, 576), "flow_size": (320, 320), "detector": "m640"},
+)
+
+class LatencyController:
+    """observe(latency) per frame; returns a change record when the level should move"""
+    def __init__(self, target_ms=TARGET_MS, levels=LEVELS, min_level=0, max_level=None, start_level=None):
+        self.target = target_ms / 1000.0
+        self.levels = levels
+        self.min_level = min_level
+        self.max_level = len(levels) - 1 if max_level is None else max_level
+        self.level = self.max_level if start_level is None else start_level
+        self.ewma = None
+        self.over = 0
+        self.under = 0
+        self.cooldown = 0
+        self.backoff = [1] * len(levels)  # Up-patience multiplier per level
+        self.history = []
+
+    @property
+    def config(self):
+        return self.levels[self.level]
+
+    def detector_names(self):
+        """Detector variants used between min_level and max_level"""
+        return sorted({level["detector"] for level in self.levels[self.min_level:self.max_level + 1]})
+
+    def observe(self, latency, timings=None):
+        """Feed one frame's analysis latency (seconds); returns a change record or None"""
+        if self.cooldown > 0:
+            self.cooldown -= 1
+            return None
+        self.ewma = latency if self.ewma is None else self.ewma + EWMA_ALPHA * (latency - self.ewma)
+
+        self.over = self.over + 1 if self.ewma > self.target * HIGH_WATER else 0
+        self.under = self.under + 1 if self.ewma < self.target * LOW_WATER else 0
+
+        if self.over >= DOWN_PATIENCE and self.level > self.min_level:
+            self.backoff[self.level] = min(self.backoff[self.level] * BACKOFF, MAX_BACKOFF)
+            return self._step(-1, "over target", timings)
+        if self.level < self.max_level and self.under >= UP_PATIENCE * self.backoff[self.level + 1]:
+            return self._step(+1, "headroom", timings)
+        return None
+
+    def _step(self, direction, reason, timings):
+        old = self.levels[self.level]["name"]
+        self.level += direction
+        record = {
+            "time": time.time(),
+            "from": old,
+            "to": self.config["name"],
+            "reason": reason,
+            "latency_ms": round(1000 * self.ewma, 2),
+            "target_ms": round(1000 * self.target, 2),
+            "stage_ms": {k: round(1000 * v, 2) for k, v in (timings or {}).items()},
+            "config": {k: v for k, v in self.config.items() if k != "name"},
+        }
+        self.history.append(record)
+        self.over = self.under = 0
+        self.ewma = None
+        self.cooldown = COOLDOWN
+        return record
+
+class DetectorPool:
+    """Detector variants (cached export, warmed) shared between cameras.
+
+    preload() them at startup: loading one on first use means an export and
+    parity check inside analyze, stalling every camera just when the node is
+    already behind.
+    """
+    def __init__(self, detectors=DETECTORS, fmt=yolo_cache.FORMAT, precision=yolo_cache.PRECISION):
+        self.detectors = detectors
+        self.fmt = fmt
+        self.precision = precision
+        self.models = {}
+
+    def get(self, name):
+        if name not in self.models:
+            weights, imgsz = self.detectors[name]
+            self.models[name] = yolo_cache.load_detector(weights, imgsz, self.fmt, self.precision)
+        return self.models[name], self.detectors[name][1]
+
+    def preload(self, names):
+        for name in names:
+            self.get(name)
+        return self
+
+def apply_level(analyzer, config, detectors=None):
+    """Switch a UnifiedAnalyzer (and its tracker's detector) to a level's settings.
+
+    The tracker must run its own ByteTrack (CrowdTracker(model=...)), so the
+    track IDs survive the detector swap.
+    """
+    analyzer.set_sizes(config["process_size"], config["flow_size"])
+    if detectors is not None and analyzer.tracker is not None:
+        model, imgsz = detectors.get(config["detector"])
+        analyzer.tracker.model = model
+        analyzer.tracker.imgsz = imgsz
+
+def add_arguments(parser):
+    """--target-ms / --min-level / --max-level flags shared by the pipeline scripts"""
+    names = [level["name"] for level in LEVELS]
+    group = parser.add_argument_group("latency controller")
+    group.add_argument("--target-ms", type=float, help="Adapt resolution / detector to keep per-frame latency under this")
+    group.add_argument("--target-fps", type=float, help="Same as --target-ms 1000/FPS")
+    group.add_argument("--min-level", default=names[0], choices=names)
+    group.add_argument("--max-level", default=names[-1], choices=names)
+
+def from_args(args):
+    """LatencyController from the CLI flags, or None when no target is set"""
+    target = args.target_ms if args.target_ms is not None else (1000.0 / args.target_fps if args.target_fps else None)
+    if target is None:
+        return None
+    names = [level["name"] for level in LEVELS]
+    return LatencyController(target, min_level=names.index(args.min_level), max_level=names.index(args.max_level))
@@ -0,0 +1,200 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from panic_lstm import MODEL_PATH as H5_PATH, EXPORT_PATH, WINDOW_SIZE, NUM_FEATURES, THRESHOLD, normalize
+
+# TensorFlow-free runtime for the panic LSTM (resnet-lstm.py: LSTM(64) ->
+# LSTM(32) -> Dense(16, relu) -> Dense(1, sigmoid) on (30, 2) windows).
+#
+# `export` loads the Keras .h5 once, where TensorFlow is still needed, and
+# writes its weights to a small .npz. NumpyLSTM runs the forward pass from
+# that file with numpy alone: startup takes milliseconds and RSS stays at a
+# few tens of MB, compared with seconds and hundreds of MB for importing
+# TensorFlow.
+#
+# The forward pass is batched. Each LSTM layer projects all timesteps of all
+# windows through its input kernel in one matmul; only the recurrent h @ R
+# part runs per step. Gates use the Keras order [input, forget, cell,
+# output], and Dropout is skipped as at inference.
+#
+# --int8 stores the kernels as int8 with one scale per output column, which
+# makes the file about 4x smaller. They are dequantized to float32 on load,
+# so the math is unchanged apart from the rounding. `check` compares either
+# export against Keras on a fixed set of windows.
+
+# --- CONFIGURATION ---
+TOLERANCE = 1e-5        # Max |numpy - keras| confidence for float32 exports
+INT8_TOLERANCE = 2e-2   # ... and for int8 exports
+CHECK_WINDOWS = 256
+SEED = 0
+
+def _sigmoid(x):
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)  # No overflow for large |x|
+
+def lstm_forward(x, kernel, recurrent, bias, return_sequences=False):
+    """(N, T, F) -> (N, T, U) or (N, U) last state; Keras gate order i, f, c, o"""
+    n, steps, _ = x.shape
+    units = recurrent.shape[0]
+    z_in = x @ kernel + bias  # Input projection for every timestep at once: (N, T, 4U)
+    h = np.zeros((n, units), dtype=np.float32)
+    c = np.zeros((n, units), dtype=np.float32)
+    outputs = np.empty((n, steps, units), dtype=np.float32) if return_sequences else None
+    for t in range(steps):
+        z = z_in[:, t] + h @ recurrent
+        i = _sigmoid(z[:, :units])
+        f = _sigmoid(z[:, units:2 * units])
+        g = np.tanh(z[:, 2 * units:3 * units])
+        o = _sigmoid(z[:, 3 * units:])
+        c = f * c + i * g
+        h = o * np.tanh(c)
+        if outputs is not None:
+            outputs[:, t] = h
+    return outputs if return_sequences else h
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0.0),
+    "sigmoid": _sigmoid,
+    "tanh": np.tanh,
+}
+
+class NumpyLSTM:
+    """Drop-in for the loaded Keras model: predict() / predict_on_batch() on (N, 30, 2) windows"""
+    def __init__(self, layers):
+        self.layers = layers  # [(spec dict, {name: float32 array})]
+
+    @classmethod
+    def load(cls, path=EXPORT_PATH):
+        data = np.load(path, allow_pickle=False)
+        specs = json.loads(str(data["spec"]))
+        layers = []
+        for i, spec in enumerate(specs):
+            weights = {}
+            for name in spec["weights"]:
+                if f"{i}.{name}.q" in data:
+                    weights[name] = data[f"{i}.{name}.q"].astype(np.float32) * data[f"{i}.{name}.scale"]
+                else:
+                    weights[name] = data[f"{i}.{name}"].astype(np.float32)
+            layers.append((spec, weights))
+        return cls(layers)
+
+    def predict_on_batch(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        for spec, w in self.layers:
+            if spec["type"] == "lstm":
+                x = lstm_forward(x, w["kernel"], w["recurrent_kernel"], w["bias"], spec["return_sequences"])
+            else:
+                x = ACTIVATIONS[spec["activation"]](x @ w["kernel"] + w["bias"])
+        return x
+
+    def predict(self, x, verbose=0, batch_size=None):
+        return self.predict_on_batch(x)
+
+    __call__ = predict_on_batch
+
+def _quantize(kernel):
+    """Symmetric int8 per output column: (int8 kernel, float32 scales)"""
+    scale = np.abs(kernel).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    return np.round(kernel / scale).astype(np.int8), scale.astype(np.float32)
+
+def export(h5_path=H5_PATH, out_path=EXPORT_PATH, int8=False):
+    """Write the Keras model's weights to out_path (.npz); needs TensorFlow once"""
+    from tensorflow.keras.models import load_model
+    model = load_model(h5_path)
+    specs, arrays = [], {}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in ("Dropout", "InputLayer"):
+            continue
+        config = layer.get_config()
+        if kind == "LSTM":
+            if config.get("activation", "tanh") != "tanh" or config.get("recurrent_activation", "sigmoid") != "sigmoid":
+                raise ValueError(f"{layer.name}: only tanh / sigmoid LSTMs are supported")
+            spec = {"type": "lstm", "units": config["units"], "return_sequences": config["return_sequences"],
+                    "weights": ["kernel", "recurrent_kernel", "bias"]}
+        elif kind == "Dense":
+            if config["activation"] not in ACTIVATIONS:
+                raise ValueError(f"{layer.name}: unsupported activation {config['activation']}")
+            spec = {"type": "dense", "units": config["units"], "activation": config["activation"],
+                    "weights": ["kernel", "bias"]}
+        else:
+            raise ValueError(f"Unsupported layer {layer.name} ({kind})")
+
+        i = len(specs)
+        for name, value in zip(spec["weights"], layer.get_weights()):
+            value = np.asarray(value, dtype=np.float32)
+            if int8 and value.ndim == 2:
+                arrays[f"{i}.{name}.q"], arrays[f"{i}.{name}.scale"] = _quantize(value)
+            else:
+                arrays[f"{i}.{name}"] = value
+        specs.append(spec)
+
+    np.savez(out_path, spec=json.dumps(specs), **arrays)
+    print(f"Exported {len(specs)} layers{' (int8)' if int8 else ''} to {out_path} ({os.path.getsize(out_path) / 1024:.0f} KB)")
+    return out_path
+
+def check_windows(n=CHECK_WINDOWS, seed=SEED):
+    """Fixed parity set: normalized windows of random walks, like the live feature windows"""
+    rng = np.random.default_rng(seed)
+    raw = np.cumsum(rng.normal(size=(n, WINDOW_SIZE, NUM_FEATURES)), axis=1) + rng.random((n, 1, NUM_FEATURES)) * 5
+    return np.stack([np.stack([normalize(w[:, k]) for k in range(NUM_FEATURES)], axis=1) for w in raw]).astype(np.float32)
+
+def check(h5_path=H5_PATH, export_path=EXPORT_PATH, tolerance=None):
+    """Compare an export against Keras; returns (max abs diff, flipped decisions, within tolerance)"""
+    from tensorflow.keras.models import load_model
+    windows = check_windows()
+    expected = load_model(h5_path).predict(windows, verbose=0)[:, 0]
+    model = NumpyLSTM.load(export_path)
+    actual = model.predict(windows)[:, 0]
+    diff = float(np.max(np.abs(actual - expected)))
+    flips = int(np.sum((actual > THRESHOLD) != (expected > THRESHOLD)))
+    if tolerance is None:
+        quantized = any(name.endswith(".q") for name in np.load(export_path).files)
+        tolerance = INT8_TOLERANCE if quantized else TOLERANCE
+    print(f"Parity on {len(windows)} windows: max |diff| {diff:.2e} (tolerance {tolerance:.0e}), "
+          f"{flips} decisions differ")
+    return diff, flips, diff <= tolerance
+
+def main():
+    parser = argparse.ArgumentParser(description="Export / check the NumPy runtime of the panic LSTM")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="Write the .h5 weights to a .npz (needs TensorFlow)")
+    p.add_argument("--h5", default=H5_PATH)
+    p.add_argument("--out", default=EXPORT_PATH)
+    p.add_argument("--int8", action="store_true", help="Store kernels as int8 with per-column scales")
+    p.add_argument("--no-check", action="store_true", help="Skip the parity check after exporting")
+    p = sub.add_parser("check", help="Compare an export against the Keras model (needs TensorFlow)")
+    p.add_argument("--h5", default=H5_PATH)
+    p.add_argument("--export", default=EXPORT_PATH)
+    p.add_argument("--tolerance", type=float)
+    p = sub.add_parser("bench", help="Load time and batched throughput of an export (numpy only)")
+    p.add_argument("--export", default=EXPORT_PATH)
+    p.add_argument("--batch", type=int, default=64)
+    p.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export(args.h5, args.out, args.int8)
+        if not args.no_check and not check(args.h5, args.out)[2]:
+            sys.exit(1)
+    elif args.command == "check":
+        if not check(args.h5, args.export, args.tolerance)[2]:
+            sys.exit(1)
+    else:
+        start = time.perf_counter()
+        model = NumpyLSTM.load(args.export)
+        load_ms = 1000 * (time.perf_counter() - start)
+        windows = np.random.default_rng(SEED).normal(size=(args.batch, WINDOW_SIZE, NUM_FEATURES)).astype(np.float32)
+        model.predict(windows)
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            model.predict(windows)
+        elapsed = time.perf_counter() - start
+        print(f"Load {load_ms:.1f} ms | {args.batch * args.repeats / elapsed:.0f} windows/s at batch {args.batch}")
+
+if __name__ == "__main__":
+    main()
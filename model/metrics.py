@@ -0,0 +1,347 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from collections import deque, Counter
+from logging.handlers import RotatingFileHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Lightweight pipeline instrumentation: per-stage latency histograms,
+# counters (dropped / skipped frames), gauges (queue depths) and per-camera
+# effective FPS. Everything is off by default; while disabled, stage() hands
+# back a shared no-op context manager and count() / frame() return at once,
+# so instrumented code costs one function call per hook.
+#
+#   with metrics.stage("yolo", camera): ...
+#   metrics.count("frames_dropped", n, camera)
+#   metrics.gauge("queue_decoded", q.qsize)
+#   metrics.frame(camera)
+#
+# Exposed via serve() (GET /metrics Prometheus text, /metrics.json) and/or
+# JsonlLogger (periodic snapshots, rotated by size). SamplingProfiler
+# optionally samples Python stacks into a collapsed-stack (flamegraph) file.
+
+# --- CONFIGURATION ---
+ENABLED = os.environ.get("INDRA_NETRA_METRICS", "") == "1"
+BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, float("inf"))  # seconds
+FPS_WINDOW = 5.0        # Seconds of frame timestamps behind the per-camera FPS
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+LOG_INTERVAL = 10.0     # Seconds between JSONL snapshots
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+PROFILE_INTERVAL = 0.005
+
+class Histogram:
+    """Fixed-bucket latency histogram (cumulative, Prometheus-style)"""
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        i = 0
+        while seconds > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Estimate of quantile q, interpolated linearly inside its bucket"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, n in zip(self.buckets, self.counts):
+            if n and seen + n >= target:
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (target - seen) / n
+            seen += n
+            lower = bound
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": 1000.0 * self.sum / self.count if self.count else 0.0,
+            "p50_ms": 1000.0 * self.quantile(0.50),
+            "p95_ms": 1000.0 * self.quantile(0.95),
+            "p99_ms": 1000.0 * self.quantile(0.99),
+            "max_ms": 1000.0 * self.max,
+        }
+
+class _NoopStage:
+    __slots__ = ()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopStage()
+
+class _Stage:
+    __slots__ = ("registry", "key", "start")
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.key, time.perf_counter() - self.start)
+        return False
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.histograms = {}   # (stage, camera) -> Histogram
+        self.counters = Counter()  # (name, camera) -> int
+        self.gauges = {}       # name -> fn() -> number
+        self.frames = {}       # camera -> deque of timestamps
+
+    def observe(self, key, seconds):
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def count(self, key, n):
+        with self.lock:
+            self.counters[key] += n
+
+    def frame(self, camera, now):
+        with self.lock:
+            stamps = self.frames.get(camera)
+            if stamps is None:
+                stamps = self.frames[camera] = deque()
+            stamps.append(now)
+            while stamps and now - stamps[0] > FPS_WINDOW:
+                stamps.popleft()
+
+    def fps(self, now=None):
+        now = time.monotonic() if now is None else now
+        rates = {}
+        with self.lock:
+            for camera, stamps in self.frames.items():
+                recent = [t for t in stamps if now - t <= FPS_WINDOW]
+                rates[camera] = (len(recent) - 1) / (recent[-1] - recent[0]) if len(recent) > 1 and recent[-1] > recent[0] else 0.0
+        return rates
+
+    def snapshot(self):
+        gauges = {}
+        for name, fn in list(self.gauges.items()):
+            try:
+                gauges[name] = fn()
+            except Exception:
+                continue
+        with self.lock:
+            stages = {_label(k): h.snapshot() for k, h in self.histograms.items()}
+            counters = {_label(k): v for k, v in self.counters.items()}
+        return {
+            "time": time.time(),
+            "uptime_s": time.time() - self.started,
+            "stages": stages,
+            "counters": counters,
+            "gauges": gauges,
+            "fps": {str(k): v for k, v in self.fps().items()},
+        }
+
+    def prometheus(self):
+        lines = []
+        with self.lock:
+            hists = list(self.histograms.items())
+            counters = list(self.counters.items())
+        for (stage_name, camera), h in hists:
+            labels = _prom_labels(stage=stage_name, camera=camera)
+            seen = 0
+            for bound, n in zip(h.buckets, h.counts):
+                seen += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"indra_stage_seconds_bucket{{{labels},le=\"{le}\"}} {seen}")
+            lines.append(f"indra_stage_seconds_sum{{{labels}}} {h.sum}")
+            lines.append(f"indra_stage_seconds_count{{{labels}}} {h.count}")
+        for (name, camera), v in counters:
+            lines.append(f"indra_{name}_total{{{_prom_labels(camera=camera)}}} {v}")
+        for name, fn in list(self.gauges.items()):
+            try:
+                lines.append(f"indra_{name} {fn()}")
+            except Exception:
+                continue
+        for camera, fps in self.fps().items():
+            lines.append(f"indra_camera_fps{{{_prom_labels(camera=camera)}}} {fps}")
+        return "\n".join(lines) + "\n"
+
+def _label(key):
+    name, camera = key
+    return name if camera is None else f"{name}[{camera}]"
+
+def _prom_labels(**labels):
+    return ",".join(f'{k}="{v}"' for k, v in labels.items() if v is not None)
+
+REGISTRY = Registry()
+_enabled = ENABLED
+
+# --- HOOKS (cheap no-ops while disabled) ---
+def enabled():
+    return _enabled
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+def stage(name, camera=None):
+    """Context manager timing one pipeline stage"""
+    if not _enabled:
+        return _NOOP
+    return _Stage(REGISTRY, (name, camera))
+
+def count(name, n=1, camera=None):
+    if _enabled and n:
+        REGISTRY.count((name, camera), n)
+
+def gauge(name, fn):
+    """Register fn() -> number, sampled on every snapshot (e.g. a queue's qsize)"""
+    if _enabled:
+        REGISTRY.gauges[name] = fn
+
+def frame(camera=None):
+    """Mark one analyzed frame for camera's effective FPS"""
+    if _enabled:
+        REGISTRY.frame(camera, time.monotonic())
+
+def snapshot():
+    return REGISTRY.snapshot()
+
+# --- EXPORTERS ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, ctype = json.dumps(REGISTRY.snapshot()).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, ctype = REGISTRY.prometheus().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the pipeline's stdout
+
+def serve(host=METRICS_HOST, port=METRICS_PORT):
+    """Start the metrics endpoint in a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    # stderr: some pipelines stream their results on stdout
+    print(f"Metrics on http://{host}:{server.server_address[1]}/metrics", file=sys.stderr)
+    return server
+
+class JsonlLogger:
+    """Appends a snapshot every interval seconds to a size-rotated JSONL file"""
+    def __init__(self, path, interval=LOG_INTERVAL, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-log", daemon=True)
+        self.thread.start()
+
+    def write(self):
+        record = logging.LogRecord("metrics", logging.INFO, __file__, 0, json.dumps(REGISTRY.snapshot()), None, None)
+        self.handler.emit(record)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()  # Final snapshot so short runs are recorded too
+        self.handler.close()
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads every interval seconds.
+
+    Stacks are aggregated as collapsed "thread;file:func;..." lines with
+    counts (flamegraph.pl / speedscope format). Sampling only reads
+    sys._current_frames, so the profiled code is not slowed down beyond the
+    GIL time this thread takes.
+    """
+    def __init__(self, path, interval=PROFILE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-profiler", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self.stopped.wait(self.interval):
+            for ident, top in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                parts = []
+                f = top
+                while f is not None:
+                    code = f.f_code
+                    parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    f = f.f_back
+                parts.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(parts))] += 1
+            self.samples += 1
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        with open(self.path, "w") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        print(f"Profile: {self.samples} samples written to {self.path}", file=sys.stderr)
+
+# --- CLI WIRING ---
+def add_arguments(parser):
+    """--metrics-port / --metrics-log / --profile flags shared by the pipeline scripts"""
+    group = parser.add_argument_group("metrics")
+    group.add_argument("--metrics-port", type=int, help="Serve /metrics on this local port")
+    group.add_argument("--metrics-log", help="Append metrics snapshots to this rotating JSONL file")
+    group.add_argument("--metrics-interval", type=float, default=LOG_INTERVAL)
+    group.add_argument("--profile", help="Write sampled Python stacks (collapsed format) to this file")
+
+def start_from_args(args):
+    """Enable instrumentation if any metrics flag is set; returns a stop() callable"""
+    closers = []
+    if args.metrics_port is not None or args.metrics_log or args.profile:
+        enable()
+    if args.metrics_port is not None:
+        server = serve(port=args.metrics_port)
+        closers.append(server.shutdown)
+    if args.metrics_log:
+        closers.append(JsonlLogger(args.metrics_log, args.metrics_interval).close)
+    if args.profile:
+        closers.append(SamplingProfiler(args.profile).close)
+
+    def stop():
+        for close in reversed(closers):
+            close()
+    return stop
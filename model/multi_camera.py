@@ -0,0 +1,371 @@
+import os
+import json
+import time
+import argparse
+import threading
+import numpy as np
+import cv2
+from feature_buffer import FeatureBufferPool
+from features import FeatureExtractor
+from frame_ring import RingCapture
+from keyframe import KeyframeScheduler, MAX_INTERVAL
+from panic_lstm import MODEL_PATH as LSTM_MODEL_PATH, make_result
+from run_sahi import CrowdTracker, PANIC_ENERGY_THRESH
+from heatmap import MODEL_PATH as DENSITY_MODEL_PATH, CrowdAnalyzer
+from unified_analyzer import UnifiedAnalyzer, PROCESS_SIZE, to_json, log_result
+import metrics
+import detection_store
+import yolo_cache
+import latency_controller
+from density_accumulator import HeatmapStore
+import zones as zone_config
+from unique_counter import merge_counters
+
+# One process watching N cameras with a fixed compute budget (analyses per
+# second across all cameras). Each camera has its own grabber thread that
+# only keeps the newest frame, and its own UnifiedAnalyzer (tracker IDs,
+# flow history, keyframe state); YOLO / CSRNet weights are loaded once and
+# shared. After every analysis the budget is re-split: every camera keeps
+# FLOOR_FPS, and the rest goes to cameras whose panic score or motion energy
+# is high or rising, up to CEIL_FPS each.
+
+# --- CONFIGURATION ---
+COMPUTE_BUDGET = 20.0   # Analyses per second shared by all cameras
+FLOOR_FPS = 0.5         # Minimum analysis rate of a quiet camera
+CEIL_FPS = 15.0         # Maximum analysis rate of a single camera
+RISK_REF = 5.0          # Panic score treated as level 1.0 (heatmap "!!! PANIC !!!")
+MOTION_REF = PANIC_ENERGY_THRESH  # Motion energy treated as level 1.0 (running)
+TREND_GAIN = 4.0        # Extra weight per unit of level rise above its moving average
+QUIET_WEIGHT = 0.05     # Weight of a camera with no activity at all
+EWMA_ALPHA = 0.2
+STATUS_EVERY = 5.0      # Seconds between status lines
+
+def allocate_rates(weights, budget, floor=FLOOR_FPS, ceil=CEIL_FPS):
+    """Split budget (analyses/s) across cameras: floor each, the rest by weight, capped at ceil"""
+    n = len(weights)
+    if n == 0:
+        return []
+    if budget <= n * floor:
+        return [budget / n] * n
+    rates = [floor] * n
+    open_ = [i for i in range(n) if ceil > floor]
+    remaining = budget - n * floor
+    # Water-filling: cameras that hit the ceiling hand their excess to the others
+    while remaining > 1e-9 and open_:
+        total = sum(weights[i] for i in open_)
+        shares = {i: remaining * (weights[i] / total if total > 0 else 1.0 / len(open_)) for i in open_}
+        remaining = 0.0
+        still_open = []
+        for i in open_:
+            rate = rates[i] + shares[i]
+            if rate >= ceil:
+                remaining += rate - ceil
+                rate = ceil
+            else:
+                still_open.append(i)
+            rates[i] = rate
+        open_ = still_open
+    return rates
+
+class LatestFrameGrabber:
+    """Reads a source in its own thread and keeps only the newest frame.
+
+    Video files are read at their own frame rate so they behave like a live
+    camera; "ring:NAME" attaches to a frame_ring.py shared-memory ring.
+    """
+    def __init__(self, source, ring_reader_id=0):
+        if isinstance(source, str) and source.startswith("ring:"):
+            self.cap = RingCapture(source[5:], ring_reader_id, latest=True)
+            self.pace = 0.0
+        else:
+            self.cap = cv2.VideoCapture(source)
+            is_file = isinstance(source, str)
+            fps = self.cap.get(cv2.CAP_PROP_FPS) if is_file else 0
+            self.pace = 1.0 / fps if fps and fps > 0 else 0.0
+        self.lock = threading.Lock()
+        self.frame = None
+        self.seq = 0
+        self.done = False
+        self.thread = threading.Thread(target=self._run, name=f"grab-{source}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        next_t = time.monotonic()
+        try:
+            while not self.done:
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                with self.lock:
+                    self.frame = frame
+                    self.seq += 1
+                if self.pace:
+                    next_t += self.pace
+                    time.sleep(max(0.0, next_t - time.monotonic()))
+        finally:
+            self.done = True
+
+    def latest(self):
+        """(seq, frame) of the newest frame, or (0, None) before the first one"""
+        with self.lock:
+            return self.seq, self.frame
+
+    def release(self):
+        self.done = True
+        self.thread.join(timeout=1.0)
+        self.cap.release()
+
+class CameraState:
+    """Everything kept per camera: grabber, analyzer state and the activity signal"""
+    def __init__(self, camera_id, grabber, analyzer, controller=None):
+        self.camera_id = camera_id
+        self.grabber = grabber
+        self.analyzer = analyzer
+        self.controller = controller  # Optional latency_controller.LatencyController
+        self.rate = FLOOR_FPS
+        self.next_due = 0.0
+        self.last_run = None
+        self.last_seq = 0
+        self.level = 0.0
+        self.level_avg = 0.0
+        self.weight = QUIET_WEIGHT
+        self.analyzed = 0
+        self.skipped = 0
+        self.last_result = None
+
+    def update(self, result):
+        """Fold one result into the activity level; rising levels weigh more than steady ones"""
+        level = max(result.get("risk", 0.0) / RISK_REF, result["motion_energy"] / MOTION_REF)
+        rise = max(0.0, level - self.level_avg)
+        self.level_avg += EWMA_ALPHA * (level - self.level_avg)
+        self.level = level
+        self.weight = QUIET_WEIGHT + level + TREND_GAIN * rise
+        self.last_result = result
+
+class MultiCameraScheduler:
+    """Runs analyses across cameras earliest-deadline-first at budget-derived rates"""
+    def __init__(self, cameras, budget=COMPUTE_BUDGET, floor=FLOOR_FPS, ceil=CEIL_FPS,
+                 buffers=None, lstm_model_path=None, on_result=None, detectors=None):
+        self.cameras = cameras
+        self.budget = budget
+        self.floor = floor
+        self.ceil = ceil
+        self.buffers = buffers if buffers is not None else FeatureBufferPool(max_cameras=max(len(cameras), 1))
+        self.lstm_model_path = lstm_model_path
+        self.lstm = None
+        self.on_result = on_result
+        self.detectors = detectors  # latency_controller.DetectorPool shared by the cameras' controllers
+        self.cost = None  # Moving average of seconds per analysis
+        self.reallocate()
+
+    @property
+    def effective_budget(self):
+        """Never plan more analyses per second than this node can actually run"""
+        if self.cost is None:
+            return self.budget
+        return min(self.budget, 1.0 / max(self.cost, 1e-6))
+
+    def reallocate(self):
+        rates = allocate_rates([c.weight for c in self.cameras], self.effective_budget, self.floor, self.ceil)
+        for camera, rate in zip(self.cameras, rates):
+            camera.rate = rate
+            if camera.last_run is not None:
+                # A faster rate takes effect now, not after the old (longer) interval
+                camera.next_due = min(camera.next_due, camera.last_run + 1.0 / rate)
+
+    def score_lstm(self, buffer):
+        if self.lstm is None:
+            from panic_lstm import load_panic_model
+            self.lstm = load_panic_model(self.lstm_model_path)
+        return make_result(self.lstm.predict_on_batch(buffer.normalized_window()[np.newaxis])[0][0])
+
+    def step(self, camera, now):
+        seq, frame = camera.grabber.latest()
+        if frame is None or seq == camera.last_seq:
+            # Nothing new yet: look again shortly without losing our place
+            camera.next_due = now + min(0.05, 1.0 / camera.rate)
+            return None
+        skipped = max(0, seq - camera.last_seq - 1)
+        camera.skipped += skipped
+        camera.last_seq = seq
+        metrics.count("frames_skipped", skipped, camera.camera_id)
+
+        if camera.analyzer.tracker is not None:
+            # ByteTrack sees this camera at its analysis rate, not the source FPS
+            camera.analyzer.tracker.set_frame_rate(camera.rate)
+        start = time.perf_counter()
+        with metrics.stage("analyze", camera.camera_id):
+            result = camera.analyzer.analyze(frame)
+        elapsed = time.perf_counter() - start
+        metrics.frame(camera.camera_id)
+        self.cost = elapsed if self.cost is None else self.cost + EWMA_ALPHA * (elapsed - self.cost)
+
+        # Per-camera latency target: step resolution / detector for the next analyses
+        if camera.controller is not None:
+            result["level"] = camera.controller.config["name"]
+            change = camera.controller.observe(elapsed, camera.analyzer.timings)
+            if change is not None:
+                latency_controller.apply_level(camera.analyzer, camera.controller.config, self.detectors)
+                result["adjustment"] = change
+                metrics.count("level_changes", 1, camera.camera_id)
+                print(f"{camera.camera_id}: level {change['from']} -> {change['to']} ({change['reason']}, "
+                      f"{change['latency_ms']:.0f} ms vs {change['target_ms']:.0f} ms target)")
+
+        # Per-camera LSTM history (features are sampled at the camera's current rate)
+        if "features" in result:
+            f = result["features"]
+            buffer = self.buffers.push(camera.camera_id, f["motion_energy"], f["flux_of_count"], now)
+            if self.lstm_model_path and buffer.is_full:
+                result["lstm"] = self.score_lstm(buffer)
+
+        camera.analyzed += 1
+        camera.last_run = now
+        camera.update(result)
+        self.reallocate()
+        camera.next_due = now + 1.0 / camera.rate
+
+        result["camera_id"] = camera.camera_id
+        result["analysis_fps"] = camera.rate
+        if self.on_result is not None:
+            self.on_result(camera, result)
+        return result
+
+    def run(self, duration=None):
+        start = time.monotonic()
+        last_status = start
+        for camera in self.cameras:
+            camera.next_due = start
+        while True:
+            live = [c for c in self.cameras if not (c.grabber.done and c.grabber.seq == c.last_seq)]
+            if not live:
+                break
+            now = time.monotonic()
+            if duration is not None and now - start > duration:
+                break
+            camera = min(live, key=lambda c: c.next_due)
+            if camera.next_due > now:
+                time.sleep(camera.next_due - now)
+                now = time.monotonic()
+            self.step(camera, now)
+
+            if now - last_status >= STATUS_EVERY:
+                last_status = now
+                print(self.summary())
+
+    def summary(self):
+        parts = [f"{c.camera_id}: {c.rate:.1f}/s lvl {c.level:.2f}" for c in self.cameras]
+        cost = f"{1000 * self.cost:.0f} ms/analysis" if self.cost is not None else "-"
+        return f"Budget {self.effective_budget:.1f}/s ({cost}) | Unique {self.unique_count()} | " + " | ".join(parts)
+
+    def unique_count(self, seconds=None):
+        """Unique track IDs across all cameras (merged sketches), since start or over the last seconds"""
+        merged = merge_counters([c.analyzer.unique_ids for c in self.cameras], seconds)
+        return int(round(merged.estimate()))
+
+def parse_source(source):
+    return int(source) if source.isdigit() else source
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze many cameras in one process under a shared compute budget")
+    parser.add_argument("sources", nargs="+", help="Camera indices, video paths or ring:NAME shared-memory rings")
+    parser.add_argument("--budget", type=float, default=COMPUTE_BUDGET, help="Total analyses per second")
+    parser.add_argument("--floor", type=float, default=FLOOR_FPS, help="Minimum analyses per second per camera")
+    parser.add_argument("--ceil", type=float, default=CEIL_FPS, help="Maximum analyses per second per camera")
+    parser.add_argument("--results", help="JSONL file with one line per analysis")
+    parser.add_argument("--weights", default=DENSITY_MODEL_PATH, help="CSRNet weights")
+    parser.add_argument("--no-tracks", action="store_true", help="Skip YOLO tracking")
+    parser.add_argument("--no-density", action="store_true", help="Skip CSRNet density")
+    parser.add_argument("--lstm", action="store_true", help="Score full per-camera windows with the panic LSTM")
+    parser.add_argument("--keyframes", action="store_true", help="Only run YOLO/CSRNet when a camera's scene changes")
+    parser.add_argument("--max-keyframe-interval", type=int, default=MAX_INTERVAL)
+    parser.add_argument("--size", type=int, nargs=2, default=PROCESS_SIZE, metavar=("W", "H"))
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--store", help="Append per-frame records to this detection store directory")
+    parser.add_argument("--heatmap-dir", help="Keep rolling cumulative density heatmaps per camera here")
+    parser.add_argument("--zones", help="Zone config JSON keyed by camera id (cam0, cam1, ...)")
+    parser.add_argument("--unique-dir", help="Save each camera's unique-count sketch here (merge with unique_counter.py)")
+    metrics.add_arguments(parser)
+    yolo_cache.add_arguments(parser)
+    latency_controller.add_arguments(parser)
+    args = parser.parse_args()
+    stop_metrics = metrics.start_from_args(args)
+
+    # Weights are loaded once; everything with per-camera state is created per camera
+    probe = latency_controller.from_args(args)
+    adaptive = probe is not None
+    detectors = None
+    if adaptive and not args.no_tracks:
+        # Every variant the controllers may step to is loaded and warmed before the cameras start
+        detectors = latency_controller.DetectorPool(fmt=args.yolo_format, precision=args.yolo_precision)
+        detectors.preload(probe.detector_names())
+    yolo = None
+    if not args.no_tracks and not adaptive:
+        yolo = yolo_cache.load_detector(args.yolo_weights, args.yolo_imgsz, args.yolo_format, args.yolo_precision)
+    density = None if args.no_density else CrowdAnalyzer(args.weights)
+    extractor = FeatureExtractor(["motion_energy", "flux_of_count"])
+
+    zone_configs = zone_config.load_zones(args.zones) if args.zones else {}
+    cameras = []
+    for i, source in enumerate(args.sources):
+        camera_id = f"cam{i}"
+        controller = latency_controller.from_args(args)
+        tracker = None
+        if controller is not None and not args.no_tracks:
+            model, imgsz = detectors.get(controller.config["detector"])
+            tracker = CrowdTracker(model=model, imgsz=imgsz)
+        elif yolo is not None:
+            tracker = CrowdTracker(model=yolo, imgsz=args.yolo_imgsz)
+        scheduler = KeyframeScheduler(max_interval=args.max_keyframe_interval) if args.keyframes else None
+        zones = None
+        if camera_id in zone_configs:
+            config_size, zone_list = zone_configs[camera_id]
+            zones = zone_config.ZoneAggregator(zone_config.scale_zones(zone_list, config_size, args.size), args.size)
+        analyzer = UnifiedAnalyzer(tracker, density, extractor, process_size=args.size, scheduler=scheduler, zones=zones,
+                                   camera=camera_id)
+        if controller is not None:
+            latency_controller.apply_level(analyzer, controller.config, detectors)
+        cameras.append(CameraState(camera_id, LatestFrameGrabber(parse_source(source)), analyzer, controller))
+
+    results = open(args.results, "w") if args.results else None
+    logs = {c.camera_id: detection_store.DetectionLog(args.store, c.camera_id) for c in cameras} if args.store else {}
+    heatmaps = HeatmapStore(args.heatmap_dir) if args.heatmap_dir else None
+    def on_result(camera, result):
+        if heatmaps is not None and "density_map" in result:
+            heatmaps.update(camera.camera_id, result["density_map"])
+        if results is not None:
+            results.write(json.dumps(to_json(result)) + "\n")
+        if camera.camera_id in logs:
+            log_result(logs[camera.camera_id], time.time(), result)
+
+    scheduler = MultiCameraScheduler(cameras, args.budget, args.floor, args.ceil,
+                                     lstm_model_path=LSTM_MODEL_PATH if args.lstm else None,
+                                     on_result=on_result, detectors=detectors)
+    for camera in cameras:
+        metrics.gauge(f"analysis_rate_{camera.camera_id}", lambda c=camera: c.rate)
+    print(f"Watching {len(cameras)} cameras with a budget of {args.budget:.1f} analyses/s")
+    try:
+        scheduler.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for camera in cameras:
+            camera.grabber.release()
+        if results is not None:
+            results.close()
+        for log in logs.values():
+            log.close()
+        if heatmaps is not None:
+            heatmaps.flush()
+        stop_metrics()
+
+    if args.unique_dir:
+        os.makedirs(args.unique_dir, exist_ok=True)
+    for camera in cameras:
+        print(f"{camera.camera_id}: {camera.analyzed} analyzed, {camera.skipped} frames skipped, "
+              f"{camera.analyzer.unique_ids.estimate()} unique")
+        if args.unique_dir:
+            camera.analyzer.unique_ids.save(os.path.join(args.unique_dir, f"{camera.camera_id}.npz"))
+    print(f"Unique across cameras: {scheduler.unique_count()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+
+# --- CONFIGURATION ---
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(MODEL_DIR, "panic_lstm_model.h5")
+# NumPy export of MODEL_PATH (`python lstm_runtime.py export`); used instead
+# of the .h5 when present and at least as new, so TensorFlow is not imported
+EXPORT_PATH = os.path.join(MODEL_DIR, "panic_lstm_model.npz")
+
+# Must match input_shape in resnet-lstm.py
+WINDOW_SIZE = 30
+NUM_FEATURES = 2
+THRESHOLD = 0.5
+
+def normalize(values):
+    """Zero-mean / unit-variance normalization of one feature window"""
+    return (values - values.mean()) / (values.std() + 1e-7)
+
+def build_window(motion_energy, flux_of_count):
+    """Turn raw feature lists into a normalized (30, 2) float32 window"""
+    motion_energy = np.asarray(motion_energy, dtype=np.float32)
+    flux_of_count = np.asarray(flux_of_count, dtype=np.float32)
+
+    if motion_energy.shape != (WINDOW_SIZE,) or flux_of_count.shape != (WINDOW_SIZE,):
+        raise ValueError(f"Expected {WINDOW_SIZE} values for motion_energy and flux_of_count")
+
+    # Stack features: (30, 2)
+    return np.stack([normalize(motion_energy), normalize(flux_of_count)], axis=1)
+
+def exported_path(model_path):
+    """The .npz export next to an .h5 model if it exists and is not older, else None"""
+    if model_path.endswith(".npz"):
+        return model_path
+    path = os.path.splitext(model_path)[0] + ".npz"
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(model_path):
+        return path
+    return None
+
+def load_panic_model(model_path=MODEL_PATH, runtime="auto"):
+    """Load the LSTM: the NumPy runtime for an export ("auto" / "numpy"), else Keras.
+
+    Both have predict() and predict_on_batch(). TensorFlow is only imported
+    for the Keras path.
+    """
+    path = exported_path(model_path) if runtime != "keras" else None
+    if path is not None:
+        from lstm_runtime import NumpyLSTM
+        return NumpyLSTM.load(path)
+    if runtime == "numpy":
+        raise FileNotFoundError(f"No NumPy export of {model_path}; run `python lstm_runtime.py export`")
+    from tensorflow.keras.models import load_model
+    return load_model(model_path)
+
+def make_result(confidence, threshold=THRESHOLD):
+    """Response payload shared by the CLI and the inference server"""
+    confidence = float(confidence)
+    return {
+        "panic_detected": bool(confidence > threshold),
+        "confidence": confidence,
+        "threshold": threshold
+    }
+
+def error_result(e):
+    """Safe default returned when inference fails"""
+    return {
+        "panic_detected": False,
+        "confidence": 0.5,
+        "error": str(e)
+    }
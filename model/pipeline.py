@@ -0,0 +1,137 @@
+import threading
+import queue
+import metrics
+
+# --- CONFIGURATION ---
+QUEUE_SIZE = 8  # Frames buffered between stages; a full queue blocks the stage before it
+
+_DONE = object()
+
+class VideoPipeline:
+    """Threaded reader -> analysis -> render/writer pipeline for offline video jobs.
+
+    Decoding (cap.read + preprocess) and rendering/encoding (HUD + VideoWriter)
+    run in their own threads while analysis runs on the calling thread, so the
+    model is never idle waiting on I/O. Each stage is a single thread fed by a
+    bounded FIFO queue, which preserves frame order and applies backpressure.
+    OpenCV and torch release the GIL in their heavy calls, so the stages overlap.
+
+    With batch_size > 1 the analysis stage takes up to batch_size consecutive
+    frames at a time and hands them to analyze_batch (one batched model call).
+    """
+    def __init__(self, analyze, render, preprocess=None, queue_size=QUEUE_SIZE, batch_size=1, analyze_batch=None):
+        self.analyze = analyze          # frame -> result
+        self.render = render            # (frame, result) -> None (draw + write)
+        self.preprocess = preprocess    # frame -> frame (e.g. resize), runs in the reader thread
+        self.analyze_batch = analyze_batch  # [frames] -> [results], in order
+        self.batch_size = max(1, batch_size)
+        self.queue_size = max(queue_size, self.batch_size)
+        self.frames = 0
+
+    def _put(self, q, item):
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _next_batch(self):
+        """Up to batch_size decoded frames; empty once the reader is done"""
+        frames = []
+        while len(frames) < self.batch_size and not self.drained:
+            frame = self._get(self.decoded)
+            if frame is _DONE:
+                self.drained = True
+            else:
+                frames.append(frame)
+        return frames
+
+    def _analyze(self, frames):
+        if self.analyze_batch is not None:
+            return self.analyze_batch(frames)
+        return [self.analyze(frame) for frame in frames]
+
+    def _fail(self, e):
+        if self.error is None:
+            self.error = e
+        self.stop.set()
+
+    def _reader(self, cap):
+        try:
+            while not self.stop.is_set():
+                with metrics.stage("decode"):
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                if self.preprocess is not None:
+                    with metrics.stage("preprocess"):
+                        frame = self.preprocess(frame)
+                if not self._put(self.decoded, frame):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(self.decoded, _DONE)
+
+    def _writer(self):
+        try:
+            while True:
+                item = self._get(self.analyzed)
+                if item is _DONE:
+                    return
+                frame, result = item
+                with metrics.stage("render"):
+                    self.render(frame, result)
+        except Exception as e:
+            self._fail(e)
+
+    def run(self, cap):
+        """Process every frame of cap; returns the number of frames written"""
+        self.stop = threading.Event()
+        self.error = None
+        self.decoded = queue.Queue(maxsize=self.queue_size)
+        self.analyzed = queue.Queue(maxsize=self.queue_size)
+        self.frames = 0
+        self.drained = False
+        metrics.gauge("queue_decoded", self.decoded.qsize)
+        metrics.gauge("queue_analyzed", self.analyzed.qsize)
+
+        reader = threading.Thread(target=self._reader, args=(cap,), name="pipeline-reader", daemon=True)
+        writer = threading.Thread(target=self._writer, name="pipeline-writer", daemon=True)
+        reader.start()
+        writer.start()
+
+        try:
+            while True:
+                frames = self._next_batch()
+                if not frames:
+                    break
+                with metrics.stage("analyze"):
+                    results = self._analyze(frames)
+                # A failed put means stop is set, so the next batch comes back empty
+                for frame, result in zip(frames, results):
+                    if not self._put(self.analyzed, (frame, result)):
+                        break
+                    self.frames += 1
+                    metrics.frame()
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(self.analyzed, _DONE)
+            writer.join()
+            self.stop.set()
+            reader.join()
+
+        if self.error is not None:
+            raise self.error
+        return self.frames
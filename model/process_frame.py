@@ -1,69 +1,185 @@
 import sys
 import json
+import struct
+import argparse
+import threading
+import socketserver
 import numpy as np
-import cv2
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-
-MODEL_PATH = "panic_lstm_model.h5"
-
-def preprocess_frame(frame):
-    """Preprocess frame for feature extraction"""
-    if len(frame.shape) == 3:
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = frame
-    
-    return gray
-
-def extract_motion_energy(frame):
-    """Calculate optical flow magnitude (motion energy)"""
-    gray = preprocess_frame(frame)
-    laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-    motion_energy = np.sum(np.abs(laplacian)) / (gray.shape[0] * gray.shape[1])
-    return float(motion_energy)
-
-def extract_flux_of_count(frame):
-    """Calculate crowd density approximation"""
-    gray = preprocess_frame(frame)
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    _, thresh = cv2.threshold(blurred, 127, 255, cv2.THRESH_BINARY)
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    flux_of_count = len(contours)
-    return float(flux_of_count)
-
-try:
-    # Read frame from stdin
-    frame_bytes = sys.stdin.buffer.read()
-    frame_array = np.frombuffer(frame_bytes, dtype=np.uint8)
-    frame = cv2.imdecode(frame_array, cv2.IMREAD_COLOR)
-    
-    if frame is None:
-        raise ValueError("Could not decode frame")
-    
-    # Extract features
-    motion_energy = extract_motion_energy(frame)
-    flux_of_count = extract_flux_of_count(frame)
-    
-    # For now, use simple threshold
-    # In production, accumulate 30 timesteps and use LSTM
-    confidence = min(motion_energy / 100.0, 1.0)
-    panic_detected = confidence > 0.7
-    
-    result = {
-        "panic_detected": bool(panic_detected),
-        "confidence": confidence,
-        "motion_energy": motion_energy,
-        "flux_of_count": flux_of_count
-    }
-    
-    print(json.dumps(result))
-    
-except Exception as e:
-    result = {
-        "panic_detected": False,
-        "confidence": 0.5,
-        "error": str(e)
-    }
-    print(json.dumps(result), file=sys.stderr)
-    sys.exit(1)
+from feature_buffer import FeatureBufferPool
+from features import FeatureExtractor, decode_frame
+from panic_lstm import MODEL_PATH, make_result
+import metrics
+
+# Streaming mode wire format (repeated until EOF):
+#   !HI header: camera id length (uint16), frame length (uint32), big-endian
+#   camera id (utf-8), then the encoded frame (JPEG/PNG bytes)
+# One JSON line is written per frame. A zero-length frame resets that camera.
+FRAME_HEADER = struct.Struct("!HI")
+
+class FrameProcessor:
+    """Keeps per-camera feature history between frames; the LSTM is loaded on first use"""
+    def __init__(self, use_lstm=False, model_path=MODEL_PATH, runtime="auto"):
+        self.use_lstm = use_lstm
+        self.model_path = model_path
+        self.runtime = runtime
+        self.model = None
+        self.buffers = FeatureBufferPool()
+        self.extractor = FeatureExtractor(["motion_energy", "flux_of_count"])
+
+    def process(self, frame_bytes, camera_id=None):
+        with metrics.stage("decode", camera_id):
+            frame = decode_frame(frame_bytes)
+
+        # Extract features (single gray conversion, shared buffers)
+        with metrics.stage("features", camera_id):
+            features = self.extractor.extract(frame)
+        metrics.frame(camera_id)
+        motion_energy = features["motion_energy"]
+        flux_of_count = features["flux_of_count"]
+
+        result = None
+        if camera_id is not None:
+            buffer = self.buffers.push(camera_id, motion_energy, flux_of_count)
+            if self.use_lstm and buffer.is_full:
+                with metrics.stage("lstm", camera_id):
+                    result = make_result(self.predict(buffer.normalized_window()))
+
+        if result is None:
+            # Simple threshold until 30 timesteps are accumulated (or without --lstm)
+            confidence = min(motion_energy / 100.0, 1.0)
+            panic_detected = confidence > 0.7
+
+            result = {
+                "panic_detected": bool(panic_detected),
+                "confidence": confidence
+            }
+
+        result["motion_energy"] = motion_energy
+        result["flux_of_count"] = flux_of_count
+        result["features"] = features  # Same values, under the key backfill.py reads
+        if camera_id is not None:
+            result["camera_id"] = camera_id
+        return result
+
+    def predict(self, window):
+        if self.model is None:
+            # Loaded on first use; TensorFlow is only imported without a NumPy export
+            from panic_lstm import load_panic_model
+            self.model = load_panic_model(self.model_path, self.runtime)
+        return self.model.predict_on_batch(window[np.newaxis])[0][0]
+
+def read_exact(stream, n):
+    data = stream.read(n)
+    while data is not None and 0 < len(data) < n:
+        chunk = stream.read(n - len(data))
+        if not chunk:
+            break
+        data += chunk
+    if not data:
+        return None
+    if len(data) < n:
+        raise EOFError("Truncated frame")
+    return data
+
+def read_frames(stream):
+    """Yield (camera_id, frame_bytes) from a length-prefixed stream until EOF"""
+    while True:
+        header = read_exact(stream, FRAME_HEADER.size)
+        if header is None:
+            return
+        id_len, frame_len = FRAME_HEADER.unpack(header)
+        camera_id = read_body(stream, id_len).decode("utf-8") if id_len else ""
+        frame_bytes = read_body(stream, frame_len) if frame_len else b""
+        yield camera_id, frame_bytes
+
+def read_body(stream, n):
+    """Like read_exact, but EOF after a header is a truncated frame, not a clean end"""
+    data = read_exact(stream, n)
+    if data is None:
+        raise EOFError("Truncated frame")
+    return data
+
+def serve_stream(rfile, wfile, processor, lock=None):
+    """Process frames until EOF, writing one JSON line per frame; a truncated frame ends the client"""
+    lock = lock or threading.Lock()
+    frames = read_frames(rfile)
+    while True:
+        try:
+            camera_id, frame_bytes = next(frames)
+        except StopIteration:
+            return
+        except EOFError as e:
+            print(f"Stream ended mid-frame: {e}", file=sys.stderr)
+            return
+        try:
+            with lock:
+                if not frame_bytes:
+                    processor.buffers.reset(camera_id)
+                    result = {"camera_id": camera_id, "reset": True}
+                else:
+                    result = processor.process(frame_bytes, camera_id)
+        except Exception as e:
+            result = {
+                "panic_detected": False,
+                "confidence": 0.5,
+                "camera_id": camera_id,
+                "error": str(e)
+            }
+        wfile.write((json.dumps(result) + "\n").encode("utf-8"))
+        wfile.flush()
+
+def serve_socket(path, processor):
+    """Accept streaming clients on a local Unix socket; camera state is shared"""
+    lock = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                serve_stream(self.rfile, self.wfile, processor, lock)
+            except (EOFError, ConnectionError) as e:
+                print(f"Client disconnected: {e}", file=sys.stderr)
+
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+        server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-frame panic features (one-shot or streaming)")
+    parser.add_argument("--stream", action="store_true", help="Read length-prefixed frames from stdin until EOF")
+    parser.add_argument("--socket", help="Serve the streaming protocol on this Unix socket path")
+    parser.add_argument("--lstm", action="store_true", help="Score full 30-frame windows with the panic LSTM")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--runtime", choices=("auto", "numpy", "keras"), default="auto",
+                        help="auto: NumPy runtime if the model has an up-to-date export, else Keras")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+
+    processor = FrameProcessor(use_lstm=args.lstm, model_path=args.model, runtime=args.runtime)
+
+    if args.socket or args.stream:
+        stop_metrics = metrics.start_from_args(args)
+        try:
+            if args.socket:
+                serve_socket(args.socket, processor)
+            else:
+                serve_stream(sys.stdin.buffer, sys.stdout.buffer, processor)
+        finally:
+            stop_metrics()
+        return
+
+    try:
+        # Read a single frame from stdin
+        frame_bytes = sys.stdin.buffer.read()
+        result = processor.process(frame_bytes)
+        print(json.dumps(result))
+
+    except Exception as e:
+        result = {
+            "panic_detected": False,
+            "confidence": 0.5,
+            "error": str(e)
+        }
+        print(json.dumps(result), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
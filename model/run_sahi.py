@@ -1,10 +1,19 @@
+import time
+import argparse
 import cv2
 import numpy as np
 from collections import deque, defaultdict
-from ultralytics import YOLO
-from sahi import AutoDetectionModel
-from sahi.predict import get_sliced_prediction
-from sahi.utils.cv import visualize_object_predictions
+from ultralytics.engine.results import Boxes
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import YAML, IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
+from sahi.slicing import get_slice_bboxes
+from keyframe import KeyframeScheduler, MAX_INTERVAL
+from pipeline import VideoPipeline
+import metrics
+import detection_store
+import yolo_cache
+from unique_counter import UniqueCounter
 
 # --- CONFIGURATION ---
 VIDEO_PATH = r"D:\indra_netra\model\vid.mp4"
@@ -17,14 +26,182 @@ CONF_THRESHOLD = 0.25
 PANIC_ENERGY_THRESH = 3.5  # Optical Flow Speed > 3.5 = Running
 PANIC_FLUX_THRESH = 10     # > 10 people entering/leaving per second = Rush
 
+# SLICED INFERENCE (small / distant people in dense crowds)
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2
+TILE_CHANGE_THRESH = 3.0   # Mean abs gray diff (0-255) of a tile thumbnail; below this cached detections are reused
+TILE_THUMB_SIZE = 32
+MERGE_THRESH = 0.5         # Intersection-over-smaller above which overlapping tile detections are merged
+
+# TRACKING
+FRAME_RATE = 30            # Frames per second given to the tracker when the caller doesn't know better
+TRACK_BUFFER_FPS = 30.0    # bytetrack.yaml's track_buffer counts frames at this rate
+GAP_ALPHA = 0.2            # EWMA weight of the frames-per-update gap (keyframe gating)
+
+def merge_detections(dets, match_thresh=MERGE_THRESH):
+    """Greedy NMS on (N, 6) [x1, y1, x2, y2, conf, cls] using intersection over the smaller box.
+
+    IoS rather than IoU so a person cut in half by a tile border is absorbed
+    by the full box from the neighbouring tile.
+    """
+    if len(dets) == 0:
+        return dets
+    order = np.argsort(-dets[:, 4])
+    dets = dets[order]
+    areas = (dets[:, 2] - dets[:, 0]) * (dets[:, 3] - dets[:, 1])
+    keep = np.ones(len(dets), dtype=bool)
+    for i in range(len(dets)):
+        if not keep[i]:
+            continue
+        rest = np.nonzero(keep[i + 1:])[0] + i + 1
+        if len(rest) == 0:
+            break
+        iw = np.clip(np.minimum(dets[i, 2], dets[rest, 2]) - np.maximum(dets[i, 0], dets[rest, 0]), 0, None)
+        ih = np.clip(np.minimum(dets[i, 3], dets[rest, 3]) - np.maximum(dets[i, 1], dets[rest, 1]), 0, None)
+        ios = iw * ih / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        keep[rest[ios > match_thresh]] = False
+    return dets[keep]
+
+class TiledDetector:
+    """Person detection over overlapping tiles, sent to YOLO as one batch.
+
+    Each tile keeps a small gray thumbnail from the last time it was
+    inferred; tiles whose content has barely changed since then reuse their
+    cached detections instead of being re-run.
+    """
+    def __init__(self, model, tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+                 change_thresh=TILE_CHANGE_THRESH, conf=CONF_THRESHOLD):
+        self.model = model
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.change_thresh = change_thresh
+        self.conf = conf
+        self.frame_shape = None
+        self.tiles = []
+        self.thumbs = []
+        self.cache = []
+        self.tiles_inferred = 0
+        self.tiles_reused = 0
+
+    def _plan(self, shape):
+        h, w = shape[:2]
+        self.frame_shape = shape
+        self.tiles = get_slice_bboxes(
+            image_height=h, image_width=w,
+            slice_height=min(self.tile_size, h), slice_width=min(self.tile_size, w),
+            overlap_height_ratio=self.overlap, overlap_width_ratio=self.overlap,
+        )
+        self.thumbs = [None] * len(self.tiles)
+        self.cache = [np.empty((0, 6), dtype=np.float32)] * len(self.tiles)
+
+    def detect(self, frame):
+        """Returns merged (N, 6) [x1, y1, x2, y2, conf, cls] detections in frame coordinates"""
+        if frame.shape != self.frame_shape:
+            self._plan(frame.shape)
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        stale = []
+        for i, (x1, y1, x2, y2) in enumerate(self.tiles):
+            thumb = cv2.resize(gray[y1:y2, x1:x2], (TILE_THUMB_SIZE, TILE_THUMB_SIZE), interpolation=cv2.INTER_AREA)
+            prev = self.thumbs[i]
+            if prev is None or cv2.norm(thumb, prev, cv2.NORM_L1) / thumb.size > self.change_thresh:
+                stale.append(i)
+                self.thumbs[i] = thumb
+
+        if stale:
+            crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in (self.tiles[i] for i in stale)]
+            # A list source is run through the network as a single batch
+            with metrics.stage("yolo"):
+                results = self.model.predict(crops, imgsz=self.tile_size, conf=self.conf, classes=0, verbose=False)
+            for i, result in zip(stale, results):
+                dets = result.boxes.data.cpu().numpy().astype(np.float32)
+                dets[:, [0, 2]] += self.tiles[i][0]
+                dets[:, [1, 3]] += self.tiles[i][1]
+                self.cache[i] = dets
+
+        self.tiles_inferred += len(stale)
+        self.tiles_reused += len(self.tiles) - len(stale)
+        return merge_detections(np.concatenate(self.cache))
+
+def motion_energy_from_flow(mag):
+    """Mean optical-flow speed, ignoring low-speed noise (mag < 2)"""
+    valid_motion = mag[mag > 2.0]
+    if len(valid_motion) == 0: return 0.0
+    return np.mean(valid_motion)
+
+def classify_motion(motion_energy, flux):
+    status = "NORMAL"
+    color = (0, 255, 0)
+    
+    is_running = motion_energy > PANIC_ENERGY_THRESH
+    is_rushing = flux > PANIC_FLUX_THRESH
+
+    if is_running and is_rushing:
+        status = "!!! PANIC: STAMPEDE DETECTED !!!"
+        color = (0, 0, 255) # Red
+    elif is_running:
+        status = "WARNING: HIGH SPEED (RUNNING)"
+        color = (0, 165, 255) # Orange
+    elif is_rushing:
+        status = "WARNING: SUDDEN INFLUX"
+        color = (255, 255, 0) # Yellow
+    return status, color
+
+def model_trackers(model):
+    """Trackers model.track keeps on the model (created at a fixed 30 FPS on its first call)"""
+    return getattr(getattr(model, "predictor", None), "trackers", None) or []
+
+def rescale_track_buffer(trackers, updates_per_second):
+    """ByteTrack keeps lost tracks for track_buffer *updates* at 30 FPS; keep
+    that many seconds at the rate the trackers are actually updated"""
+    for tracker in trackers:
+        tracker.max_time_lost = max(1, int(updates_per_second / TRACK_BUFFER_FPS * tracker.args.track_buffer))
+
 class CrowdTracker:
-    def __init__(self):
+    def __init__(self, sliced=False, tile_size=TILE_SIZE, tile_overlap=TILE_OVERLAP, scheduler=None, model=None,
+                 model_path=yolo_cache.WEIGHTS, camera="cam0", yolo_format=yolo_cache.FORMAT,
+                 precision=yolo_cache.PRECISION, imgsz=yolo_cache.IMGSZ, frame_rate=FRAME_RATE):
         # Load Standard YOLO for Tracking (SAHI doesn't support tracking IDs easily)
         # We will use standard YOLO with high resolution inference for tracking
-        self.model = YOLO(MODEL_PATH)
+        # A YOLO instance passed in may be shared by several trackers (one per camera)
+        self.shared_model = model is not None
+        # Otherwise the cached export for this input size is loaded and warmed up
+        # (tiles are the input when sliced, so the export is made at tile size)
+        if model is None:
+            model = yolo_cache.load_detector(model_path, tile_size if sliced else imgsz, yolo_format, precision)
+        self.model = model
+        self.imgsz = imgsz
+        # (sx, sy) from frame pixels to output pixels, set when the caller
+        # resizes frames on the fly. Returned boxes are always in output pixels.
+        # Our own ByteTrack (sliced / shared model) is fed output-pixel boxes;
+        # model.track keeps its state in frame pixels, which is equivalent since
+        # ByteTrack's IoU matching is scale-invariant.
+        self.output_scale = None
+
+        # Sliced mode: tiled detections are fed to our own ByteTrack instance
+        # so IDs persist exactly as with model.track(persist=True). A shared
+        # model does the same, since model.track keeps one tracker per model.
+        self.detector = None
+        if sliced:
+            self.detector = TiledDetector(self.model, tile_size, tile_overlap)
+        if sliced or self.shared_model:
+            cfg = IterableSimpleNamespace(**YAML.load(check_yaml("bytetrack.yaml")))
+            self.byte_tracker = BYTETracker(args=cfg, frame_rate=frame_rate)
+
+        # ByteTrack keeps lost tracks for a number of *updates*. It is rescaled
+        # to the rate the tracker actually runs at: frames offered per second
+        # (set_frame_rate) divided by the frames between updates (keyframes).
+        self.frame_rate = frame_rate
+        self.gap = 1.0
+        self.since_track = 0
+
+        # Optional KeyframeScheduler: YOLO only runs on keyframes, other
+        # frames reuse the last tracks (motion energy is still computed every frame)
+        self.scheduler = scheduler
+        self.last_tracks = None
         
         # State Variables
-        self.unique_ids = set()       # Store all unique IDs seen
+        self.unique_ids = UniqueCounter(camera)  # Unique IDs seen (fixed-size sketch, lost IDs expire)
         self.current_ids = set()      # IDs in the current frame
         self.prev_gray = None
         self.history_flux = deque(maxlen=30) 
@@ -38,36 +215,112 @@ class CrowdTracker:
             self.prev_gray = gray
             return 0.0
             
-        flow = cv2.calcOpticalFlowFarneback(self.prev_gray, gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        with metrics.stage("flow"):
+            flow = cv2.calcOpticalFlowFarneback(self.prev_gray, gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
         mag, _ = cv2.cartToPolar(flow[..., 0], flow[..., 1])
         self.prev_gray = gray
         
-        # Filter low-speed noise (mag < 2)
-        valid_motion = mag[mag > 2.0]
-        if len(valid_motion) == 0: return 0.0
-        return np.mean(valid_motion)
+        return motion_energy_from_flow(mag)
+
+    def set_frame_rate(self, frame_rate):
+        """Frames per second offered to process_frame / track (video FPS, or a camera's analysis rate)"""
+        self.frame_rate = frame_rate
+
+    def sync_track_buffer(self, frames):
+        """Fold frames since the last update into the gap and rescale the trackers' lost-track buffer"""
+        self.gap += GAP_ALPHA * (frames - self.gap)
+        self.rescale_track_buffer()
+
+    def rescale_track_buffer(self):
+        if self.detector is not None or self.shared_model:
+            trackers = [self.byte_tracker]
+        else:
+            trackers = model_trackers(self.model)
+        rescale_track_buffer(trackers, self.frame_rate / max(self.gap, 1.0))
+
+    def to_output(self, boxes):
+        """Frame-pixel xyxy boxes (first four columns) scaled by output_scale"""
+        if self.output_scale is None or len(boxes) == 0:
+            return boxes
+        sx, sy = self.output_scale
+        boxes = np.array(boxes, dtype=np.float32)
+        boxes[:, [0, 2]] *= sx
+        boxes[:, [1, 3]] *= sy
+        return boxes
+
+    def track_sliced(self, frame):
+        """Tiled detection + ByteTrack; returns (ids, boxes) like model.track"""
+        return self.track_detections(frame, self.to_output(self.detector.detect(frame)))
+
+    def track_detections(self, frame, dets):
+        """ByteTrack update with (N, 6) [x1, y1, x2, y2, conf, cls] detections; returns (ids, boxes)"""
+        with metrics.stage("bytetrack"):
+            tracks = self.byte_tracker.update(Boxes(dets, frame.shape[:2]), frame)
+        if len(tracks) == 0:
+            return [], np.empty((0, 4), dtype=np.float32)
+        # tracks: [x1, y1, x2, y2, track_id, conf, cls, det_idx]
+        return tracks[:, 4].astype(int).tolist(), tracks[:, :4]
+
+    def track(self, frame, frames=1):
+        """Returns (ids, boxes, result); result is the ultralytics Result used for drawing, or None.
+
+        frames: offered frames since the previous call (more than 1 when keyframe-gated).
+        """
+        self.sync_track_buffer(frames)
+        if self.detector is not None:
+            ids, boxes = self.track_sliced(frame)
+            return ids, boxes, None
+        if self.shared_model:
+            with metrics.stage("yolo"):
+                results = self.model.predict(frame, imgsz=self.imgsz, verbose=False, classes=0, conf=CONF_THRESHOLD)
+            ids, boxes = self.track_detections(frame, self.to_output(results[0].boxes.data.cpu().numpy()))
+            return ids, boxes, None
 
-    def process_frame(self, frame):
-        # 1. TRACKING (Get Unique IDs)
         # persist=True is required for tracking
         # classes=0 ensures we only track 'person'
-        results = self.model.track(frame, persist=True, verbose=False, classes=0, conf=CONF_THRESHOLD)
-        
+        with metrics.stage("yolo"):
+            results = self.model.track(frame, imgsz=self.imgsz, persist=True, verbose=False, classes=0, conf=CONF_THRESHOLD)
+        # The first call creates the trackers at 30 FPS; rescale them before their next update
+        self.rescale_track_buffer()
+
+        if results[0].boxes.id is None:
+            return [], np.empty((0, 4), dtype=np.float32), None
+
+        # Extract IDs and Boxes
+        ids = results[0].boxes.id.int().cpu().tolist()
+        boxes = self.to_output(results[0].boxes.xyxy.cpu().numpy())
+        return ids, boxes, results[0]
+
+    def process_frame(self, frame):
+        # 1. TRACKING (Get Unique IDs)
+        # Skipped (non-key) frames carry forward the last tracks
+        is_keyframe = self.scheduler.should_run(frame) if self.scheduler is not None else True
+        self.since_track += 1
+        if is_keyframe or self.last_tracks is None:
+            self.last_tracks = self.track(frame, self.since_track)
+            self.since_track = 0
+        ids, boxes, result = self.last_tracks
+
         current_count = 0
         annotated_frame = frame.copy()
-        
-        if results[0].boxes.id is not None:
-            # Extract IDs and Boxes
-            ids = results[0].boxes.id.int().cpu().tolist()
-            boxes = results[0].boxes.xyxy.cpu()
-            
+
+        if ids:
             self.current_ids = set(ids)
             self.unique_ids.update(ids) # Add new IDs to total count
             current_count = len(self.current_ids)
-            
+
             # Draw Boxes & IDs
-            annotated_frame = results[0].plot(labels=False, font_size=1.0)
+            if result is not None:
+                annotated_frame = result.plot(img=frame, labels=False, font_size=1.0)
+            else:
+                for track_id, (x1, y1, x2, y2) in zip(ids, boxes.astype(int)):
+                    cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (255, 128, 0), 1)
+                    cv2.putText(annotated_frame, str(track_id), (x1, max(y1 - 3, 0)),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.35, (255, 128, 0), 1)
+
+        return self.analyze_motion(frame, annotated_frame, current_count)
 
+    def analyze_motion(self, frame, annotated_frame, current_count):
         # 2. PANIC LOGIC (Physics-Based)
         motion_energy = self.get_motion_energy(frame)
         
@@ -80,70 +333,104 @@ class CrowdTracker:
         self.history_flux.append(current_count)
 
         # 3. DETERMINE STATUS
-        status = "NORMAL"
-        color = (0, 255, 0)
-        
-        is_running = motion_energy > PANIC_ENERGY_THRESH
-        is_rushing = flux > PANIC_FLUX_THRESH
+        status, color = classify_motion(motion_energy, flux)
 
-        if is_running and is_rushing:
-            status = "!!! PANIC: STAMPEDE DETECTED !!!"
-            color = (0, 0, 255) # Red
-        elif is_running:
-            status = "WARNING: HIGH SPEED (RUNNING)"
-            color = (0, 165, 255) # Orange
-        elif is_rushing:
-            status = "WARNING: SUDDEN INFLUX"
-            color = (255, 255, 0) # Yellow
+        return annotated_frame, self.unique_ids.estimate(), current_count, motion_energy, status, color
 
-        return annotated_frame, len(self.unique_ids), current_count, motion_energy, status, color
+def draw_hud(vis_frame, total_unique, curr_count, energy, status, status_color):
+    # --- HUD Visualization (SMALLER) ---
+    # 1. Smaller Black Box (adjusted height and width)
+    cv2.rectangle(vis_frame, (0, 0), (350, 110), (0, 0, 0), -1)
+    
+    # 2. Smaller Text (Font Scale 0.6 instead of 1.0)
+    font_scale = 0.6
+    thickness = 1
+    spacing = 25  # Vertical space between lines
+    start_y = 30
+    
+    cv2.putText(vis_frame, f"Live Count: {curr_count}", (15, start_y), 
+               cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness)
+    
+    cv2.putText(vis_frame, f"Total Unique: {total_unique}", (15, start_y + spacing), 
+               cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness)
+               
+    cv2.putText(vis_frame, f"Energy: {energy:.2f}", (15, start_y + spacing*2), 
+               cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness)
+               
+    # Status slightly bolder
+    cv2.putText(vis_frame, f"{status}", (15, start_y + spacing*3), 
+               cv2.FONT_HERSHEY_TRIPLEX, 0.5, status_color, 1)
+    return vis_frame
 
 def main():
-    tracker = CrowdTracker()
+    parser = argparse.ArgumentParser(description="YOLO crowd tracking with panic heuristics")
+    parser.add_argument("--sliced", action="store_true", help="Tiled inference for small / distant people")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    parser.add_argument("--tile-overlap", type=float, default=TILE_OVERLAP)
+    parser.add_argument("--keyframes", action="store_true", help="Only run YOLO when the scene changes")
+    parser.add_argument("--max-keyframe-interval", type=int, default=MAX_INTERVAL)
+    metrics.add_arguments(parser)
+    detection_store.add_arguments(parser)
+    yolo_cache.add_arguments(parser, weights=MODEL_PATH)
+    args = parser.parse_args()
+    stop_metrics = metrics.start_from_args(args)
+    log = detection_store.open_log(args)
+
     cap = cv2.VideoCapture(VIDEO_PATH)
     
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = int(cap.get(cv2.CAP_PROP_FPS))
+
+    scheduler = KeyframeScheduler(max_interval=args.max_keyframe_interval) if args.keyframes else None
+    tracker = CrowdTracker(sliced=args.sliced, tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+                           scheduler=scheduler, model_path=args.yolo_weights, camera=args.camera_id,
+                           yolo_format=args.yolo_format, precision=args.yolo_precision, imgsz=args.yolo_imgsz,
+                           frame_rate=fps or FRAME_RATE)
     out = cv2.VideoWriter(OUTPUT_PATH, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
 
     print(f"Processing {width}x{height} video...")
+    start_time = time.time()
+    frame_index = 0
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret: break
+    def analyze(frame):
+        result = tracker.process_frame(frame)
+        # Snapshot tracks / flux here: the tracker is already on later frames when render runs
+        ids, boxes, _ = tracker.last_tracks
+        history = tracker.history_flux
+        flux = abs(history[-1] - history[-2]) if len(history) > 1 else 0
+        return result, ids, boxes, flux
 
-        # Run Pipeline
-        vis_frame, total_unique, curr_count, energy, status, status_color = tracker.process_frame(frame)
-        
-        # --- HUD Visualization (SMALLER) ---
-        # 1. Smaller Black Box (adjusted height and width)
-        cv2.rectangle(vis_frame, (0, 0), (350, 110), (0, 0, 0), -1)
-        
-        # 2. Smaller Text (Font Scale 0.6 instead of 1.0)
-        font_scale = 0.6
-        thickness = 1
-        spacing = 25  # Vertical space between lines
-        start_y = 30
-        
-        cv2.putText(vis_frame, f"Live Count: {curr_count}", (15, start_y), 
-                   cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness)
-        
-        cv2.putText(vis_frame, f"Total Unique: {total_unique}", (15, start_y + spacing), 
-                   cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness)
-                   
-        cv2.putText(vis_frame, f"Energy: {energy:.2f}", (15, start_y + spacing*2), 
-                   cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness)
-                   
-        # Status slightly bolder
-        cv2.putText(vis_frame, f"{status}", (15, start_y + spacing*3), 
-                   cv2.FONT_HERSHEY_TRIPLEX, 0.5, status_color, 1)
-
-        out.write(vis_frame)
+    def render(frame, item):
+        nonlocal frame_index
+        result, ids, boxes, flux = item
+        vis_frame, total_unique, curr_count, energy, status, status_color = result
+        if log is not None:
+            log.append(start_time + frame_index / max(fps, 1), curr_count, total_unique, energy, flux,
+                       status=status, track_ids=ids, boxes=boxes)
+        frame_index += 1
+        with metrics.stage("hud"):
+            draw_hud(vis_frame, total_unique, curr_count, energy, status, status_color)
+        with metrics.stage("write"):
+            out.write(vis_frame)
         print(f"Unique: {total_unique} | Live: {curr_count} | Energy: {energy:.2f} | Status: {status}")
 
+    # Decode, tracking and HUD/encode run as overlapping pipeline stages
+    pipeline = VideoPipeline(analyze, render)
+    try:
+        pipeline.run(cap)
+    finally:
+        stop_metrics()
+        if log is not None:
+            log.close()
+
     cap.release()
     out.release()
+    if tracker.detector is not None:
+        d = tracker.detector
+        print(f"Tiles inferred: {d.tiles_inferred} | Reused from cache: {d.tiles_reused}")
+    if scheduler is not None:
+        print(scheduler.summary())
     print(f"Saved to {OUTPUT_PATH}")
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+import os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+
+# Segment-parallel processing of long recordings: the video is cut into
+# time segments, each processed by its own worker process (with its own
+# analyzer), and the per-segment outputs are stitched back in order.
+
+# --- CONFIGURATION ---
+SEGMENT_SECONDS = 60
+OVERLAP_FRAMES = 1  # Frames re-read before each segment to prime temporal state (prev_gray)
+# Segments are written losslessly so stitching costs no quality: the final
+# mp4v encode is the only lossy step, exactly as in serial mode
+SEGMENT_FOURCC = "FFV1"
+SEGMENT_EXT = ".avi"
+
+def plan_segments(total_frames, segment_frames, overlap=OVERLAP_FRAMES):
+    """[(index, warmup_start, start, end)] covering [0, total_frames); frames
+    warmup_start..start-1 only prime state and are not part of the output"""
+    segment_frames = max(1, int(segment_frames))
+    plan = []
+    for index, start in enumerate(range(0, total_frames, segment_frames)):
+        end = min(start + segment_frames, total_frames)
+        plan.append((index, max(0, start - overlap), start, end))
+    return plan
+
+def threads_per_worker(workers):
+    """Split the cores evenly so workers don't oversubscribe each other"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def run_segments(worker, tasks, workers):
+    """Run worker(task) for every task in separate processes; results come back in task order"""
+    if workers <= 1:
+        return [worker(task) for task in tasks]
+    # spawn: torch / OpenCV thread pools are not fork-safe
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        return list(pool.map(worker, tasks))
+
+def segment_writer(path, fps, size):
+    """VideoWriter for an intermediate segment (lossless, MJPG if FFV1 is unavailable)"""
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*SEGMENT_FOURCC), fps, size)
+    if not out.isOpened():
+        print(f"⚠️ WARNING: {SEGMENT_FOURCC} not available, segments fall back to lossy MJPG")
+        out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, size)
+    return out
+
+def stitch_videos(paths, output_path, fps, size, remove=True):
+    """Concatenate segment videos in order into one file; returns frames written"""
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    frames = 0
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.write(frame)
+            frames += 1
+        cap.release()
+        if remove:
+            os.remove(path)
+    out.release()
+    return frames
@@ -0,0 +1,183 @@
+import argparse
+from collections import Counter
+import numpy as np
+import litserve as ls
+from fastapi import HTTPException
+from feature_buffer import FeatureBufferPool, IDLE_TIMEOUT
+from panic_lstm import MODEL_PATH, WINDOW_SIZE, NUM_FEATURES, THRESHOLD, build_window, load_panic_model, make_result
+
+# --- CONFIGURATION ---
+HOST = "127.0.0.1"
+PORT = 8500
+
+# Micro-batching: requests from different cameras arriving within
+# BATCH_TIMEOUT seconds of each other are run as one (N, 30, 2) predict.
+# Larger values trade a little latency for throughput; 1 disables batching.
+MAX_BATCH_SIZE = 32
+BATCH_TIMEOUT = 0.01
+STATS_EVERY = 100  # Log achieved batch sizes every N batches
+
+# Long-lived replacement for run_inference.py: the model is loaded once per
+# worker and every POST /predict reuses it.
+#
+#   POST /predict  {"motion_energy": [30 floats], "flux_of_count": [30 floats]}
+#                  -> {"panic_detected": bool, "confidence": float, "threshold": 0.5,
+#                      "batch_size": size of the batch this request was run in}
+#   POST /predict  {"camera_id": "cam1", "motion_energy": float, "flux_of_count": float}
+#                  -> pushes one sample into the camera's server-side 30-step buffer;
+#                     same fields plus "samples" (confidence is 0.0 until the buffer is full)
+#   POST /predict  {"camera_id": "cam1", "reset": true}  -> clears that camera's buffer
+#   GET  /         liveness  (200 as soon as the HTTP server is up)
+#   GET  /health   readiness (503 until every worker has loaded the model, then 200 "ok")
+#   GET  /info     model path / threshold / worker configuration
+#
+# Per-camera buffers live inside a worker, so single-sample requests are
+# rejected when the server runs with --workers > 1; send full 30-step
+# windows to a multi-worker server instead.
+#
+# Invalid requests (missing fields, wrong window length, ...) get a 400 when
+# batching is off. With micro-batching an exception would fail every request
+# in the batch, so the bad request alone is answered with
+#   {"panic_detected": false, "confidence": 0.0, "error": "Invalid request: ..."}
+# and the other cameras batched with it are unaffected.
+
+class BatchStats:
+    """Histogram of the batch sizes actually achieved by a worker"""
+    def __init__(self, report_every=STATS_EVERY):
+        self.sizes = Counter()
+        self.batches = 0
+        self.requests = 0
+        self.report_every = report_every
+
+    def record(self, size):
+        self.sizes[size] += 1
+        self.batches += 1
+        self.requests += size
+        if self.report_every and self.batches % self.report_every == 0:
+            print(self.summary())
+
+    def summary(self):
+        mean = self.requests / self.batches if self.batches else 0.0
+        hist = ", ".join(f"{k}:{v}" for k, v in sorted(self.sizes.items()))
+        return f"Batches: {self.batches} | Requests: {self.requests} | Mean batch: {mean:.2f} | Sizes {{{hist}}}"
+
+class PanicLSTMAPI(ls.LitAPI):
+    def __init__(self, model_path=MODEL_PATH, threshold=THRESHOLD, idle_timeout=IDLE_TIMEOUT, runtime="auto", workers=1, **kwargs):
+        super().__init__(**kwargs)
+        self.model_path = model_path
+        self.workers = workers
+        self.runtime = runtime
+        self.threshold = threshold
+        self.idle_timeout = idle_timeout
+
+    def setup(self, device):
+        self.model = load_panic_model(self.model_path, self.runtime)
+        self.stats = BatchStats()
+        self.buffers = FeatureBufferPool(idle_timeout=self.idle_timeout)
+        # Warm up so the first real request doesn't pay for graph tracing
+        self.model.predict_on_batch(np.zeros((1, WINDOW_SIZE, NUM_FEATURES), dtype=np.float32))
+
+    def decode_request(self, request):
+        """Returns (window or None, extra response fields); never raises so one
+        bad request cannot fail the rest of its micro-batch"""
+        try:
+            if "camera_id" in request and not isinstance(request.get("motion_energy"), list):
+                return self.push_sample(request)
+            return build_window(request["motion_energy"], request["flux_of_count"]), {}
+        except (KeyError, TypeError, ValueError) as e:
+            return None, {"error": f"Invalid request: {e}"}
+
+    def push_sample(self, request):
+        if self.workers > 1:
+            # Another worker may hold this camera's buffer
+            raise ValueError("per-camera buffers need --workers 1; send 30-step windows instead")
+        camera_id = str(request["camera_id"])
+        if request.get("reset"):
+            self.buffers.reset(camera_id)
+            return None, {"camera_id": camera_id, "samples": 0}
+
+        buffer = self.buffers.push(camera_id, float(request["motion_energy"]), float(request["flux_of_count"]))
+        window = buffer.normalized_window() if buffer.is_full else None
+        return window, {"camera_id": camera_id, "samples": len(buffer)}
+
+    def batch(self, inputs):
+        return inputs
+
+    def predict(self, x):
+        # Unbatched calls get a single (window, fields) pair
+        items = [x] if isinstance(x, tuple) else x
+        windows = [window for window, _ in items if window is not None]
+
+        confidences = iter(())
+        if windows:
+            prediction = self.model.predict_on_batch(np.stack(windows))
+            self.stats.record(len(windows))
+            confidences = iter(prediction[:, 0])
+
+        return [
+            (float(next(confidences)) if window is not None else None, len(windows), fields)
+            for window, fields in items
+        ]
+
+    def unbatch(self, output):
+        return output
+
+    def encode_response(self, output):
+        # Unbatched predict returns a one-element list
+        confidence, batch_size, fields = output[0] if isinstance(output, list) else output
+        if "error" in fields:
+            if self.max_batch_size <= 1:
+                # Nothing else shares this call, so a real 400 is safe
+                raise HTTPException(status_code=400, detail=fields["error"])
+            return {"panic_detected": False, "confidence": 0.0, "threshold": self.threshold, **fields}
+        if confidence is None:
+            # Camera buffer not full yet (or just reset)
+            result = make_result(0.0, self.threshold)
+        else:
+            result = make_result(confidence, self.threshold)
+            result["batch_size"] = batch_size
+        result.update(fields)
+        return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent LSTM panic inference server")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=1, help="Model replicas (each loads its own copy); >1 disables per-camera buffers")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--runtime", choices=("auto", "numpy", "keras"), default="auto",
+                        help="auto: NumPy runtime if the model has an up-to-date export, else Keras")
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE,
+                        help="Upper bound on windows per predict call (1 disables batching)")
+    parser.add_argument("--batch-timeout", type=float, default=BATCH_TIMEOUT,
+                        help="Seconds to wait for a batch to fill before running it")
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT,
+                        help="Seconds before an idle camera's feature buffer is evicted")
+    args = parser.parse_args()
+
+    api = PanicLSTMAPI(
+        model_path=args.model,
+        threshold=args.threshold,
+        idle_timeout=args.idle_timeout,
+        runtime=args.runtime,
+        workers=args.workers,
+        max_batch_size=args.max_batch_size,
+        batch_timeout=args.batch_timeout if args.max_batch_size > 1 else 0.0,
+    )
+    server = ls.LitServer(
+        api,
+        accelerator="cpu",
+        workers_per_device=args.workers,
+        model_metadata={
+            "model_path": args.model,
+            "runtime": args.runtime,
+            "threshold": args.threshold,
+            "max_batch_size": args.max_batch_size,
+            "batch_timeout": args.batch_timeout,
+        },
+    )
+    server.run(host=args.host, port=args.port, generate_client_file=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import os
+import sys
+
+# The model scripts are flat modules imported by name (as when run from model/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+def random_lstm_layers(seed=0):
+    """Weights shaped like resnet-lstm.py: LSTM(64) -> LSTM(32) -> Dense(16, relu) -> Dense(1, sigmoid)"""
+    rng = np.random.default_rng(seed)
+    def w(*shape):
+        return (rng.normal(size=shape) * 0.3).astype(np.float32)
+    return [
+        ({"type": "lstm", "units": 64, "return_sequences": True}, {"kernel": w(2, 256), "recurrent_kernel": w(64, 256), "bias": w(256)}),
+        ({"type": "lstm", "units": 32, "return_sequences": False}, {"kernel": w(64, 128), "recurrent_kernel": w(32, 128), "bias": w(128)}),
+        ({"type": "dense", "units": 16, "activation": "relu"}, {"kernel": w(32, 16), "bias": w(16)}),
+        ({"type": "dense", "units": 1, "activation": "sigmoid"}, {"kernel": w(16, 1), "bias": w(1)}),
+    ]
+
+@pytest.fixture
+def panic_model():
+    from lstm_runtime import NumpyLSTM
+    return NumpyLSTM(random_lstm_layers())
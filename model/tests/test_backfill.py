@@ -0,0 +1,72 @@
+import json
+import numpy as np
+import pytest
+from backfill import (feature_windows, normalize_windows, score_series, window_end_times, valid_runs,
+                      load_store, load_jsonl, check_features)
+from detection_store import DetectionLog
+from panic_lstm import WINDOW_SIZE, build_window
+
+def result(i):
+    # Pipeline motion energy / flux (flow speed, track counts) differ from the LSTM features
+    return {"motion_energy": 100.0 + i, "flux": 7, "count": 3,
+            "features": {"motion_energy": float(i % 5), "flux_of_count": float(i % 3)}}
+
+def test_windows_match_live_normalization():
+    series = np.random.default_rng(0).random((100, 2)).astype(np.float32) * 10
+    windows = feature_windows(series, stride=7)
+    assert np.shares_memory(windows, series)
+    for k in (0, 5, len(windows) - 1):
+        chunk = series[k * 7:k * 7 + WINDOW_SIZE]
+        np.testing.assert_allclose(normalize_windows(windows[k:k + 1])[0], build_window(chunk[:, 0], chunk[:, 1]),
+                                   atol=1e-5)
+    np.testing.assert_array_equal(window_end_times(np.arange(100), 7), np.arange(WINDOW_SIZE - 1, 100, 7))
+
+def test_score_series_matches_per_window_predict(panic_model):
+    series = np.random.default_rng(1).random((80, 2)).astype(np.float32)
+    scores = score_series(panic_model, series, stride=3, batch_size=4)
+    expected = [panic_model.predict(build_window(series[k:k + WINDOW_SIZE, 0], series[k:k + WINDOW_SIZE, 1])[None])[0, 0]
+                for k in range(0, len(series) - WINDOW_SIZE + 1, 3)]
+    np.testing.assert_allclose(scores, expected, atol=1e-6)
+
+def write_store(root, append):
+    log = DetectionLog(root, "cam0")
+    for i in range(40):
+        append(log, float(i), result(i))
+    log.close()
+
+def test_store_reads_lstm_features_not_pipeline_proxies(tmp_path):
+    write_store(str(tmp_path), lambda log, ts, r: log.append(ts, motion_energy=r["motion_energy"], flux=r["flux"],
+                                                             features=r["features"]))
+    ts, features = load_store(str(tmp_path), "cam0")["cam0"]
+    np.testing.assert_array_equal(ts, np.arange(40))
+    np.testing.assert_array_equal(features[:, 0], [i % 5 for i in range(40)])
+    np.testing.assert_array_equal(features[:, 1], [i % 3 for i in range(40)])
+
+def test_store_without_features_is_rejected(tmp_path):
+    log = DetectionLog(str(tmp_path), "cam0")
+    for i in range(40):
+        log.append(float(i), motion_energy=2.5, flux=1)  # e.g. run_sahi.py: flow speed only
+    log.close()
+    with pytest.raises(ValueError, match="no LSTM features"):
+        check_features(load_store(str(tmp_path), "cam0"))
+
+def test_jsonl_reads_features_and_splits_gaps(tmp_path):
+    path = tmp_path / "results.jsonl"
+    with open(path, "w") as f:
+        for i in range(70):
+            record = dict(result(i), camera_id="cam1", ts=float(i))
+            if i == 35:
+                del record["features"]  # e.g. a line written with --no-features
+            f.write(json.dumps(record) + "\n")
+    series = load_jsonl(str(path))
+    check_features(series)
+    ts, features = series["cam1"]
+    assert features[0, 0] == 0.0 and features[6, 0] == 1.0
+    assert valid_runs(features) == [(0, 35), (36, 70)]
+
+def test_pipeline_results_store_their_features(tmp_path):
+    pytest.importorskip("ultralytics")
+    from unified_analyzer import log_result
+    write_store(str(tmp_path), log_result)
+    _, features = load_store(str(tmp_path), "cam0")["cam0"]
+    np.testing.assert_array_equal(features[:, 0], [i % 5 for i in range(40)])
@@ -0,0 +1,71 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from detection_store import DetectionLog, DetectionStore, INDEX_NAME
+
+def write_frames(log, ts_values):
+    for ts in ts_values:
+        n = int(ts) % 3
+        log.append(ts, count=n, unique_count=ts, motion_energy=ts / 10, flux=1.0, risk=0.5, status="NORMAL",
+                   track_ids=range(n), boxes=[[ts, 0, ts + 1, 1]] * n)
+
+def test_round_trip(tmp_path):
+    log = DetectionLog(str(tmp_path), "cam0", chunk_rows=4)
+    write_frames(log, [float(t) for t in range(10)])
+    log.close()
+
+    store = DetectionStore(str(tmp_path))
+    assert store.cameras() == ["cam0"]
+    assert len(store.index("cam0")) == 3
+    data = store.query("cam0", 2.0, 7.0)
+    np.testing.assert_array_equal(data["ts"], [2, 3, 4, 5, 6])
+    np.testing.assert_allclose(data["motion_energy"], [0.2, 0.3, 0.4, 0.5, 0.6], rtol=1e-6)
+
+    ts, ids, boxes = store.tracks("cam0", 2.0, 7.0)
+    expected = [t for t in range(2, 7) for _ in range(t % 3)]
+    np.testing.assert_array_equal(ts, expected)
+    np.testing.assert_array_equal(boxes[:, 0], expected)
+    assert store.latest("cam0")["ts"] == 9.0
+
+def test_late_frames_are_sorted(tmp_path):
+    log = DetectionLog(str(tmp_path), "cam0", chunk_rows=100)
+    write_frames(log, [3.0, 1.0, 2.0])
+    log.close()
+    store = DetectionStore(str(tmp_path))
+    np.testing.assert_array_equal(store.query("cam0")["ts"], [1, 2, 3])
+    ts, _, boxes = store.tracks("cam0")
+    np.testing.assert_array_equal(ts, boxes[:, 0])
+
+def test_crash_after_rename_is_recovered(tmp_path):
+    log = DetectionLog(str(tmp_path), "cam0", chunk_rows=4)
+    write_frames(log, [float(t) for t in range(8)])
+    log.close()
+    # Simulate a writer that died between os.replace and the index append
+    camera_dir = os.path.join(str(tmp_path), "cam0")
+    with open(os.path.join(camera_dir, INDEX_NAME)) as f:
+        lines = f.readlines()
+    with open(os.path.join(camera_dir, INDEX_NAME), "w") as f:
+        f.writelines(lines[:1])
+    os.makedirs(os.path.join(camera_dir, ".chunk_000002.tmp"))
+
+    log = DetectionLog(str(tmp_path), "cam0", chunk_rows=4)
+    assert log.next_chunk == 2
+    assert not os.path.exists(os.path.join(camera_dir, ".chunk_000002.tmp"))
+    write_frames(log, [8.0, 9.0])
+    log.close()
+
+    data = DetectionStore(str(tmp_path)).query("cam0")
+    np.testing.assert_array_equal(data["ts"], np.arange(10))
+
+def test_low_rate_camera_batches_chunks(tmp_path, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("detection_store.time.monotonic", lambda: clock[0])
+    log = DetectionLog(str(tmp_path), "cam0", flush_seconds=30, min_flush_rows=256, max_flush_seconds=300)
+    for i in range(200):  # 1 frame/s: too few rows for the 30 s flush
+        clock[0] = float(i)
+        log.append(float(i))
+    assert log.next_chunk == 0 and len(log) == 200
+    clock[0] = 300.0
+    log.append(300.0)  # MAX_FLUSH_SECONDS bounds the wait
+    assert log.next_chunk == 1 and len(log) == 0
@@ -0,0 +1,38 @@
+import numpy as np
+import feature_buffer
+from feature_buffer import FeatureBufferPool, RollingFeatureBuffer
+from panic_lstm import WINDOW_SIZE, build_window
+
+def test_window_is_chronological_after_wrapping():
+    buffer = RollingFeatureBuffer(size=4)
+    for t in range(6):
+        buffer.push((t, -t))
+    assert buffer.is_full and len(buffer) == 4
+    np.testing.assert_array_equal(buffer.window()[:, 0], [2, 3, 4, 5])
+
+def test_normalized_window_matches_build_window():
+    rng = np.random.default_rng(0)
+    samples = rng.normal(size=(WINDOW_SIZE + 17, 2)) * [5.0, 0.5] + [100.0, 3.0]
+    buffer = RollingFeatureBuffer()
+    for sample in samples:
+        buffer.push(sample)
+    tail = samples[-WINDOW_SIZE:]
+    np.testing.assert_allclose(buffer.normalized_window(), build_window(tail[:, 0], tail[:, 1]), atol=1e-5)
+
+def test_running_sums_resync(monkeypatch):
+    monkeypatch.setattr(feature_buffer, "RESYNC_EVERY", 7)
+    buffer = RollingFeatureBuffer(size=5)
+    for t in range(50):
+        buffer.push((1e6 + t, t * 0.1))
+    np.testing.assert_allclose(buffer.mean(), buffer.window().mean(axis=0))
+    np.testing.assert_allclose(buffer.std(), buffer.window().std(axis=0), rtol=1e-6)
+
+def test_pool_evicts_idle_and_least_recent_cameras():
+    pool = FeatureBufferPool(size=4, idle_timeout=10.0, max_cameras=2)
+    pool.push("a", 1.0, 1.0, now=0.0)
+    pool.push("b", 1.0, 1.0, now=1.0)
+    assert len(pool.push("a", 2.0, 2.0, now=2.0)) == 2
+    pool.push("c", 1.0, 1.0, now=3.0)  # Over the cap: "b" is least recently used
+    assert "b" not in pool and "a" in pool
+    assert pool.evict(now=12.5) == ["a"]
+    assert "c" in pool
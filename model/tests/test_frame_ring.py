@@ -0,0 +1,47 @@
+import os
+import sys
+import numpy as np
+import pytest
+from frame_ring import FrameRing, RingCapture
+
+# SharedMemory(track=False) is new in 3.13 (the project's minimum)
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 13), reason="needs Python 3.13")
+
+@pytest.fixture
+def ring():
+    ring = FrameRing.create(f"test_ring_{os.getpid()}", (4, 6, 3), slots=4)
+    yield ring
+    ring.release()
+
+def frame(value):
+    return np.full((4, 6, 3), value, dtype=np.uint8)
+
+def test_frames_arrive_in_order_until_close(ring):
+    cap = RingCapture(ring.shm.name, 0)
+    for value in (1, 2, 3):
+        ring.write(frame(value))
+    ring.close()
+    values = []
+    while True:
+        ret, f = cap.read()
+        if not ret:
+            break
+        values.append(int(f[0, 0, 0]))
+    assert values == [1, 2, 3]
+    assert not cap.isOpened()
+    cap.release()
+
+def test_frames_overwritten_mid_copy_are_skipped_and_dropped(ring):
+    cap = RingCapture(ring.shm.name, 0)
+    for value in range(1, 5):
+        ring.write(frame(value))
+    ring.close()
+    overwritten = {1, 2, 3}
+    valid = cap.reader.valid
+    cap.reader.valid = lambda seq: seq not in overwritten and valid(seq)
+
+    ret, f = cap.read()
+    assert ret and int(f[0, 0, 0]) == 4
+    assert cap.reader.dropped == 3
+    assert cap.read() == (False, None)
+    cap.release()
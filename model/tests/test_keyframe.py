@@ -0,0 +1,25 @@
+import numpy as np
+from keyframe import KeyframeScheduler
+
+def frame(value):
+    return np.full((72, 128, 3), value, dtype=np.uint8)
+
+def test_static_scene_runs_at_max_interval():
+    scheduler = KeyframeScheduler(max_interval=4)
+    decisions = [scheduler.should_run(frame(100)) for _ in range(9)]
+    assert decisions == [True, False, False, False, True, False, False, False, True]
+    assert scheduler.reasons["first"] == 1 and scheduler.reasons["interval"] == 2
+    assert abs(scheduler.skip_ratio - 6 / 9) < 1e-9
+
+def test_gradual_drift_triggers_motion_keyframe():
+    scheduler = KeyframeScheduler(max_interval=100, motion_thresh=2.0, spike_thresh=6.0)
+    decisions = [scheduler.should_run(frame(100 + t)) for t in range(5)]
+    # Each step is below the spike threshold; the change since the keyframe crosses 2.0 on the third step
+    assert decisions == [True, False, False, True, False]
+    assert scheduler.reasons["motion"] == 1
+
+def test_sudden_change_is_a_spike():
+    scheduler = KeyframeScheduler(max_interval=100)
+    scheduler.should_run(frame(100))
+    assert scheduler.should_run(frame(150))
+    assert scheduler.reasons["spike"] == 1
@@ -0,0 +1,62 @@
+import latency_controller as lc
+from latency_controller import LatencyController, LEVELS
+
+def run(controller, latencies):
+    """Feed latencies (seconds); returns the change records"""
+    return [change for change in map(controller.observe, latencies) if change is not None]
+
+def test_starts_at_full_and_steps_down_after_patience():
+    c = LatencyController(100)
+    assert c.config["name"] == LEVELS[-1]["name"]
+    changes = run(c, [0.2] * (lc.DOWN_PATIENCE - 1))
+    assert changes == []
+    changes = run(c, [0.2])
+    assert [(x["from"], x["to"], x["reason"]) for x in changes] == [("full", "high", "over target")]
+    assert changes[0]["target_ms"] == 100.0 and changes[0]["config"]["detector"] == LEVELS[-2]["detector"]
+
+def test_single_spikes_do_not_step():
+    c = LatencyController(100)
+    assert run(c, ([0.05] * 19 + [0.5]) * 20) == []  # A spike lifts the EWMA over HIGH_WATER for < DOWN_PATIENCE frames
+    assert c.config["name"] == "full"
+
+def test_cooldown_then_headroom_steps_back_up():
+    c = LatencyController(100, start_level=0)
+    assert run(c, [0.01] * (lc.UP_PATIENCE - 1)) == []
+    changes = run(c, [0.01])
+    assert [(x["from"], x["to"]) for x in changes] == [("min", "low")]
+    # Nothing is observed during the cooldown, however slow
+    assert run(c, [1.0] * lc.COOLDOWN) == []
+
+def test_band_between_water_marks_holds_level():
+    c = LatencyController(100, start_level=2)
+    assert run(c, [0.08] * 500) == []  # Between LOW_WATER and HIGH_WATER
+    assert c.config["name"] == "mid"
+
+def test_overloaded_level_needs_more_patience():
+    c = LatencyController(100, start_level=1)
+    run(c, [0.2] * lc.DOWN_PATIENCE)  # low -> min, low's backoff doubles
+    assert c.config["name"] == "min"
+    run(c, [0.0] * lc.COOLDOWN)
+    assert run(c, [0.01] * (lc.UP_PATIENCE * lc.BACKOFF - 1)) == []
+    assert [x["to"] for x in run(c, [0.01])] == ["low"]
+
+def test_levels_are_clamped():
+    c = LatencyController(100, min_level=3)
+    run(c, [1.0] * 200)
+    assert c.config["name"] == LEVELS[3]["name"]
+    assert c.detector_names() == sorted({LEVELS[3]["detector"], LEVELS[4]["detector"]})
+
+def test_features_do_not_shift_with_the_processing_level():
+    import numpy as np
+    import pytest
+    pytest.importorskip("ultralytics")
+    from unified_analyzer import UnifiedAnalyzer
+    from features import FeatureExtractor
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (1080, 1920, 3), dtype=np.uint8) for _ in range(3)]
+    outputs = []
+    for level in (LEVELS[-1], LEVELS[0]):
+        analyzer = UnifiedAnalyzer(extractor=FeatureExtractor())
+        analyzer.set_sizes(level["process_size"], LEVELS[-1]["flow_size"])
+        outputs.append([(r["motion_energy"], r["features"]) for r in map(analyzer.analyze, frames)])
+    assert outputs[0] == outputs[1]
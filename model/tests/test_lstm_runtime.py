@@ -0,0 +1,65 @@
+import json
+import numpy as np
+from conftest import random_lstm_layers
+from lstm_runtime import INT8_TOLERANCE, NumpyLSTM, _quantize, check_windows
+
+def reference_predict(layers, windows):
+    """Textbook float64 LSTM, one window and one timestep at a time (Keras gate order i, f, c, o)"""
+    sigmoid = lambda x: 1.0 / (1.0 + np.exp(-x))
+    outputs = []
+    for window in windows.astype(np.float64):
+        x = window
+        for spec, w in layers:
+            if spec["type"] == "lstm":
+                u = spec["units"]
+                kernel, recurrent, bias = (w[k].astype(np.float64) for k in ("kernel", "recurrent_kernel", "bias"))
+                h, c, seq = np.zeros(u), np.zeros(u), []
+                for x_t in x:
+                    z = x_t @ kernel + h @ recurrent + bias
+                    i, f, g, o = sigmoid(z[:u]), sigmoid(z[u:2 * u]), np.tanh(z[2 * u:3 * u]), sigmoid(z[3 * u:])
+                    c = f * c + i * g
+                    h = o * np.tanh(c)
+                    seq.append(h)
+                x = np.array(seq) if spec["return_sequences"] else h
+            else:
+                x = x @ w["kernel"].astype(np.float64) + w["bias"]
+                x = np.maximum(x, 0.0) if spec["activation"] == "relu" else sigmoid(x)
+        outputs.append(x)
+    return np.array(outputs)
+
+def save_export(path, layers, int8=False):
+    """Same .npz layout as lstm_runtime.export, without needing Keras"""
+    specs, arrays = [], {}
+    for i, (spec, weights) in enumerate(layers):
+        specs.append(dict(spec, weights=list(weights)))
+        for name, value in weights.items():
+            if int8 and value.ndim == 2:
+                arrays[f"{i}.{name}.q"], arrays[f"{i}.{name}.scale"] = _quantize(value)
+            else:
+                arrays[f"{i}.{name}"] = value
+    np.savez(path, spec=json.dumps(specs), **arrays)
+    return path
+
+def test_batched_forward_matches_reference(panic_model):
+    windows = check_windows(64)
+    expected = reference_predict(random_lstm_layers(), windows)
+    actual = panic_model.predict(windows)
+    assert actual.shape == (64, 1)
+    assert actual.dtype == np.float32
+    np.testing.assert_allclose(actual, expected, atol=1e-5)
+
+def test_batch_size_does_not_change_results(panic_model):
+    windows = check_windows(16)
+    batched = panic_model.predict_on_batch(windows)
+    single = np.concatenate([panic_model.predict_on_batch(w[np.newaxis]) for w in windows])
+    np.testing.assert_allclose(batched, single, atol=1e-6)
+
+def test_export_round_trip(tmp_path, panic_model):
+    windows = check_windows(64)
+    loaded = NumpyLSTM.load(save_export(str(tmp_path / "panic.npz"), random_lstm_layers()))
+    np.testing.assert_array_equal(loaded.predict(windows), panic_model.predict(windows))
+
+def test_int8_export_within_tolerance(tmp_path, panic_model):
+    windows = check_windows(64)
+    loaded = NumpyLSTM.load(save_export(str(tmp_path / "panic.int8.npz"), random_lstm_layers(), int8=True))
+    assert np.max(np.abs(loaded.predict(windows) - panic_model.predict(windows))) <= INT8_TOLERANCE
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from pipeline import VideoPipeline
+
+class FakeCapture:
+    def __init__(self, frames):
+        self.frames = list(frames)
+
+    def read(self):
+        if not self.frames:
+            return False, None
+        return True, self.frames.pop(0)
+
+def run(frames, **kwargs):
+    rendered = []
+    pipeline = VideoPipeline(lambda frame: int(frame[0]) * 10, lambda frame, result: rendered.append(result), **kwargs)
+    written = pipeline.run(FakeCapture(frames))
+    return written, rendered
+
+def test_frames_keep_their_order():
+    written, rendered = run([np.array([i]) for i in range(20)])
+    assert written == 20
+    assert rendered == [i * 10 for i in range(20)]
+
+def test_batches_are_consecutive_and_bounded():
+    batches = []
+    def analyze_batch(frames):
+        batches.append([int(f[0]) for f in frames])
+        return [int(f[0]) * 10 for f in frames]
+
+    written, rendered = run([np.array([i]) for i in range(11)], batch_size=4, analyze_batch=analyze_batch)
+    assert written == 11
+    assert rendered == [i * 10 for i in range(11)]
+    assert [i for batch in batches for i in batch] == list(range(11))
+    assert all(1 <= len(batch) <= 4 for batch in batches)
+
+def test_analysis_errors_propagate():
+    def analyze_batch(frames):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        run([np.array([i]) for i in range(5)], batch_size=2, analyze_batch=analyze_batch)
@@ -0,0 +1,32 @@
+import os
+import cv2
+import numpy as np
+from segments import SEGMENT_EXT, plan_segments, segment_writer, stitch_videos
+
+def test_plan_covers_every_frame_once():
+    plan = plan_segments(250, 100)
+    assert [(start, end) for _, _, start, end in plan] == [(0, 100), (100, 200), (200, 250)]
+    assert [warmup for _, warmup, _, _ in plan] == [0, 99, 199]
+
+def test_segments_are_lossless_and_stitch_in_order(tmp_path):
+    size = (64, 48)
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8) for _ in range(6)]
+    paths = []
+    for index in range(2):
+        path = os.path.join(tmp_path, f"segment_{index}{SEGMENT_EXT}")
+        out = segment_writer(path, 10, size)
+        for frame in frames[index * 3:index * 3 + 3]:
+            out.write(frame)
+        out.release()
+        paths.append(path)
+
+    cap = cv2.VideoCapture(paths[1])
+    ret, frame = cap.read()
+    cap.release()
+    assert ret
+    np.testing.assert_array_equal(frame, frames[3])
+
+    written = stitch_videos(paths, os.path.join(tmp_path, "out.mp4"), 10, size)
+    assert written == 6
+    assert not any(os.path.exists(p) for p in paths)
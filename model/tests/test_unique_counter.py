@@ -0,0 +1,37 @@
+import numpy as np
+from unique_counter import HyperLogLog, UniqueCounter, hash64, merge_counters, _bit_length
+
+def test_bit_length_is_exact():
+    values = np.array([0, 1, 2, 3, 2**31, 2**32 - 1, 2**32, 2**63, 2**64 - 1], dtype=np.uint64)
+    expected = [int(v).bit_length() for v in values]
+    np.testing.assert_array_equal(_bit_length(values), expected)
+
+def test_estimates_within_error_bound():
+    for n in (10, 1000, 50000):
+        sketch = HyperLogLog()
+        sketch.add_hashes(hash64(np.arange(n)))
+        assert abs(sketch.estimate() - n) <= max(1, 4 * sketch.error() * n)
+
+def test_merge_counts_union_and_keeps_cameras_apart():
+    cam0, cam0_other_node, cam1 = UniqueCounter("cam0"), UniqueCounter("cam0"), UniqueCounter("cam1")
+    cam0.update(range(0, 300), ts=0.0)
+    cam0_other_node.update(range(200, 500), ts=0.0)  # Same camera: overlap counted once
+    cam1.update(range(0, 300), ts=0.0)               # Same IDs on another camera stay distinct
+    estimate = merge_counters([cam0, cam0_other_node, cam1]).estimate()
+    assert abs(estimate - 800) <= 0.05 * 800
+
+def test_windows_forget_old_buckets():
+    counter = UniqueCounter(bucket_seconds=60.0, buckets=5, ttl=30.0)
+    counter.update(range(100), ts=0.0)
+    counter.update(range(100, 150), ts=240.0)
+    assert abs(counter.estimate(60) - 50) <= 2
+    assert abs(counter.estimate() - 150) <= 3
+
+def test_save_load_round_trip(tmp_path):
+    counter = UniqueCounter("cam3")
+    counter.update(range(40), ts=10.0)
+    path = str(tmp_path / "unique.npz")
+    counter.save(path)
+    loaded = UniqueCounter.load(path)
+    assert loaded.camera == "cam3" and loaded.estimate() == counter.estimate()
+    assert loaded.estimate(60) == counter.estimate(60)
@@ -0,0 +1,44 @@
+import numpy as np
+import cv2
+from zones import ZoneAggregator, scale_zones
+
+ZONES = [
+    {"name": "gate", "rect": [0, 20, 30, 48]},
+    {"name": "stage", "polygon": [[40, 0], [60, 0], [64, 16], [20, 16]]},
+    {"name": "ring", "polygon": [[10, 10], [50, 10], [50, 40], [30, 25], [10, 40]]},  # Concave
+]
+FRAME_SIZE = (64, 48)
+
+def brute_force_sums(zones, grid):
+    h, w = grid.shape
+    sx, sy = w / FRAME_SIZE[0], h / FRAME_SIZE[1]
+    out = []
+    for zone in zones:
+        mask = np.zeros((h, w), dtype=np.uint8)
+        if "rect" in zone:
+            x1, y1, x2, y2 = np.clip(np.round(np.multiply(zone["rect"], [sx, sy, sx, sy])).astype(int), 0, [w, h, w, h])
+            mask[y1:y2, x1:x2] = 1
+        else:
+            cv2.fillPoly(mask, [np.round(np.asarray(zone["polygon"]) * (sx, sy)).astype(np.int32)], 1)
+        out.append(float((grid.astype(np.float64) * mask).sum()))
+    return np.array(out)
+
+def test_summed_area_sums_match_masks_on_any_grid():
+    aggregator = ZoneAggregator(ZONES, FRAME_SIZE)
+    rng = np.random.default_rng(0)
+    for shape in ((48, 64), (24, 32), (6, 8)):
+        grid = rng.random(shape).astype(np.float32)
+        np.testing.assert_allclose(aggregator.sums(grid), brute_force_sums(ZONES, grid), rtol=1e-9, atol=1e-9)
+
+def test_entries_and_exits_from_centroids():
+    aggregator = ZoneAggregator(ZONES[:1], FRAME_SIZE)
+    box = lambda x, y: [x - 2, y - 2, x + 2, y + 2]
+    aggregator.update(ids=[1, 2], boxes=[box(10, 30), box(50, 30)])   # 1 enters the gate
+    aggregator.update(ids=[1, 2], boxes=[box(50, 30), box(10, 30)])   # 1 leaves, 2 enters
+    zones = aggregator.update(ids=[1], boxes=[box(50, 30)])           # 2 lost: not an exit
+    assert (zones[0]["count"], zones[0]["entries"], zones[0]["exits"]) == (0, 2, 1)
+
+def test_scale_zones():
+    scaled = scale_zones(ZONES[:2], FRAME_SIZE, (128, 96))
+    assert scaled[0]["rect"] == [0, 40, 60, 96]
+    assert scaled[1]["polygon"][2] == [128, 32]
@@ -0,0 +1,338 @@
+import json
+import time
+import argparse
+import numpy as np
+import cv2
+from features import FeatureExtractor, decode_frame
+from keyframe import KeyframeScheduler, MAX_INTERVAL
+from pipeline import VideoPipeline
+import metrics
+import detection_store
+import yolo_cache
+import latency_controller
+from density_accumulator import HeatmapStore
+import zones as zone_config
+from unique_counter import UniqueCounter
+from run_sahi import CrowdTracker, motion_energy_from_flow, classify_motion
+from heatmap import MODEL_PATH as DENSITY_MODEL_PATH, CrowdAnalyzer, panic_risk, classify_risk
+
+# One pass over each frame for every model: YOLO tracking (run_sahi.py),
+# CSRNet density (heatmap.py) and the LSTM features (extract_features.py).
+# The frame is decoded and resized once, converted to gray once, and a single
+# Farneback flow field feeds both the tracker's motion energy and the
+# density-weighted panic score. Running the three scripts side by side did
+# all of this two or three times per frame.
+#
+# The flow is computed at FLOW_SIZE, the resolution run_sahi.py already used,
+# so motion energy keeps its thresholds. For the panic score the flow vectors
+# are rescaled to process-resolution pixels, which is what heatmap.py's
+# full-resolution flow measured.
+
+# --- CONFIGURATION ---
+PROCESS_SIZE = (1024, 576)  # (W, H) every model sees
+FLOW_SIZE = (320, 320)      # (W, H) of the shared optical flow
+
+class UnifiedAnalyzer:
+    """analyze(frame) -> dict with tracks, density, counts, motion energy, flux and status.
+
+    tracker is a run_sahi.CrowdTracker, analyzer a heatmap.CrowdAnalyzer and
+    extractor a features.FeatureExtractor; any of them may be None to skip
+    that model. Their schedulers are ignored: a single KeyframeScheduler here
+    gates YOLO and CSRNet together (motion and features run every frame).
+    zones is an optional zones.ZoneAggregator in process_size pixels; its per-zone metrics go to
+    result["zones"].
+    """
+    def __init__(self, tracker=None, analyzer=None, extractor=None,
+                 process_size=PROCESS_SIZE, flow_size=FLOW_SIZE, scheduler=None, zones=None, camera="cam0"):
+        self.tracker = tracker
+        self.analyzer = analyzer
+        self.extractor = extractor
+        self.process_size = tuple(process_size)
+        self.flow_size = tuple(flow_size)
+        self.scheduler = scheduler
+        self.zones = zones
+        # Sizes may be stepped later (set_sizes); results stay in the units of
+        # the initial ones: boxes in output_size pixels, flow in flow_ref pixels
+        self.output_size = self.process_size
+        self.flow_ref = self.flow_size
+        # Flow (px at flow_ref) -> px at output_size
+        self.flow_scale = (self.output_size[0] / self.flow_ref[0], self.output_size[1] / self.flow_ref[1])
+        self.timings = {}  # Seconds spent per stage on the last analyze()
+
+        self.prev_flow_gray = None
+        self.last_tracks = None
+        self.since_track = 0  # Frames since the tracker last ran (its ByteTrack rate)
+        self.last_density = None
+        self.unique_ids = UniqueCounter(camera)
+        self.prev_count = None
+
+    def set_sizes(self, process_size=None, flow_size=None):
+        """Change the processing and/or flow resolution between frames"""
+        if process_size is not None and tuple(process_size) != self.process_size:
+            self.process_size = tuple(process_size)
+            if self.tracker is not None:
+                self.tracker.output_scale = (self.output_size[0] / self.process_size[0],
+                                             self.output_size[1] / self.process_size[1])
+        if flow_size is not None and tuple(flow_size) != self.flow_size:
+            self.flow_size = tuple(flow_size)
+            if self.prev_flow_gray is not None:
+                self.prev_flow_gray = cv2.resize(self.prev_flow_gray, self.flow_size)
+
+    def preprocess(self, frame):
+        """Decode (bytes) and resize to output_size once; safe to run in a pipeline reader thread"""
+        if isinstance(frame, (bytes, bytearray, memoryview)):
+            frame = decode_frame(frame)
+        if (frame.shape[1], frame.shape[0]) != self.output_size:
+            frame = cv2.resize(frame, self.output_size)
+        return frame
+
+    def flow(self, gray):
+        """(flow, mag) between the previous and this frame at flow_size, or None on the first frame"""
+        small = cv2.resize(gray, self.flow_size)
+        prev, self.prev_flow_gray = self.prev_flow_gray, small
+        if prev is None:
+            return None
+        with metrics.stage("flow"):
+            flow = cv2.calcOpticalFlowFarneback(prev, small, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+        if self.flow_size != self.flow_ref:
+            # Same pixel units at any flow resolution, so the motion thresholds still apply
+            flow *= np.array([self.flow_ref[0] / self.flow_size[0], self.flow_ref[1] / self.flow_size[1]], dtype=np.float32)
+        mag, _ = cv2.cartToPolar(flow[..., 0], flow[..., 1])
+        return flow, mag
+
+    def analyze(self, frame):
+        # Flow, keyframe probe and LSTM features use the output_size gray, so
+        # they don't shift when the controller steps the processing size; only
+        # the detector and CSRNet see the (possibly smaller) process_size frame
+        frame = self.preprocess(frame)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.process_size != self.output_size:
+            frame = cv2.resize(frame, self.process_size, interpolation=cv2.INTER_AREA)
+        result = {}
+
+        # 1. EXPENSIVE MODELS (keyframes only, results carried forward otherwise)
+        is_keyframe = self.scheduler.should_run(gray) if self.scheduler is not None else True
+        result["keyframe"] = is_keyframe
+        timings = self.timings = {}
+        start = time.perf_counter()
+        self.since_track += 1
+        if self.tracker is not None and (is_keyframe or self.last_tracks is None):
+            self.last_tracks = self.tracker.track(frame, self.since_track)
+            self.since_track = 0
+            timings["detector"] = time.perf_counter() - start
+            start = time.perf_counter()
+        if self.analyzer is not None and (is_keyframe or self.last_density is None):
+            self.last_density = self.analyzer.estimate_density(frame)
+            timings["density"] = time.perf_counter() - start
+
+        # 2. SHARED OPTICAL FLOW
+        start = time.perf_counter()
+        flow = self.flow(gray)
+        timings["flow"] = time.perf_counter() - start
+        result["motion_energy"] = float(motion_energy_from_flow(flow[1])) if flow is not None else 0.0
+
+        # 3. TRACKS, COUNT, FLUX
+        if self.last_tracks is not None:
+            ids, boxes, _ = self.last_tracks
+            self.unique_ids.update(ids)
+            count = len(set(ids))
+            result["tracks"] = [{"id": int(i), "box": [float(v) for v in box]} for i, box in zip(ids, boxes)]
+            result["count"] = count
+            result["unique_count"] = self.unique_ids.estimate()
+            result["flux"] = abs(count - self.prev_count) if self.prev_count is not None else 0
+            self.prev_count = count
+            result["motion_status"], _ = classify_motion(result["motion_energy"], result["flux"])
+
+        # 4. DENSITY + PANIC SCORE
+        weighted = None
+        if self.last_density is not None:
+            density_map = self.last_density
+            density_count = float(np.sum(density_map))
+            result["density_map"] = density_map
+            result["density_count"] = density_count
+            if flow is None:
+                result["risk"], result["status"] = 0.0, "Initializing"
+            else:
+                fx, fy = self.flow_scale
+                mag, _ = cv2.cartToPolar(flow[0][..., 0] * fx, flow[0][..., 1] * fy)
+                result["risk"] = float(panic_risk(mag, density_map, density_count))
+                result["status"], _ = classify_risk(result["risk"])
+                if self.zones is not None:
+                    h, w = density_map.shape
+                    weighted = cv2.resize(mag, (w, h)) * density_map
+
+        # 5. PER-ZONE METRICS (one summed-area table per map, shared by all zones)
+        if self.zones is not None:
+            with metrics.stage("zones"):
+                ids, boxes = (self.last_tracks[0], self.last_tracks[1]) if self.last_tracks is not None else (None, None)
+                result["zones"] = self.zones.update(
+                    density_map=self.last_density,
+                    mag=flow[1] if flow is not None else None,
+                    weighted=weighted,
+                    ids=ids,
+                    boxes=boxes,
+                )
+
+        # 6. LSTM FEATURES (same gray, no second conversion)
+        if self.extractor is not None:
+            start = time.perf_counter()
+            with metrics.stage("features"):
+                result["features"] = self.extractor.extract(gray)
+            timings["features"] = time.perf_counter() - start
+
+        return result
+
+def to_json(result):
+    """Result without the density map, for JSONL output"""
+    return {k: v for k, v in result.items() if k != "density_map"}
+
+def log_result(log, ts, result):
+    """Append one result to a detection_store.DetectionLog"""
+    tracks = result.get("tracks", [])
+    log.append(
+        ts,
+        count=result.get("count", result.get("density_count", 0)),
+        unique_count=result.get("unique_count", 0),
+        motion_energy=result["motion_energy"],
+        flux=result.get("flux", 0),
+        risk=result.get("risk", 0.0),
+        status=result.get("status", result.get("motion_status", "")),
+        track_ids=[t["id"] for t in tracks],
+        boxes=[t["box"] for t in tracks],
+        features=result.get("features"),
+    )
+
+def render_unified(frame, result):
+    """Density overlay, track boxes and a combined HUD"""
+    vis = frame.copy()
+    if "density_map" in result:
+        density_norm = cv2.normalize(result["density_map"], None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+        heatmap = cv2.resize(cv2.applyColorMap(density_norm, cv2.COLORMAP_JET), (frame.shape[1], frame.shape[0]))
+        vis = cv2.addWeighted(vis, 0.6, heatmap, 0.4, 0)
+    for track in result.get("tracks", []):
+        x1, y1, x2, y2 = (int(v) for v in track["box"])
+        cv2.rectangle(vis, (x1, y1), (x2, y2), (255, 128, 0), 1)
+        cv2.putText(vis, str(track["id"]), (x1, max(y1 - 3, 0)), cv2.FONT_HERSHEY_SIMPLEX, 0.35, (255, 128, 0), 1)
+
+    lines = []
+    if "count" in result:
+        lines.append(f"Live Count: {result['count']} | Unique: {result['unique_count']}")
+    if "density_count" in result:
+        lines.append(f"Density Count: {int(result['density_count'])} | Panic Score: {result['risk']:.2f}")
+    lines.append(f"Energy: {result['motion_energy']:.2f}")
+    lines += [result[k] for k in ("status", "motion_status") if k in result]
+
+    cv2.rectangle(vis, (0, 0), (420, 20 + 25 * len(lines)), (0, 0, 0), -1)
+    for i, line in enumerate(lines):
+        cv2.putText(vis, line, (15, 30 + 25 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+    return vis
+
+def main():
+    parser = argparse.ArgumentParser(description="YOLO tracking, CSRNet density and LSTM features in one pass")
+    parser.add_argument("video")
+    parser.add_argument("--output", help="Annotated video path (omit to skip rendering)")
+    parser.add_argument("--results", help="JSONL file with one result per frame")
+    parser.add_argument("--weights", help="CSRNet weights (default: heatmap.MODEL_PATH)")
+    parser.add_argument("--no-tracks", action="store_true", help="Skip YOLO tracking")
+    parser.add_argument("--no-density", action="store_true", help="Skip CSRNet density")
+    parser.add_argument("--no-features", action="store_true", help="Skip LSTM features")
+    parser.add_argument("--size", type=int, nargs=2, default=PROCESS_SIZE, metavar=("W", "H"))
+    parser.add_argument("--keyframes", action="store_true", help="Only run YOLO/CSRNet when the scene changes")
+    parser.add_argument("--max-keyframe-interval", type=int, default=MAX_INTERVAL)
+    metrics.add_arguments(parser)
+    detection_store.add_arguments(parser)
+    yolo_cache.add_arguments(parser)
+    parser.add_argument("--heatmap-dir", help="Keep rolling cumulative density heatmaps in this directory")
+    parser.add_argument("--zones", help="Zone config JSON; the --camera-id entry is used")
+    latency_controller.add_arguments(parser)
+    args = parser.parse_args()
+    log = detection_store.open_log(args)
+    heatmaps = HeatmapStore(args.heatmap_dir) if args.heatmap_dir else None
+
+    controller = latency_controller.from_args(args)
+    detectors = None
+    tracker = analyzer = None
+    if not args.no_tracks and controller is not None:
+        # Own ByteTrack (shared-model mode), so IDs survive detector swaps
+        # Every variant the controller may step to is loaded and warmed before the first frame
+        detectors = latency_controller.DetectorPool(fmt=args.yolo_format, precision=args.yolo_precision)
+        detectors.preload(controller.detector_names())
+        model, imgsz = detectors.get(controller.config["detector"])
+        tracker = CrowdTracker(model=model, imgsz=imgsz, camera=args.camera_id)
+    elif not args.no_tracks:
+        tracker = CrowdTracker(model_path=args.yolo_weights, camera=args.camera_id, yolo_format=args.yolo_format,
+                               precision=args.yolo_precision, imgsz=args.yolo_imgsz)
+    if not args.no_density:
+        analyzer = CrowdAnalyzer(args.weights or DENSITY_MODEL_PATH)
+    extractor = None if args.no_features else FeatureExtractor()
+    scheduler = KeyframeScheduler(max_interval=args.max_keyframe_interval) if args.keyframes else None
+    zones = zone_config.load_aggregator(args.zones, args.camera_id, args.size) if args.zones else None
+    unified = UnifiedAnalyzer(tracker, analyzer, extractor, process_size=args.size, scheduler=scheduler, zones=zones,
+                              camera=args.camera_id)
+    if controller is not None:
+        latency_controller.apply_level(unified, controller.config, detectors)
+
+    cap = cv2.VideoCapture(args.video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    if tracker is not None:
+        tracker.set_frame_rate(fps)
+    out = cv2.VideoWriter(args.output, cv2.VideoWriter_fourcc(*'mp4v'), fps, unified.output_size) if args.output else None
+    results = open(args.results, "w") if args.results else None
+    start_time = time.time()
+    frame_index = 0
+
+    def analyze(frame):
+        start = time.perf_counter()
+        result = unified.analyze(frame)
+        if controller is not None:
+            result["level"] = controller.config["name"]
+            change = controller.observe(time.perf_counter() - start, unified.timings)
+            if change is not None:
+                latency_controller.apply_level(unified, controller.config, detectors)
+                result["adjustment"] = change
+                metrics.count("level_changes", 1, args.camera_id)
+                print(f"Level {change['from']} -> {change['to']} ({change['reason']}, "
+                      f"{change['latency_ms']:.0f} ms vs {change['target_ms']:.0f} ms target)")
+        return result
+
+    def render(frame, result):
+        nonlocal frame_index
+        if (frame.shape[1], frame.shape[0]) != unified.output_size:
+            frame = cv2.resize(frame, unified.output_size)  # Processed at a stepped-down resolution
+        ts = start_time + frame_index / fps
+        if log is not None:
+            log_result(log, ts, result)
+        if heatmaps is not None and "density_map" in result:
+            heatmaps.update(args.camera_id, result["density_map"], ts)
+        frame_index += 1
+        if out is not None:
+            with metrics.stage("hud"):
+                vis = render_unified(frame, result)
+            with metrics.stage("write"):
+                out.write(vis)
+        if results is not None:
+            results.write(json.dumps(to_json(result)) + "\n")
+
+    pipeline = VideoPipeline(analyze, render, preprocess=unified.preprocess)
+    stop_metrics = metrics.start_from_args(args)
+    try:
+        frames = pipeline.run(cap)
+    finally:
+        stop_metrics()
+        cap.release()
+        if out is not None:
+            out.release()
+        if results is not None:
+            results.close()
+        if log is not None:
+            log.close()
+        if heatmaps is not None:
+            heatmaps.flush()
+    print(f"Analyzed {frames} frames")
+    if scheduler is not None:
+        print(scheduler.summary())
+    if controller is not None:
+        print(f"Latency controller: {len(controller.history)} adjustments, final level {controller.config['name']}")
+
+if __name__ == "__main__":
+    main()
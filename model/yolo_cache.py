@@ -0,0 +1,309 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+import numpy as np
+import cv2
+
+# Exported YOLO artifacts, cached on disk and loaded warm.
+#
+# Exports are opt-in (--yolo-format onnx / openvino): by default the .pt is
+# loaded as before. They need the exporter / runtime packages installed
+# first, e.g. `pip install onnx onnxslim onnxruntime` or `pip install openvino`;
+# otherwise ultralytics tries to install them at runtime.
+#
+# The .pt checkpoint is exported once per (weights hash, input size, format,
+# precision) into CACHE_DIR/<key>/ and reused by every process after that:
+# ONNX (onnxruntime) or OpenVINO, with fp16 / int8 variants where the format
+# supports them. The key hashes the weights' contents, so retrained weights
+# under the same file name get a fresh export. Exports go to a temp
+# directory and are renamed into place, so workers racing on the same key
+# never see a half-written artifact.
+#
+# load_detector() returns a warmed-up model: WARMUP_RUNS predictions on a
+# blank frame pay for session creation and the first-inference allocations
+# before any real frame arrives. WarmDetector does the same in a background
+# thread for live sources, which keep reading (and dropping) frames until
+# `ready` is set.
+#
+# After every export, parity against the .pt model is checked on a fixed
+# frame set and stored in the cache entry's meta.json. The frames are the
+# ultralytics sample images, or frames sampled from --frames VIDEO.
+# load_detector only uses an export whose parity passed (an entry left
+# unchecked by a dead worker is checked first); otherwise it warns and
+# loads the .pt.
+#
+#   python yolo_cache.py export --format openvino --precision int8
+#   python yolo_cache.py list
+
+# --- CONFIGURATION ---
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(MODEL_DIR, "yolo_cache")
+WEIGHTS = os.path.join(MODEL_DIR, "yolov10m.pt")
+FORMAT = "pt"            # "pt" (no export, the eager checkpoint) | "onnx" | "openvino"
+EXPORT_FORMAT = "onnx"   # Default of the export / check commands
+PRECISION = "fp32"       # "fp32" | "fp16" | "int8"
+IMGSZ = 640
+INT8_DATA = "coco8.yaml" # Calibration set for int8 exports
+WARMUP_RUNS = 2
+PARITY_FRAMES = 8        # Frames sampled from a --frames video
+PARITY_IOU = 0.5
+PARITY_CONF = 0.25
+PARITY_MIN_RECALL = 0.9  # Share of .pt detections the export must reproduce
+HASH_CHUNK = 1 << 20
+
+def resolve_weights(path):
+    """Local path of the weights, downloading official ultralytics checkpoints that are missing"""
+    if os.path.exists(path):
+        return path
+    from ultralytics.utils.downloads import attempt_download_asset
+    return str(attempt_download_asset(path))
+
+def weights_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cache_key(weights, imgsz=IMGSZ, fmt=FORMAT, precision=PRECISION):
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    return f"{stem}-{weights_hash(weights)[:16]}-{fmt}-{imgsz}-{precision}"
+
+def read_meta(entry_dir):
+    path = os.path.join(entry_dir, "meta.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def _write_meta(entry_dir, meta):
+    tmp = os.path.join(entry_dir, "meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, os.path.join(entry_dir, "meta.json"))
+
+def export(weights=WEIGHTS, imgsz=IMGSZ, fmt=FORMAT, precision=PRECISION, cache_dir=CACHE_DIR, check=True,
+           frames=None):
+    """Path of the cached artifact for these settings, exporting it first if needed"""
+    weights = resolve_weights(weights)
+    key = cache_key(weights, imgsz, fmt, precision)
+    entry_dir = os.path.join(cache_dir, key)
+    if read_meta(entry_dir) is None:
+        _export_entry(weights, imgsz, fmt, precision, cache_dir, key, entry_dir)
+
+    meta = read_meta(entry_dir)
+    path = os.path.join(entry_dir, meta["artifact"])
+    if check and "parity" not in meta:
+        # Fresh export, or one whose worker died before its check was written
+        meta["parity"] = check_parity(weights, path, imgsz, frames)
+        _write_meta(entry_dir, meta)
+    return path
+
+def _export_entry(weights, imgsz, fmt, precision, cache_dir, key, entry_dir):
+    from ultralytics import YOLO
+    # ultralytics writes next to the weights, so export from a private copy
+    tmp = os.path.join(cache_dir, f".{key}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        local = os.path.join(tmp, "model.pt")
+        shutil.copyfile(weights, local)
+        print(f"Exporting {os.path.basename(weights)} to {fmt} ({precision}, {imgsz}px)...")
+        start = time.time()
+        options = {"format": fmt, "imgsz": imgsz, "half": precision == "fp16", "int8": precision == "int8"}
+        if precision == "int8":
+            options["data"] = INT8_DATA
+        artifact = YOLO(local).export(**options)
+        os.remove(local)
+        meta = {
+            "key": key, "weights": os.path.abspath(weights), "format": fmt, "imgsz": imgsz,
+            "precision": precision, "artifact": os.path.basename(str(artifact).rstrip(os.sep)),
+            "export_s": round(time.time() - start, 1), "created": time.time(),
+        }
+        _write_meta(tmp, meta)
+        try:
+            os.replace(tmp, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)  # Another worker finished the same export first
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+def warm_up(model, imgsz=IMGSZ, runs=WARMUP_RUNS):
+    blank = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(runs):
+        model.predict(blank, imgsz=imgsz, verbose=False)
+    return model
+
+def load_detector(weights=WEIGHTS, imgsz=IMGSZ, fmt=FORMAT, precision=PRECISION, warmup=WARMUP_RUNS):
+    """Warmed-up YOLO for the cached export (made on first use).
+
+    Falls back to the .pt if the export fails or did not pass its parity check.
+    """
+    from ultralytics import YOLO
+    path = weights = resolve_weights(weights)
+    if fmt != "pt":
+        try:
+            path = export(weights, imgsz, fmt, precision)
+            parity = read_meta(os.path.dirname(path)).get("parity", {})
+            if not parity.get("ok"):
+                print(f"YOLO {fmt} export {os.path.basename(os.path.dirname(path))} failed its parity check "
+                      f"(recall {parity.get('recall', '-')}); using {os.path.basename(weights)}", file=sys.stderr)
+                path = weights
+        except Exception as e:
+            print(f"YOLO export to {fmt} failed ({e}); using {os.path.basename(weights)}", file=sys.stderr)
+            path = weights
+    start = time.time()
+    model = YOLO(path, task="detect")
+    if warmup:
+        warm_up(model, imgsz, warmup)
+    print(f"Loaded {os.path.basename(str(path))} in {time.time() - start:.1f} s")
+    return model
+
+class WarmDetector:
+    """Loads and warms the detector in a background thread; use model only once ready is set"""
+    def __init__(self, weights=WEIGHTS, imgsz=IMGSZ, fmt=FORMAT, precision=PRECISION):
+        self.model = None
+        self.error = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self._load, args=(weights, imgsz, fmt, precision),
+                                       name="yolo-warmup", daemon=True)
+        self.thread.start()
+
+    def _load(self, *args):
+        try:
+            self.model = load_detector(*args)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ready.set()
+
+    def wait(self, timeout=None):
+        """Block until loaded; returns the model (raises if loading failed)"""
+        self.ready.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.model
+
+    def is_ready(self):
+        if self.ready.is_set() and self.error is not None:
+            raise self.error
+        return self.ready.is_set()
+
+# --- PARITY ---
+def parity_frames(video=None, n=PARITY_FRAMES):
+    """Fixed frame set: n evenly spaced frames of video, or the ultralytics sample images"""
+    if video is None:
+        from ultralytics.utils import ASSETS
+        return [cv2.imread(str(p)) for p in sorted(ASSETS.glob("*.jpg"))]
+    cap = cv2.VideoCapture(video)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or n
+    frames = []
+    for index in np.linspace(0, total - 1, n).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+        ok, frame = cap.read()
+        if ok:
+            frames.append(frame)
+    cap.release()
+    return frames
+
+def box_iou(a, b):
+    """(N, M) IoU of xyxy boxes"""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+def match_detections(ref, cand, iou=PARITY_IOU):
+    """Greedy same-class matching of (N, 6) [x1, y1, x2, y2, conf, cls]; returns (matches, ious, conf diffs)"""
+    if len(ref) == 0 or len(cand) == 0:
+        return 0, [], []
+    ious = box_iou(ref[:, :4], cand[:, :4])
+    ious[ref[:, 5][:, None] != cand[:, 5][None, :]] = 0
+    used, matched, conf_diffs = set(), [], []
+    for i in np.argsort(-ref[:, 4]):
+        order = [j for j in np.argsort(-ious[i]) if j not in used and ious[i, j] >= iou]
+        if order:
+            used.add(order[0])
+            matched.append(float(ious[i, order[0]]))
+            conf_diffs.append(abs(float(ref[i, 4] - cand[order[0], 4])))
+    return len(matched), matched, conf_diffs
+
+def check_parity(weights, artifact, imgsz=IMGSZ, video=None, conf=PARITY_CONF):
+    """Detections of the export vs the .pt model on the fixed frame set"""
+    from ultralytics import YOLO
+    reference, exported = YOLO(weights), YOLO(artifact, task="detect")
+    n_ref = n_cand = n_match = 0
+    ious, conf_diffs = [], []
+    for frame in parity_frames(video):
+        ref = reference.predict(frame, imgsz=imgsz, conf=conf, verbose=False)[0].boxes.data.cpu().numpy()
+        cand = exported.predict(frame, imgsz=imgsz, conf=conf, verbose=False)[0].boxes.data.cpu().numpy()
+        matches, frame_ious, frame_diffs = match_detections(ref, cand)
+        n_ref, n_cand, n_match = n_ref + len(ref), n_cand + len(cand), n_match + matches
+        ious += frame_ious
+        conf_diffs += frame_diffs
+    report = {
+        "reference_boxes": n_ref,
+        "export_boxes": n_cand,
+        "recall": n_match / n_ref if n_ref else 1.0,
+        "precision": n_match / n_cand if n_cand else 1.0,
+        "mean_iou": float(np.mean(ious)) if ious else 0.0,
+        "max_conf_diff": float(np.max(conf_diffs)) if conf_diffs else 0.0,
+    }
+    report["ok"] = report["recall"] >= PARITY_MIN_RECALL and report["precision"] >= PARITY_MIN_RECALL
+    print(f"Parity vs .pt: recall {report['recall']:.3f}, precision {report['precision']:.3f}, "
+          f"mean IoU {report['mean_iou']:.3f}, max conf diff {report['max_conf_diff']:.3f}"
+          + ("" if report["ok"] else "  <-- below PARITY_MIN_RECALL"))
+    return report
+
+# --- CLI WIRING ---
+def add_arguments(parser, weights=WEIGHTS):
+    """--yolo-weights / --yolo-format / --yolo-precision / --yolo-imgsz flags shared by the pipeline scripts"""
+    group = parser.add_argument_group("detector")
+    group.add_argument("--yolo-weights", default=weights, help="YOLO .pt checkpoint (exports are made from it)")
+    group.add_argument("--yolo-format", default=FORMAT, choices=("pt", "onnx", "openvino"),
+                       help="Use a cached export instead of the .pt (needs onnx/onnxruntime or openvino installed)")
+    group.add_argument("--yolo-precision", default=PRECISION, choices=("fp32", "fp16", "int8"))
+    group.add_argument("--yolo-imgsz", type=int, default=IMGSZ)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export YOLO weights into the artifact cache and check parity")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("export", "check"):
+        p = sub.add_parser(name)
+        p.add_argument("--weights", default=WEIGHTS)
+        p.add_argument("--imgsz", type=int, default=IMGSZ)
+        p.add_argument("--format", default=EXPORT_FORMAT, choices=("onnx", "openvino"))
+        p.add_argument("--precision", default=PRECISION, choices=("fp32", "fp16", "int8"))
+        p.add_argument("--frames", help="Video to sample the parity frames from (default: ultralytics samples)")
+    sub.add_parser("list")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        entries = sorted(os.listdir(CACHE_DIR)) if os.path.isdir(CACHE_DIR) else []
+        for name in entries:
+            meta = read_meta(os.path.join(CACHE_DIR, name))
+            if meta is not None:
+                parity = meta.get("parity", {})
+                print(f"{name}  recall={parity.get('recall', '-')}  ok={parity.get('ok', '-')}")
+        return
+
+    path = export(args.weights, args.imgsz, args.format, args.precision, check=False)
+    report = check_parity(args.weights, path, args.imgsz, args.frames)
+    entry_dir = os.path.dirname(path)
+    meta = read_meta(entry_dir)
+    meta["parity"] = report
+    _write_meta(entry_dir, meta)
+    print(path)
+    if not report["ok"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import json
+import numpy as np
+import cv2
+
+# Per-zone crowd metrics (gates, corridors, stage front) for one camera.
+#
+# Every per-pixel map (density, flow magnitude, motion x density) is turned
+# into one summed-area table per frame (cv2.integral). Zone sums are then
+# table lookups: four corners per rectangle, and two per row span for
+# polygons. The spans are precomputed once per grid shape from the
+# rasterized zone mask. The cost is one O(map) pass plus O(zones), so
+# hundreds of zones cost little more than one.
+#
+# Zone config (JSON), points in the pixel space of `frame_size`; they are
+# rescaled to whatever grid a map lives on:
+#
+#   {"cam0": {"frame_size": [1024, 576],
+#             "zones": [{"name": "gate_a", "rect": [0, 200, 180, 576]},
+#                       {"name": "stage", "polygon": [[300, 0], [720, 0], [820, 160], [200, 160]]}]}}
+
+# --- CONFIGURATION ---
+MOTION_NOISE = 2.0  # Flow magnitude below this is ignored, as in motion_energy_from_flow
+
+def load_zones(path):
+    """{camera: (frame_size, [zone dicts])} from a zone config file"""
+    with open(path) as f:
+        config = json.load(f)
+    return {camera: (tuple(c["frame_size"]), c["zones"]) for camera, c in config.items()}
+
+def scale_zones(zones, from_size, to_size):
+    """Zone dicts with their points moved from one (W, H) pixel space to another"""
+    sx, sy = to_size[0] / from_size[0], to_size[1] / from_size[1]
+    scaled = []
+    for zone in zones:
+        zone = dict(zone)
+        if "rect" in zone:
+            x1, y1, x2, y2 = zone["rect"]
+            zone["rect"] = [x1 * sx, y1 * sy, x2 * sx, y2 * sy]
+        else:
+            zone["polygon"] = [[x * sx, y * sy] for x, y in zone["polygon"]]
+        scaled.append(zone)
+    return scaled
+
+def load_aggregator(path, camera, frame_size):
+    """ZoneAggregator for camera's zones in the (W, H) space its frames and boxes use"""
+    config_size, zones = load_zones(path)[camera]
+    return ZoneAggregator(scale_zones(zones, config_size, frame_size), frame_size)
+
+class _GridPlan:
+    """Zone geometry rasterized onto one (h, w) grid"""
+    def __init__(self, zones, frame_size, shape):
+        h, w = shape
+        sx, sy = w / frame_size[0], h / frame_size[1]
+        rect_idx, rects, span_zone, span_row, span_x0, span_x1 = [], [], [], [], [], []
+        self.cells = np.zeros(len(zones), dtype=np.float64)
+
+        for i, zone in enumerate(zones):
+            if "rect" in zone:
+                x1, y1, x2, y2 = zone["rect"]
+                c = np.clip(np.round([x1 * sx, y1 * sy, x2 * sx, y2 * sy]).astype(int), 0, [w, h, w, h])
+                rect_idx.append(i)
+                rects.append(c)
+                self.cells[i] = max(c[2] - c[0], 0) * max(c[3] - c[1], 0)
+            else:
+                mask = np.zeros((h, w), dtype=np.uint8)
+                points = np.round(np.asarray(zone["polygon"], dtype=np.float64) * (sx, sy)).astype(np.int32)
+                cv2.fillPoly(mask, [points], 1)
+                # Row runs of the mask: [x0, x1) spans, possibly several per row for concave shapes
+                edges = np.diff(np.pad(mask, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+                rows0, x0 = np.nonzero(edges == 1)
+                _, x1 = np.nonzero(edges == -1)
+                span_zone.append(np.full(len(x0), i))
+                span_row.append(rows0)
+                span_x0.append(x0)
+                span_x1.append(x1)
+                self.cells[i] = mask.sum()
+
+        self.rect_idx = np.asarray(rect_idx, dtype=np.int64)
+        self.rects = np.asarray(rects, dtype=np.int64).reshape(-1, 4)
+        cat = lambda parts: np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        self.span_zone, self.span_row = cat(span_zone), cat(span_row)
+        self.span_x0, self.span_x1 = cat(span_x0), cat(span_x1)
+        self.n = len(zones)
+
+    def sums(self, grid):
+        """(zones,) sums of a 2D map over every zone"""
+        sat = cv2.integral(np.ascontiguousarray(grid), sdepth=cv2.CV_64F)
+        out = np.zeros(self.n, dtype=np.float64)
+        if len(self.rect_idx):
+            x1, y1, x2, y2 = self.rects.T
+            out[self.rect_idx] = sat[y2, x2] - sat[y1, x2] - sat[y2, x1] + sat[y1, x1]
+        if len(self.span_zone):
+            r, x0, x1 = self.span_row, self.span_x0, self.span_x1
+            spans = (sat[r + 1, x1] - sat[r, x1]) - (sat[r + 1, x0] - sat[r, x0])
+            out += np.bincount(self.span_zone, weights=spans, minlength=self.n)
+        return out
+
+class ZoneAggregator:
+    """update() -> per-zone count, density, motion energy, panic score, tracks and entries/exits.
+
+    Zone points and track boxes are in frame_size pixels; maps of any grid
+    size are matched to the zones by scaling.
+    """
+    def __init__(self, zones, frame_size):
+        self.zones = zones
+        self.names = [z["name"] for z in zones]
+        self.frame_size = tuple(frame_size)
+        self.plans = {}
+        self.inside = [set() for _ in zones]
+        self.entries = np.zeros(len(zones), dtype=np.int64)
+        self.exits = np.zeros(len(zones), dtype=np.int64)
+
+    def plan(self, shape):
+        plan = self.plans.get(shape)
+        if plan is None:
+            plan = self.plans[shape] = _GridPlan(self.zones, self.frame_size, shape)
+        return plan
+
+    def sums(self, grid):
+        return self.plan(grid.shape[:2]).sums(grid)
+
+    def contains(self, points):
+        """(zones, N) bool: which zone each (x, y) frame point lies in"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        x, y = points[:, 0], points[:, 1]
+        inside = np.zeros((len(self.zones), len(points)), dtype=bool)
+        for i, zone in enumerate(self.zones):
+            if "rect" in zone:
+                x1, y1, x2, y2 = zone["rect"]
+                inside[i] = (x >= x1) & (x < x2) & (y >= y1) & (y < y2)
+            else:
+                # Even-odd ray casting over all points at once
+                poly = np.asarray(zone["polygon"], dtype=np.float64)
+                px, py = poly[:, 0], poly[:, 1]
+                qx, qy = np.roll(px, -1), np.roll(py, -1)
+                crosses = (py[:, None] > y) != (qy[:, None] > y)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    xcross = px[:, None] + (y - py[:, None]) * (qx - px)[:, None] / (qy - py)[:, None]
+                inside[i] = np.logical_xor.reduce(crosses & (x < xcross), axis=0)
+        return inside
+
+    def update_tracks(self, ids, boxes):
+        """Per-zone live track count plus entries/exits from box centroids.
+
+        A track that vanishes (lost by the tracker) leaves the zone's live set
+        without counting as an exit; only seen-outside transitions do.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        centroids = np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+        inside = self.contains(centroids)
+        present = set(ids)
+        counts = inside.sum(axis=1)
+        for i in range(len(self.zones)):
+            now = {track_id for track_id, hit in zip(ids, inside[i]) if hit}
+            before = self.inside[i]
+            self.entries[i] += len(now - before)
+            self.exits[i] += len((before - now) & present)
+            self.inside[i] = now
+        return counts
+
+    def update(self, density_map=None, mag=None, weighted=None, ids=None, boxes=None):
+        """One frame: density_map (CSRNet grid), mag (flow magnitude grid), weighted
+        (flow magnitude x density on the density grid); any may be None"""
+        zones = [{"name": name} for name in self.names]
+
+        if density_map is not None:
+            counts = self.sums(density_map)
+            cells = self.plan(density_map.shape).cells
+            for z, c, n in zip(zones, counts, cells):
+                z["density_count"] = float(c)
+                z["density"] = float(c / n) if n else 0.0  # People per density-map cell
+            if weighted is not None:
+                panic = self.sums(weighted)
+                for z, p, c in zip(zones, panic, counts):
+                    z["risk"] = float(p / max(c, 1.0) * 10)
+
+        if mag is not None:
+            moving = (mag > MOTION_NOISE).astype(np.float32)
+            energy = self.sums(mag * moving)
+            pixels = self.sums(moving)
+            for z, e, n in zip(zones, energy, pixels):
+                z["motion_energy"] = float(e / n) if n else 0.0
+
+        if ids is not None:
+            counts = self.update_tracks(ids, boxes)
+            for z, c, entered, exited in zip(zones, counts, self.entries, self.exits):
+                z["count"] = int(c)
+                z["entries"] = int(entered)
+                z["exits"] = int(exited)
+        return zones